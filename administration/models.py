@@ -34,20 +34,9 @@ class Meeting(models.Model):
         return f"{self.subject} on {self.meeting_date.strftime('%d %b, %Y %I:%M %p')}"
     
     def get_meeting_employees(self):
-        # Retrieve the selected criteria
-        selected_jobs = self.job.all()
-        selected_departments = self.department.all()
-        selected_grades = self.salary_grade.all()
-
-        # Filter employees based on the criteria selected
-        employees = Employee.objects.all()
-        filtered_employees = [
-            employee for employee in employees
-            if (not selected_jobs or employee.job in selected_jobs) and 
-               (not selected_departments or (employee.job and employee.job.department in selected_departments )) and 
-               (not selected_grades or employee.salary_grade in selected_grades)
-        ]
-        return filtered_employees
+        """Employees in the selected jobs, departments and grades, all employees when none is selected"""
+        from hr.services.eligibility import eligible_employees
+        return eligible_employees(self)
     
     def display_meeting_job(self):
         return ",".join(job.job_title for job in self.job.all())
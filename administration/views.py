@@ -30,7 +30,7 @@ class MeetingAPIView(LoginRequiredMixin, BaseDatatableView):
         if column == 'venue':
             return row.location
         if column == 'attendees':
-            return len(row.get_meeting_employees())
+            return row.get_meeting_employees().count()
         if column == 'status':
             status = row.status
             theme = 'danger'
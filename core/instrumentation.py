@@ -0,0 +1,130 @@
+"""
+Per-view SQL and latency statistics.
+
+`QueryInstrumentationMiddleware` (core.middleware) records one sample per request into the
+rolling in-process `query_stats` store, keyed by URL name. Each worker process also dumps its
+store to a `query-stats-<pid>.json` file in QUERY_INSTRUMENTATION_DIR so the `query_report`
+command can merge the stats of every process.
+"""
+from collections import Counter, defaultdict, deque
+import json
+import os
+import re
+import threading
+import time
+
+from django.conf import settings
+
+# Samples kept per view, older samples are dropped
+SAMPLES_PER_VIEW = 500
+
+# Repeated query shapes reported per view
+TOP_SHAPES = 5
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN \((?:\s*(?:%s|\?)\s*,?)+\)", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+
+
+def query_shape(sql):
+    """Reduce SQL to its shape so queries differing only by parameters count as one"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of `values`"""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(1, -(-len(values) * percent // 100))
+    return values[int(rank) - 1]
+
+
+def summarize(samples, shapes, budget):
+    """Aggregate the samples of one view into counts, p50/p95 figures and the top repeated query shapes"""
+    queries = [sample['queries'] for sample in samples]
+    return {
+        'requests': len(samples),
+        'queries_p50': percentile(queries, 50),
+        'queries_p95': percentile(queries, 95),
+        'queries_max': max(queries) if queries else None,
+        'sql_ms_p50': percentile([sample['sql_ms'] for sample in samples], 50),
+        'sql_ms_p95': percentile([sample['sql_ms'] for sample in samples], 95),
+        'latency_ms_p50': percentile([sample['latency_ms'] for sample in samples], 50),
+        'latency_ms_p95': percentile([sample['latency_ms'] for sample in samples], 95),
+        'over_budget': sum(1 for count in queries if count > budget),
+        'top_shapes': [{'sql': sql, 'count': count} for sql, count in Counter(shapes).most_common(TOP_SHAPES) if count > 1],
+    }
+
+
+class QueryStats:
+    """Thread safe rolling store of request samples, keyed by view"""
+
+    def __init__(self, samples_per_view=SAMPLES_PER_VIEW):
+        self.samples_per_view = samples_per_view
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.samples = defaultdict(lambda: deque(maxlen=self.samples_per_view))
+        self.shapes = defaultdict(Counter)
+        self.recorded = 0
+        self.last_dump = time.monotonic()
+
+    def record(self, view, queries, sql_ms, latency_ms, shapes):
+        with self.lock:
+            self.samples[view].append({'queries': queries, 'sql_ms': round(sql_ms, 2), 'latency_ms': round(latency_ms, 2)})
+            # only shapes repeated within the request point at N+1 patterns
+            for shape, count in Counter(shapes).items():
+                if count > 1:
+                    self.shapes[view][shape] += count
+            self.recorded += 1
+
+    def raw(self):
+        """Plain copy of the store, as dumped to disk"""
+        with self.lock:
+            return {
+                view: {'samples': list(samples), 'shapes': dict(self.shapes[view])}
+                for view, samples in self.samples.items()
+            }
+
+    def snapshot(self, budget=None):
+        budget = budget if budget is not None else settings.QUERY_BUDGET
+        return {
+            view: summarize(data['samples'], Counter(data['shapes']), budget)
+            for view, data in self.raw().items()
+        }
+
+    def dump_if_due(self, directory, every=60):
+        """Write this process' store to `directory` at most once every `every` seconds"""
+        if not directory or time.monotonic() - self.last_dump < every:
+            return
+        self.last_dump = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"query-stats-{os.getpid()}.json")
+        with open(f"{path}.tmp", 'w') as output:
+            json.dump(self.raw(), output)
+        os.replace(f"{path}.tmp", path)
+
+
+def load_dumps(directory):
+    """Merge the per-process dumps in `directory` into {view: {'samples': [...], 'shapes': Counter}}"""
+    merged = defaultdict(lambda: {'samples': [], 'shapes': Counter()})
+    if not directory or not os.path.isdir(directory):
+        return merged
+
+    for filename in sorted(os.listdir(directory)):
+        if not (filename.startswith('query-stats-') and filename.endswith('.json')):
+            continue
+        with open(os.path.join(directory, filename)) as dump:
+            for view, data in json.load(dump).items():
+                merged[view]['samples'].extend(data['samples'])
+                merged[view]['shapes'].update(data['shapes'])
+    return merged
+
+
+query_stats = QueryStats()
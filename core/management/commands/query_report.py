@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.instrumentation import load_dumps, summarize
+
+class Command(BaseCommand):
+    help = "Print p50/p95 SQL count, SQL time and latency per view from the query instrumentation dumps, flagging views over the query budget"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--budget', type=int, default=settings.QUERY_BUDGET, help="Queries allowed per request")
+        parser.add_argument('--dir', default=settings.QUERY_INSTRUMENTATION_DIR, help="Directory holding the query-stats-<pid>.json dumps")
+        parser.add_argument('--shapes', action='store_true', help="Also print the top repeated query shapes of views over budget")
+
+    def handle(self, *args, **options):
+        budget = options['budget']
+        stats = {view: summarize(data['samples'], data['shapes'], budget) for view, data in load_dumps(options['dir']).items()}
+        if not stats:
+            self.stdout.write(self.style.WARNING(f"No query stats found in {options['dir']}. Is QUERY_INSTRUMENTATION enabled?"))
+            return
+
+        self.stdout.write(f"{'view':<40} {'reqs':>6} {'q p50':>6} {'q p95':>6} {'sql p95':>9} {'lat p50':>9} {'lat p95':>9}")
+        flagged = 0
+        for view, summary in sorted(stats.items(), key=lambda item: item[1]['queries_p95'] or 0, reverse=True):
+            line = (
+                f"{view[:40]:<40} {summary['requests']:>6} {summary['queries_p50']:>6} {summary['queries_p95']:>6} "
+                f"{summary['sql_ms_p95']:>7.1f}ms {summary['latency_ms_p50']:>7.1f}ms {summary['latency_ms_p95']:>7.1f}ms"
+            )
+            if summary['queries_p95'] > budget:
+                flagged += 1
+                self.stdout.write(self.style.ERROR(f"{line}  OVER BUDGET"))
+                if options['shapes']:
+                    for shape in summary['top_shapes']:
+                        self.stdout.write(f"    {shape['count']:>6}x {shape['sql'][:160]}")
+            else:
+                self.stdout.write(line)
+
+        if flagged:
+            self.stdout.write(self.style.ERROR(f"{flagged} view(s) exceed the budget of {budget} queries per request"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"All views are within the budget of {budget} queries per request"))
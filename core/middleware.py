@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from core.instrumentation import query_shape, query_stats
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class QueryRecorder:
+    """execute_wrapper counting and timing the queries of a single request"""
+
+    def __init__(self):
+        self.count = 0
+        self.sql_time = 0.0
+        self.shapes = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.count += 1
+            self.shapes.append(query_shape(sql))
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Opt-in (QUERY_INSTRUMENTATION setting) recording of SQL count, SQL time, latency and
+    repeated query shapes per request, keyed by URL name. See core.instrumentation.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_INSTRUMENTATION', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+
+        if response.streaming and not response.is_async:
+            # queries of a streamed body (payslip ZIPs, CSV exports) run while it is consumed, record once it closes
+            response.streaming_content = self.stream(response.streaming_content, recorder, lambda: self.record(request, recorder, started))
+        else:
+            self.record(request, recorder, started)
+        return response
+
+    @staticmethod
+    def stream(content, recorder, on_close):
+        try:
+            iterator = iter(content)
+            while True:
+                with connection.execute_wrapper(recorder):
+                    try:
+                        chunk = next(iterator)
+                    except StopIteration:
+                        break
+                yield chunk
+        finally:
+            on_close()
+
+    def record(self, request, recorder, started):
+        latency = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match and match.view_name else 'unresolved'
+
+        query_stats.record(view, recorder.count, recorder.sql_time * 1000, latency * 1000, recorder.shapes)
+        if recorder.count > settings.QUERY_BUDGET:
+            logger.warning(f"{view} ran {recorder.count} queries (budget {settings.QUERY_BUDGET}) for {request.path}")
+
+        try:
+            query_stats.dump_if_due(settings.QUERY_INSTRUMENTATION_DIR, settings.QUERY_INSTRUMENTATION_DUMP_INTERVAL)
+        except OSError as e:
+            logger.error(e)
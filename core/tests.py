@@ -1,3 +1,54 @@
-from django.test import TestCase
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from core.instrumentation import QueryStats, percentile, query_shape, summarize
+from core.middleware import QueryInstrumentationMiddleware
+
+
+class QueryInstrumentationTestCase(SimpleTestCase):
+
+    def test_query_shape_ignores_parameters(self):
+        self.assertEqual(
+            query_shape("SELECT * FROM hr_employee WHERE id IN (%s, %s, %s) AND name = 'ama'"),
+            query_shape("SELECT * FROM  hr_employee WHERE id IN (%s) AND name = 'kofi'"),
+        )
+
+    def test_percentile(self):
+        self.assertEqual(percentile(list(range(1, 101)), 50), 50)
+        self.assertEqual(percentile(list(range(1, 101)), 95), 95)
+        self.assertIsNone(percentile([], 50))
+
+    def test_repeated_shapes_are_reported(self):
+        stats = QueryStats()
+        stats.record('employee-list-api', 12, 4.0, 20.0, ['SELECT designation'] * 10 + ['SELECT employee', 'SELECT count'])
+        stats.record('employee-list-api', 3, 1.0, 8.0, ['SELECT employee', 'SELECT count', 'SELECT grade'])
+
+        summary = stats.snapshot(budget=10)['employee-list-api']
+        self.assertEqual(summary['requests'], 2)
+        self.assertEqual(summary['over_budget'], 1)
+        self.assertEqual(summary['top_shapes'], [{'sql': 'SELECT designation', 'count': 10}])
+        self.assertEqual(summarize([], {}, 10)['queries_p95'], None)
+
+
+class QueryInstrumentationMiddlewareTestCase(TestCase):
+
+    def test_streamed_queries_are_recorded_when_the_stream_closes(self):
+        def stream():
+            yield str(get_user_model().objects.count())
+            yield str(get_user_model().objects.count())
+
+        stats = QueryStats()
+        with override_settings(QUERY_INSTRUMENTATION=True, QUERY_INSTRUMENTATION_DIR=tempfile.mkdtemp()), mock.patch('core.middleware.query_stats', stats):
+            middleware = QueryInstrumentationMiddleware(lambda request: StreamingHttpResponse(stream()))
+            response = middleware(RequestFactory().get('/export/'))
+            self.assertEqual(stats.snapshot(budget=10), {})
+
+            self.assertEqual(b''.join(response.streaming_content), b'00')
+            response.close()
+
+        self.assertEqual(stats.snapshot(budget=10)['unresolved']['requests'], 1)
+        self.assertEqual(stats.snapshot(budget=10)['unresolved']['queries_p95'], 2)
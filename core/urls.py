@@ -14,6 +14,7 @@ urlpatterns = [
 
     path('dashboard/', views.dashboard, name='dashboard'),
     path('logger/', views.test_logging_view, name='logger'),
+    path('query-stats/', views.query_stats_view, name='query-stats'),
 
 ]
 
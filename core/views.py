@@ -5,6 +5,9 @@ from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
 from core.models import CustomUser
 from django.views.decorators.cache import never_cache
 from django.contrib.auth.decorators import login_required, permission_required
+from django.contrib.admin.views.decorators import staff_member_required
+from django.conf import settings
+from core.instrumentation import query_stats
 
 import logging
 
@@ -68,4 +71,15 @@ def test_logging_view(request):
     logger.error("This is an ERROR message.")
     logger.critical("This is a CRITICAL message.")
 
-    return HttpResponse("Logging Test")
\ No newline at end of file
+    return HttpResponse("Logging Test")
+
+@staff_member_required
+def query_stats_view(request):
+    """Per-view SQL and latency statistics of the process serving this request"""
+    budget = request.GET.get('budget', '')
+    budget = int(budget) if budget.isdigit() else settings.QUERY_BUDGET
+    return JsonResponse({
+        'enabled': settings.QUERY_INSTRUMENTATION,
+        'budget': budget,
+        'views': query_stats.snapshot(budget),
+    })
@@ -105,6 +105,11 @@ class LoanAdmin(admin.ModelAdmin):
 class LoanRepaymentAdmin(admin.ModelAdmin):
     list_display = ('loan', 'amount_paid', 'date_paid', 'payment_reference', )
 
+@admin.register(LoanSchedule)
+class LoanScheduleAdmin(admin.ModelAdmin):
+    list_display = ('loan', 'period', 'due_date', 'installment', 'principal', 'interest', 'expected_balance', )
+    list_filter = ('due_date', )
+
 @admin.register(CreditUnion)
 class CreditUnionAdmin(admin.ModelAdmin):
     list_display = ('union_name', 'amount',  'deduction_start_date', 'deduction_end_date', )
@@ -119,7 +124,7 @@ class PayrollAdmin(admin.ModelAdmin):
 
 @admin.register(StaffCreditUnionDeduction)
 class StaffCreditUnionDeductionAdmin(admin.ModelAdmin):
-    list_display = ('staff_credit_union', 'amount_paid', 'date_paid', )
+    list_display = ('staff_credit_union', 'payroll', 'amount_paid', 'date_paid', )
 
 @admin.register(PayrollError)
 class PayrollErrorAdmin(admin.ModelAdmin):
@@ -128,4 +133,13 @@ class PayrollErrorAdmin(admin.ModelAdmin):
 
 @admin.register(PayrollItem)
 class PayrollItemAdmin(admin.ModelAdmin):
-    list_display = ('payroll', 'employee', 'item_type', 'dependency', 'amount', 'description', 'entry', 'credit_union', 'bank', 'salary_item', 'loan', )
\ No newline at end of file
+    list_display = ('payroll', 'employee', 'item_type', 'dependency', 'amount', 'description', 'entry', 'credit_union', 'bank', 'salary_item', 'loan', )
+
+@admin.register(PayrollRun)
+class PayrollRunAdmin(admin.ModelAdmin):
+    list_display = ('id', 'payroll', 'status', 'error_mode', 'total', 'processed', 'error_count', 'requested_by', 'created_at', 'finished_at')
+    list_filter = ['status']
+
+@admin.register(PayrollEmployeeSummary)
+class PayrollEmployeeSummaryAdmin(admin.ModelAdmin):
+    list_display = ('payroll', 'employee', 'bank', 'salary_grade', 'basic_salary', 'gross_salary', 'tax', 'employee_ssnit', 'net_salary', )
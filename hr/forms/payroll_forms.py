@@ -2,6 +2,7 @@ from django.core.exceptions import ValidationError
 from django import forms
 from ..models.payroll import SalaryItem, Loan, CreditUnion, Payroll
 from ..models.employee import Employee
+from ..services.salary_items import DependencyCycleError, SalaryItemGraph, get_dependency_id
 from datetime import date
 
 class SalaryItemForm(forms.ModelForm):
@@ -54,6 +55,20 @@ class SalaryItemForm(forms.ModelForm):
         elif not any([step, salary_grade, job, department, designation, condition]):
             raise ValidationError("If `applicable_to` is not used, at least one other filter (step, salary grade, job, department, designation, condition) must be specified.")
 
+        # A factor item computed from another item must not end up depending on itself
+        rate_type = cleaned_data.get('rate_type')
+        rate_dependency = cleaned_data.get('rate_dependency')
+        if rate_type == 'factor' and rate_dependency != 'Basic':
+            dependency_id = get_dependency_id(rate_type, rate_dependency)
+            graph = SalaryItemGraph.load()
+            if dependency_id not in graph.items:
+                raise ValidationError("Select 'Basic' or an existing salary item for a factor rate.")
+            graph.set_dependency(self.instance.pk, rate_type, rate_dependency)
+            try:
+                graph.order([self.instance.pk or dependency_id])
+            except DependencyCycleError as e:
+                raise ValidationError(str(e))
+
         return cleaned_data
         
 class LoanForm(forms.ModelForm):
@@ -154,4 +169,17 @@ class PayrollForm(forms.ModelForm):
             "You cannot select the same employee in both fields."
         )
 
-    
\ No newline at end of file
+    
+class VariableImportForm(forms.Form):
+    file = forms.FileField(
+        label='Spreadsheet',
+        help_text="CSV or XLSX file with 'employee_id' and 'variable' columns",
+        widget=forms.ClearableFileInput(attrs={'class':'form-control', 'accept':'.csv,.xlsx'})
+    )
+
+class CreditUnionImportForm(forms.Form):
+    file = forms.FileField(
+        label='Spreadsheet',
+        help_text="CSV or XLSX file with an 'employee_id' column and any of 'amount', 'start_date' and 'end_date' (YYYY-MM-DD)",
+        widget=forms.ClearableFileInput(attrs={'class':'form-control', 'accept':'.csv,.xlsx'})
+    )
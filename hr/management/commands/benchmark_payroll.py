@@ -0,0 +1,116 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from hr.models.payroll import PayrollRun
+from hr.services.payroll_runs import PayrollRunProcessor
+from hr.services.workforce import generate_workforce
+from hr.views.payroll_views import PayrollPayslipListView, PayrollVoucherDetailView, generate_payslip
+import json
+import subprocess
+import time
+
+
+class Rollback(Exception):
+    """Raised to discard everything a benchmark created"""
+
+
+class Command(BaseCommand):
+    help = "Benchmark payroll processing and the payroll views against a synthetic workforce, results are written as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, nargs='+', default=[1000], help="Workforce sizes to benchmark, e.g. 1000 10000 50000")
+        parser.add_argument('--output', default='payroll_benchmark.json', help="JSON file the results are written to")
+        parser.add_argument('--workers', type=int, default=None, help="Processes computing the payroll, defaults to the PAYROLL_WORKERS setting")
+        parser.add_argument('--payslips', type=int, default=20, help="Number of individual payslips rendered")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        report = {
+            'commit': self.get_commit(),
+            'database': connection.vendor,
+            'created_at': timezone.now().isoformat(),
+            'results': [],
+        }
+
+        for count in options['employees']:
+            self.stdout.write(f"Benchmarking {count} employees...")
+            result = {'employees': count}
+            try:
+                # everything is created inside a transaction that is always rolled back
+                with transaction.atomic():
+                    self.benchmark(result, count, options)
+                    raise Rollback
+            except Rollback:
+                pass
+
+            report['results'].append(result)
+            for name, measure in result.items():
+                if isinstance(measure, dict) and 'seconds' in measure:
+                    self.stdout.write(f"  {name}: {measure['seconds']}s, {measure['queries']} queries")
+
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2)
+
+        self.stdout.write(self.style.SUCCESS(f"Benchmark results written to {options['output']}"))
+
+    def benchmark(self, result, count, options):
+        year = timezone.now().year
+        result['generate'], created = self.measure(lambda: generate_workforce(count, year=year, seed=options['seed']))
+        result['generate'].update(created)
+
+        cache.clear()
+        run = PayrollRun.objects.create(
+            parameters={'process_month': '01', 'process_year': year, 'description': f'Benchmark {count}', 'condition': 'all', 'error_mode': 'mute', 'payment_rate': 100},
+            error_mode='mute', status=PayrollRun.Status.RUNNING,
+        )
+        result['process_payroll'], run = self.measure(lambda: PayrollRunProcessor(run, workers=options['workers']).process())
+        result['process_payroll']['timings'] = run.timings
+        payroll = run.payroll
+        if payroll is None:
+            self.stdout.write(self.style.ERROR(f"  payroll failed: {run.message}"))
+            return
+
+        factory = RequestFactory()
+        user = get_user_model().objects.create_user(email='benchmark@benchmark.local')
+
+        def voucher_view():
+            request = factory.get('/')
+            request.user = user
+            view = PayrollVoucherDetailView()
+            view.setup(request, pk=payroll.id)
+            view.object = view.get_object()
+            return view.get_context_data()
+        result['voucher_view'], _ = self.measure(voucher_view)
+
+        def payslip_list_view():
+            request = factory.get('/', {'payroll_id': payroll.id}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            request.user = user
+            return PayrollPayslipListView.as_view()(request)
+        result['payslip_list_view'], _ = self.measure(payslip_list_view)
+
+        employee_ids = list(payroll.summaries.order_by('id').values_list('employee__employee_id', flat=True)[:options['payslips']])
+
+        def payslips():
+            for employee_id in employee_ids:
+                request = factory.get('/')
+                request.user = user
+                generate_payslip(request, f"{employee_id}_{payroll.id}")
+        result['generate_payslip'], _ = self.measure(payslips)
+        result['generate_payslip']['payslips'] = len(employee_ids)
+
+    def measure(self, func):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            value = func()
+            seconds = time.perf_counter() - started
+        return {'seconds': round(seconds, 3), 'queries': len(queries)}, value
+
+    def get_commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from hr.models.payroll import Payroll
+from hr.services.payslips import PAYSLIP_CHUNK_SIZE, stream_payslip_zip
+
+class Command(BaseCommand):
+    help = "Export the payslips of every employee in a payroll as a ZIP of HTML documents"
+
+    def add_arguments(self, parser):
+        parser.add_argument('payroll_id', type=int, help="Payroll to export")
+        parser.add_argument('--output', help="ZIP file to write, defaults to payslips_<year>_<month>_<id>.zip")
+        parser.add_argument('--workers', type=int, default=settings.PAYROLL_WORKERS, help="Number of processes rendering payslips")
+        parser.add_argument('--chunk-size', type=int, default=PAYSLIP_CHUNK_SIZE, help="Employees loaded and rendered at a time")
+
+    def handle(self, *args, **options):
+        try:
+            payroll = Payroll.objects.get(id=options['payroll_id'])
+        except Payroll.DoesNotExist:
+            raise CommandError(f"Payroll {options['payroll_id']} does not exist")
+
+        output = options['output'] or f"payslips_{payroll.process_year}_{payroll.process_month}_{payroll.id}.zip"
+        with open(output, 'wb') as archive:
+            for data in stream_payslip_zip(payroll, workers=options['workers'], chunk_size=options['chunk_size']):
+                archive.write(data)
+
+        self.stdout.write(self.style.SUCCESS(f"Payslips for {payroll} written to {output}"))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from hr.models.payroll import CreditUnion
+from hr.services.credit_union_import import import_credit_union_members
+from hr.services.spreadsheets import IMPORT_CHUNK_SIZE, SpreadsheetError
+import os
+
+
+class Command(BaseCommand):
+    help = "Update the amount and deduction dates of credit union members from a CSV or XLSX file with an 'employee_id' column and any of 'amount', 'start_date' and 'end_date'"
+
+    def add_arguments(self, parser):
+        parser.add_argument('credit_union_id', type=int, help="Credit union to update")
+        parser.add_argument('path', help="CSV or XLSX file to import")
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help="Rows matched and written at a time")
+
+    def handle(self, *args, **options):
+        try:
+            credit_union = CreditUnion.objects.get(id=options['credit_union_id'])
+        except CreditUnion.DoesNotExist:
+            raise CommandError(f"Credit union {options['credit_union_id']} does not exist")
+
+        try:
+            with open(options['path'], 'rb') as file, transaction.atomic():
+                summary = import_credit_union_members(credit_union, file, os.path.basename(options['path']), chunk_size=options['chunk_size'])
+        except (OSError, SpreadsheetError) as e:
+            raise CommandError(str(e))
+
+        for error in summary['errors']:
+            self.stderr.write(f"Row {error['row']} ({error['employee_id'] or 'no staff ID'}): {error['message']}")
+
+        self.stdout.write(self.style.SUCCESS(f"Updated {summary['updated']} member(s) of {credit_union}, {len(summary['errors'])} row(s) skipped"))
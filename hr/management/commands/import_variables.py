@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from hr.models.payroll import SalaryItem
+from hr.services.spreadsheets import IMPORT_CHUNK_SIZE, SpreadsheetError
+from hr.services.variable_import import import_variables
+import os
+
+
+class Command(BaseCommand):
+    help = "Import the variables (quantities) of a variable salary item from a CSV or XLSX file with 'employee_id' and 'variable' columns"
+
+    def add_arguments(self, parser):
+        parser.add_argument('salary_item_id', type=int, help="Variable salary item to update")
+        parser.add_argument('path', help="CSV or XLSX file to import")
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help="Rows matched and written at a time")
+
+    def handle(self, *args, **options):
+        try:
+            salary_item = SalaryItem.objects.get(id=options['salary_item_id'])
+        except SalaryItem.DoesNotExist:
+            raise CommandError(f"Salary item {options['salary_item_id']} does not exist")
+
+        try:
+            with open(options['path'], 'rb') as file, transaction.atomic():
+                summary = import_variables(salary_item, file, os.path.basename(options['path']), chunk_size=options['chunk_size'])
+        except (OSError, SpreadsheetError) as e:
+            raise CommandError(str(e))
+
+        for error in summary['errors']:
+            self.stderr.write(f"Row {error['row']} ({error['employee_id'] or 'no staff ID'}): {error['message']}")
+
+        self.stdout.write(self.style.SUCCESS(f"Imported {summary['updated']} variable(s) for {salary_item}, {len(summary['errors'])} row(s) skipped"))
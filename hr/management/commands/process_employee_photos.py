@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from hr.services.employee_photos import process_pending_photos
+import time
+
+class Command(BaseCommand):
+    help = "Render the avatar, list and detail sizes of newly uploaded employee photos"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help="Processes rendering photos, defaults to the PAYROLL_WORKERS setting")
+        parser.add_argument('--limit', type=int, default=None, help="Employees processed per pass")
+        parser.add_argument('--loop', action='store_true', help="Keep polling for pending photos instead of exiting")
+        parser.add_argument('--interval', type=float, default=30, help="Seconds to wait between polls in --loop mode")
+
+    def handle(self, *args, **options):
+        while True:
+            processed, failed = process_pending_photos(workers=options['workers'], limit=options['limit'])
+            if processed or failed:
+                self.stdout.write(self.style.SUCCESS(f"Processed {processed} employee photo(s), {failed} could not be read"))
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
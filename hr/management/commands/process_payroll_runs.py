@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from hr.services.payroll_runs import PAYROLL_CHUNK_SIZE, PayrollRunProcessor, claim_next_run
+import time
+
+class Command(BaseCommand):
+    help = "Process queued payroll runs in employee chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=PAYROLL_CHUNK_SIZE, help="Employees committed per transaction")
+        parser.add_argument('--workers', type=int, default=None, help="Processes computing large payrolls, defaults to the PAYROLL_WORKERS setting")
+        parser.add_argument('--loop', action='store_true', help="Keep polling for queued runs instead of exiting when the queue is empty")
+        parser.add_argument('--interval', type=float, default=5, help="Seconds to wait between polls in --loop mode")
+
+    def handle(self, *args, **options):
+        while True:
+            run = claim_next_run()
+            if run is None:
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+                continue
+
+            self.stdout.write(f"Processing {run}...")
+            run = PayrollRunProcessor(run, chunk_size=options['chunk_size'], workers=options['workers']).process()
+
+            if run.status == run.Status.COMPLETED:
+                self.stdout.write(self.style.SUCCESS(f"{run}: {run.message} {run.timings}"))
+            else:
+                self.stdout.write(self.style.ERROR(f"{run}: {run.message}"))
+
+        self.stdout.write(self.style.SUCCESS("No queued payroll runs left."))
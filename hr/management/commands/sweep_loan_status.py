@@ -0,0 +1,23 @@
+import logging
+
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_date
+
+from hr.models.payroll import Loan
+from hr.services.loan_repayments import settle_loan_statuses
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Mark repaid loans paid off and active loans past their deduction end date defaulted"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=parse_date, help="Treat this date (YYYY-MM-DD) as today, defaults to today")
+
+    def handle(self, *args, **options):
+        counts = settle_loan_statuses(Loan.objects.all(), options['date'])
+
+        summary = ", ".join(f"{count} {Loan.LoanStatus(status).label.lower()}" for status, count in counts.items())
+        logger.info(f"Loan status sweep: {summary}")
+        self.stdout.write(self.style.SUCCESS(f"Loan statuses updated: {summary}"))
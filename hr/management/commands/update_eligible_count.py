@@ -1,18 +1,82 @@
-from django.core.management.base import BaseCommand
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from hr.models.employee import Employee
 from hr.models.payroll import SalaryItem
+from hr.services.eligibility import compile_rules, count_eligible, get_rule
+from hr.services.workers import process_pool
+
+
+def count_salary_items(ids):
+    """Eligible employee counts of the salary items in `ids`, runs inside the worker processes"""
+    return count_eligible(SalaryItem.objects.filter(id__in=ids))
+
 
 class Command(BaseCommand):
     help = "Update eligible_employee_count for existing SalaryItem records."
 
-    def handle(self, *args, **kwargs):
-        salary_items = SalaryItem.objects.all()
-        updated_count = 0
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="Only recount salary items, or rules affected by employees, changed after this date or datetime")
+        parser.add_argument('--workers', type=int, default=1, help="Processes counting salary items, for large catalogs")
+        parser.add_argument('--chunk-size', type=int, default=500, help="Salary items counted per worker task")
+
+    def handle(self, *args, **options):
+        salary_items = SalaryItem.objects.only('id', 'eligible_employee_count')
+        since = self.parse_since(options['since'])
+        if since:
+            salary_items = salary_items.filter(id__in=self.changed_since(since))
+
+        ids = list(salary_items.values_list('id', flat=True))
+        counts = self.count(ids, options['workers'], options['chunk_size'])
 
+        changed = []
         for item in salary_items:
-            eligible_count = item.get_eligible_employees().count()
-            if item.eligible_employee_count != eligible_count:
-                item.eligible_employee_count = eligible_count
-                item.save()
-                updated_count += 1
+            if item.eligible_employee_count != counts[item.id]:
+                item.eligible_employee_count = counts[item.id]
+                changed.append(item)
+        SalaryItem.objects.bulk_update(changed, ['eligible_employee_count'], batch_size=1000)
+
+        self.stdout.write(self.style.SUCCESS(f"Updated eligible_employee_count for {len(changed)} SalaryItem records."))
+
+    def parse_since(self, value):
+        if not value:
+            return None
+        since = parse_datetime(value)
+        if since is None:
+            day = parse_date(value)
+            if day is None:
+                raise CommandError(f"Invalid --since value '{value}', expected a date or datetime")
+            since = datetime.combine(day, time.min)
+        return timezone.make_aware(since) if timezone.is_naive(since) else since
+
+    def changed_since(self, since):
+        """Ids of salary items edited after `since`, plus those depending on employee fields when employees changed"""
+        ids = set(SalaryItem.objects.filter(updated_at__gte=since).values_list('id', flat=True))
+
+        # employees updated outside Employee.save (queryset updates, imports) may move in or out of any rule
+        if Employee.objects.filter(updated_at__gte=since).exists():
+            rule = get_rule(SalaryItem)
+            ids.update(
+                item.id for item, compiled in compile_rules(SalaryItem.objects.all())
+                if rule.dependencies(lambda field, item=item: getattr(item, field), compiled)
+            )
+        return ids
+
+    def count(self, ids, workers, chunk_size):
+        chunks = [ids[start:start + chunk_size] for start in range(0, len(ids), chunk_size)]
+        if workers <= 1 or len(chunks) <= 1:
+            counts = {}
+            for chunk in chunks:
+                counts.update(count_salary_items(chunk))
+            return counts
 
-        self.stdout.write(self.style.SUCCESS(f"Updated eligible_employee_count for {updated_count} SalaryItem records."))
+        # workers open their own connections rather than sharing the ones inherited from this process
+        connections.close_all()
+        counts = {}
+        with process_pool(workers) as executor:
+            for result in executor.map(count_salary_items, chunks):
+                counts.update(result)
+        return counts
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.1 on 2026-10-17 14:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hr', '0087_null_added_to_step'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayrollRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('parameters', models.JSONField(help_text='Submitted payroll form data, M2M filters as lists of ids', verbose_name='Payroll Parameters')),
+                ('error_mode', models.CharField(choices=[('strict', 'Strict mode ensures all staff records are accurate and complete before processing'), ('mute', 'Mute/Silence mode processes payroll to the exclusion of staff with incomplete records')], default='strict', max_length=12, verbose_name='Error Processing Mode')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='queued', max_length=10, verbose_name='Run Status')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Total Employees')),
+                ('processed', models.PositiveIntegerField(default=0, verbose_name='Processed Employees')),
+                ('error_count', models.PositiveIntegerField(default=0, verbose_name='Employees With Errors')),
+                ('errors', models.JSONField(blank=True, default=list, verbose_name='Errors')),
+                ('message', models.TextField(blank=True, null=True, verbose_name='Message')),
+                ('timings', models.JSONField(blank=True, default=dict, verbose_name='Phase Timings (Seconds)')),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('payroll', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='runs', to='hr.payroll', verbose_name='Payroll')),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payroll_runs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Payroll Run',
+                'verbose_name_plural': 'Payroll Runs',
+                'indexes': [models.Index(fields=['status', 'created_at'], name='payrollrun_status_idx')],
+            },
+        ),
+    ]
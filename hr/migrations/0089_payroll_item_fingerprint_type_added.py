@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-17 14:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hr', '0088_payroll_run_model_created_for_background_processing'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payrollitem',
+            name='item_type',
+            field=models.CharField(choices=[('salary_item', 'Salary Item'), ('loan', 'Loan'), ('credit_union', 'Credit Union'), ('tax', 'Tax'), ('tax_relief', 'Tax Relief'), ('employer_ssnit', 'Employer SSNIT'), ('employee_ssnit', 'Employee SSNIT'), ('bank', 'Bank'), ('gross_salary', 'Gross Salary'), ('basic_salary', 'Basic Salary'), ('net_salary', 'Net Salary'), ('step', 'Step'), ('salary_grade', 'Salary Grade'), ('taxable', 'Taxable'), ('earning', 'Earning'), ('deduction', 'Deduction'), ('fingerprint', 'Input Fingerprint'), ('other', 'Other')], max_length=20, verbose_name='Item Type'),
+        ),
+    ]
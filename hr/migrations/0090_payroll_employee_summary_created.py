@@ -0,0 +1,88 @@
+# Generated by Django 5.1.1 on 2026-10-17 14:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+SUMMARY_FIELDS = {
+    'basic_salary': 'basic_salary',
+    'earning': 'earning',
+    'deduction': 'deduction',
+    'gross_salary': 'gross_salary',
+    'taxable': 'taxability',
+    'tax': 'tax',
+    'tax_relief': 'tax_relief',
+    'employee_ssnit': 'employee_ssnit',
+    'employer_ssnit': 'employer_ssnit',
+    'net_salary': 'net_salary',
+}
+
+
+def backfill_payroll_summaries(apps, schema_editor):
+    """Pivot the payroll items of already processed payrolls into one summary row per employee"""
+    PayrollItem = apps.get_model('hr', 'PayrollItem')
+    PayrollEmployeeSummary = apps.get_model('hr', 'PayrollEmployeeSummary')
+
+    item_types = set(SUMMARY_FIELDS.values()) | {'bank', 'salary_grade'}
+    items = PayrollItem.objects.filter(item_type__in=item_types).order_by('payroll_id', 'employee_id').values_list(
+        'payroll_id', 'employee_id', 'item_type', 'amount', 'bank_id', 'dependency'
+    )
+
+    summaries = {}
+    for payroll_id, employee_id, item_type, amount, bank_id, dependency in items.iterator(chunk_size=5000):
+        summary = summaries.setdefault((payroll_id, employee_id), {})
+        if item_type == 'bank':
+            summary['bank_id'] = bank_id
+        elif item_type == 'salary_grade':
+            summary['salary_grade_id'] = int(dependency) if dependency and dependency.isdigit() else None
+        else:
+            summary.setdefault(item_type, amount)
+
+    PayrollEmployeeSummary.objects.bulk_create([
+        PayrollEmployeeSummary(
+            payroll_id=payroll_id, employee_id=employee_id,
+            bank_id=summary.get('bank_id'), salary_grade_id=summary.get('salary_grade_id'),
+            **{field: summary.get(item_type) or 0 for field, item_type in SUMMARY_FIELDS.items()}
+        )
+        for (payroll_id, employee_id), summary in summaries.items()
+        if 'net_salary' in summary
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hr', '0089_payroll_item_fingerprint_type_added'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayrollEmployeeSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('basic_salary', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Basic Salary')),
+                ('earning', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Earning')),
+                ('deduction', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Deduction')),
+                ('gross_salary', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Gross Salary')),
+                ('taxable', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Taxable')),
+                ('tax', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Tax')),
+                ('tax_relief', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Tax Relief')),
+                ('employee_ssnit', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Employee SSNIT')),
+                ('employer_ssnit', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Employer SSNIT')),
+                ('net_salary', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Net Salary')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('bank', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payroll_summaries', to='hr.bank')),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payroll_summaries', to='hr.employee', verbose_name='Employee')),
+                ('payroll', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='summaries', to='hr.payroll', verbose_name='Related Payroll')),
+                ('salary_grade', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payroll_summaries', to='hr.salarygrade')),
+            ],
+            options={
+                'verbose_name': 'Payroll Employee Summary',
+                'verbose_name_plural': 'Payroll Employee Summaries',
+                'indexes': [models.Index(fields=['payroll', 'bank'], name='payrollsummary_bank_idx')],
+                'unique_together': {('payroll', 'employee')},
+            },
+        ),
+        migrations.RunPython(backfill_payroll_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.1.1 on 2026-10-17 14:58
+
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+CENT = Decimal('0.01')
+
+
+def backfill_loan_schedules(apps, schema_editor):
+    """Generate the schedule of loans that are already active, as hr.services.loan_schedules does on activation"""
+    Loan = apps.get_model('hr', 'Loan')
+    LoanSchedule = apps.get_model('hr', 'LoanSchedule')
+
+    schedule = []
+    for loan in Loan.objects.filter(status='active', active_on__isnull=False, duration_in_months__gt=0).iterator(chunk_size=1000):
+        periods = loan.duration_in_months
+        balance = loan.total_repayable_amount.quantize(CENT)
+        principal_left = loan.principal_amount
+        installment = loan.monthly_installment.quantize(CENT)
+        principal = (loan.principal_amount / periods).quantize(CENT)
+        for period in range(1, periods + 1):
+            if period == periods:
+                installment, principal = balance, principal_left
+            balance -= installment; principal_left -= principal
+            schedule.append(LoanSchedule(
+                loan_id=loan.id, period=period, due_date=loan.active_on + relativedelta(months=period - 1),
+                installment=installment, principal=principal, interest=installment - principal, expected_balance=balance,
+            ))
+
+    LoanSchedule.objects.bulk_create(schedule, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hr', '0090_payroll_employee_summary_created'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoanSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.PositiveIntegerField(verbose_name='Period')),
+                ('due_date', models.DateField(verbose_name='Due Date')),
+                ('installment', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Installment')),
+                ('principal', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Principal')),
+                ('interest', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Interest')),
+                ('expected_balance', models.DecimalField(decimal_places=2, max_digits=12, verbose_name='Expected Balance')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('loan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedule', to='hr.loan')),
+            ],
+            options={
+                'verbose_name': 'Loan Schedule',
+                'verbose_name_plural': 'Loan Schedules',
+                'ordering': ['loan', 'period'],
+                'indexes': [models.Index(fields=['due_date', 'loan'], name='loanschedule_due_date_idx')],
+                'unique_together': {('loan', 'period')},
+            },
+        ),
+        migrations.RunPython(backfill_loan_schedules, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-17 15:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hr', '0091_loan_schedule_created'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='staffcredituniondeduction',
+            name='payroll',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='credit_union_deductions', to='hr.payroll', verbose_name='Related Payroll'),
+        ),
+        migrations.AddIndex(
+            model_name='staffcredituniondeduction',
+            index=models.Index(fields=['payroll', 'staff_credit_union'], name='cu_deduction_payroll_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.1 on 2026-10-17 15:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hr', '0092_staff_credit_union_deduction_payroll_added'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='employee',
+            name='photo_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='employee',
+            name='photo_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Rendered photo sizes, by size name'),
+        ),
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['photo_hash'], name='photo_hash_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.1 on 2026-10-17 15:19
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def move_fingerprints_to_summaries(apps, schema_editor):
+    """Copy the `fingerprint` payroll items onto the employee summaries and drop them from the items table"""
+    PayrollItem = apps.get_model('hr', 'PayrollItem')
+    PayrollEmployeeSummary = apps.get_model('hr', 'PayrollEmployeeSummary')
+
+    fingerprints = PayrollItem.objects.filter(
+        payroll_id=OuterRef('payroll_id'), employee_id=OuterRef('employee_id'), item_type='fingerprint',
+    ).values('description')[:1]
+    PayrollEmployeeSummary.objects.update(input_fingerprint=Coalesce(Subquery(fingerprints), Value('')))
+    PayrollItem.objects.filter(item_type='fingerprint').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hr', '0093_employee_photo_derivatives_added'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payrollemployeesummary',
+            name='input_fingerprint',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64, verbose_name='Input Fingerprint'),
+        ),
+        migrations.RunPython(move_fingerprints_to_summaries, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='payrollitem',
+            name='item_type',
+            field=models.CharField(choices=[('salary_item', 'Salary Item'), ('loan', 'Loan'), ('credit_union', 'Credit Union'), ('tax', 'Tax'), ('tax_relief', 'Tax Relief'), ('employer_ssnit', 'Employer SSNIT'), ('employee_ssnit', 'Employee SSNIT'), ('bank', 'Bank'), ('gross_salary', 'Gross Salary'), ('basic_salary', 'Basic Salary'), ('net_salary', 'Net Salary'), ('step', 'Step'), ('salary_grade', 'Salary Grade'), ('taxable', 'Taxable'), ('earning', 'Earning'), ('deduction', 'Deduction'), ('other', 'Other')], max_length=20, verbose_name='Item Type'),
+        ),
+    ]
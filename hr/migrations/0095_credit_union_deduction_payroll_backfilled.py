@@ -0,0 +1,43 @@
+# Generated by Django 5.1.1 on 2026-10-17 15:30
+
+from django.db import migrations
+from django.utils import timezone
+
+
+def link_deductions_to_payrolls(apps, schema_editor):
+    """
+    Link deductions logged before payrolls were linked to the payroll holding the member's credit
+    union item, processed on the day the deduction was dated, so remittances cover older payrolls
+    """
+    PayrollItem = apps.get_model('hr', 'PayrollItem')
+    StaffCreditUnionDeduction = apps.get_model('hr', 'StaffCreditUnionDeduction')
+
+    payrolls = {}
+    items = PayrollItem.objects.filter(item_type='credit_union', credit_union__isnull=False).order_by('payroll_id').values_list(
+        'employee_id', 'credit_union_id', 'payroll_id', 'payroll__created_at'
+    )
+    for employee_id, credit_union_id, payroll_id, created_at in items.iterator(chunk_size=5000):
+        day = timezone.localtime(created_at).date() if timezone.is_aware(created_at) else created_at.date()
+        # the first payroll of the day wins when several deducted the same member
+        payrolls.setdefault((employee_id, credit_union_id, day), payroll_id)
+
+    deductions = StaffCreditUnionDeduction.objects.filter(payroll__isnull=True).values_list(
+        'id', 'staff_credit_union__employee_id', 'staff_credit_union__credit_union_id', 'date_paid'
+    )
+    linked = [
+        StaffCreditUnionDeduction(id=deduction_id, payroll_id=payrolls[(employee_id, credit_union_id, date_paid)])
+        for deduction_id, employee_id, credit_union_id, date_paid in deductions.iterator(chunk_size=5000)
+        if (employee_id, credit_union_id, date_paid) in payrolls
+    ]
+    StaffCreditUnionDeduction.objects.bulk_update(linked, ['payroll'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hr', '0094_payroll_fingerprint_moved_to_employee_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(link_deductions_to_payrolls, migrations.RunPython.noop),
+    ]
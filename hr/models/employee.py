@@ -5,7 +5,6 @@ from datetime import date
 from django.utils.timezone import now
 import os
 from django.utils.text import slugify
-from PIL import Image
 from django.core.exceptions import ValidationError
 from django.urls import reverse
 from django_quill.fields import QuillField
@@ -35,11 +34,13 @@ class NationalIDType(models.Model):
     def __str__(self):
         return self.name
 
+# Employee statuses counted as active staff
+ACTIVE_STATUSES = ['active', 'on_leave', 'probation']
+
 class EmployeeQuerySet(models.QuerySet):
     def active(self):
         """Returns only employees with valid active statuses."""
-        valid_statuses = ['active', 'on_leave', 'probation']
-        return self.filter(status__in=valid_statuses)
+        return self.filter(status__in=ACTIVE_STATUSES)
 
 class EmployeeManager(models.Manager):
     def get_queryset(self):
@@ -67,6 +68,9 @@ class Employee(models.Model):
     id_number = models.CharField(max_length=24, null=True, blank=True, verbose_name="ID Number")
     # photo = models.ImageField(upload_to='photos/', null=True, default="avatar.png")
     photo = models.ImageField(upload_to=employee_photo_upload_path, null=True, default="avatar.png")
+    # SHA-256 of the photo the derivatives were rendered from, empty while a new photo is pending, 'failed' when it could not be read
+    photo_hash = models.CharField(max_length=64, blank=True, default='', editable=False)
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False, help_text="Rendered photo sizes, by size name")
 
     email = models.EmailField(unique=True, verbose_name='Email Address')
     phone_number = models.CharField(max_length=15, unique=True, verbose_name='Phone Number')
@@ -111,18 +115,42 @@ class Employee(models.Model):
     def get_absolute_url(self):
         return reverse("employee-detail", args=[str(self.id)])
     
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)  # Save the instance first to get a file path
-
-        # Open the image using Pillow
-        img = Image.open(self.photo.path)
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._loaded_photo = self._photo_name()
+
+    def _photo_name(self):
+        # read from __dict__ so a deferred photo is not fetched
+        photo = self.__dict__.get('photo')
+        return getattr(photo, 'name', photo)
+
+    def photo_changed(self):
+        """Whether a new photo was uploaded or assigned since the employee was loaded"""
+        photo = self.__dict__.get('photo')
+        if photo is None or isinstance(photo, str):
+            return photo != self._loaded_photo
+        # a file assigned but not stored yet is a new upload
+        return not getattr(photo, '_committed', False) or photo.name != self._loaded_photo
+
+    @property
+    def photo_urls(self):
+        """URL of each photo size, the original photo until its derivatives are rendered"""
+        from hr.services.employee_photos import PHOTO_SIZES
+        from django.core.files.storage import default_storage
+        variants = self.photo_variants or {}
+        original = self.photo.url if self.photo else ''
+        return {size: default_storage.url(variants[size]) if size in variants else original for size in PHOTO_SIZES}
 
-        # Resize the image (maintaining aspect ratio), let's say to a maximum width of 800px
-        max_size = (800, 800)  # Define a maximum size (width, height)
-        img.thumbnail(max_size, Image.Resampling.LANCZOS)  # Use LANCZOS instead of ANTIALIAS
-
-        # Save the image back to the file path, reducing quality to 85% for space efficiency
-        img.save(self.photo.path, quality=85)
+    def save(self, *args, **kwargs):
+        # the photo is resized by the process_employee_photos command, saving only flags a new one as pending
+        if self.photo_changed():
+            # the previous photo's derivatives are dropped so photo_urls falls back to the new original
+            self.photo_hash = ''
+            self.photo_variants = {}
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'photo_hash', 'photo_variants'}
+        super().save(*args, **kwargs)
+        self._loaded_photo = self._photo_name()
 
     class Meta:
         unique_together = ('id_type', 'id_number')
@@ -130,6 +158,7 @@ class Employee(models.Model):
             Index(fields=['first_name', 'last_name'], name='name_idx'),
             Index(fields=['email'], name='email_idx'),
             Index(fields=['phone_number'], name='phone_number_idx'),
+            Index(fields=['photo_hash'], name='photo_hash_idx'),
         ]  
 
     def get_age(self):
@@ -270,20 +299,9 @@ class SMS(models.Model):
         return f"{self.message[:20]} on {self.sms_date.strftime('%d %b, %Y %I:%M %p')}"
     
     def get_sms_employees(self):
-        # Retrieve the selected criteria
-        selected_jobs = self.job.all()
-        selected_departments = self.department.all()
-        selected_grades = self.salary_grade.all()
-
-        # Filter employees based on the criteria selected
-        employees = Employee.objects.all()
-        filtered_employees = [
-            employee for employee in employees
-            if (not selected_jobs or employee.job in selected_jobs) and 
-               (not selected_departments or (employee.job and employee.job.department in selected_departments )) and 
-               (not selected_grades or employee.salary_grade in selected_grades)
-        ]
-        return filtered_employees
+        """Employees in the selected jobs, departments and grades, all employees when none is selected"""
+        from hr.services.eligibility import eligible_employees
+        return eligible_employees(self)
     
     def display_sms_job(self):
         return ",".join(job.job_title for job in self.job.all())
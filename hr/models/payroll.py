@@ -1,4 +1,5 @@
 from typing import Any
+from django.conf import settings
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
@@ -83,30 +84,8 @@ class Tax(models.Model):
 
     @classmethod
     def calculate_tax(cls, year, amount):
-        tax = 0
-        position = 1
-        previous_block = 0
-
-        tax_blocks  = cls.objects.filter(year=year).order_by('rate')
-        for item in tax_blocks:
-            block = item.block
-            rate = item.rate
-
-            if amount > block:
-                block_tax = (rate / 100) * block
-                tax = tax + block_tax
-                if position > 1:
-                    amount = amount - previous_block
-            else:
-                amount = amount - previous_block
-                block_tax = (rate / 100) * amount
-                tax += block_tax
-                break
-        
-            position += 1
-            previous_block = block
-        
-        return tax
+        from hr.services.tax_table import get_tax_table
+        return get_tax_table(year).tax(amount)
 
 class SalaryItem(models.Model):
     item_name = models.CharField(max_length=100, unique=True, verbose_name='Item Name')
@@ -185,42 +164,15 @@ class SalaryItem(models.Model):
         Otherwise, filters by `step`, `salary_grade`, `job`, `department`, and `designation`
         and excludes any employees listed in `excluded_from`.
         """
-        from hr.models.employee import Employee
-
-        # If `applicable_to` is set, return those employees directly
-        if self.applicable_to.exists():
-            return self.applicable_to.all()
-
-        # Start with all employees
-        eligible_employees = Employee.objects.active()
-
-        # Apply hierarchical filters if set
-        if self.step.exists():
-            eligible_employees = eligible_employees.filter(salary_grade__step__in=self.step.all())
-        if self.salary_grade.exists():
-            eligible_employees = eligible_employees.filter(salary_grade__in=self.salary_grade.all())
-        if self.job.exists():
-            eligible_employees = eligible_employees.filter(job__in=self.job.all())
-        if self.department.exists():
-            eligible_employees = eligible_employees.filter(job__department__in=self.department.all())
-        if self.designation.exists():
-            eligible_employees = eligible_employees.filter(designation__in=self.designation.all())
-
-        # Filter by employment type if `condition` is specified
-        if self.condition:
-            eligible_employees = eligible_employees.filter(employment_type=self.condition)
-
-        # Exclude employees listed in `excluded_from`
-        if self.excluded_from.exists():
-            eligible_employees = eligible_employees.exclude(id__in=self.excluded_from.values_list('id', flat=True))
-
-        return eligible_employees   
-
-    def update_eligible_employee_count(self):
+        from hr.services.eligibility import eligible_employees
+        return eligible_employees(self)
+
+    def update_eligible_employee_count(self, count=None):
         """
         Updates the `eligible_employee_count` field with the current count of eligible employees.
+        Pass `count` when it is already known to skip counting again.
         """
-        self.eligible_employee_count = self.get_eligible_employees().count()
+        self.eligible_employee_count = self.get_eligible_employees().count() if count is None else count
         self.save(update_fields=['eligible_employee_count'])
 
 class StaffSalaryItem(models.Model):
@@ -350,6 +302,8 @@ class Loan(models.Model):
             self.outstanding_balance = self.total_repayable_amount
 
         # Auto set active and deduction_end_date when status is active by posting PV in finance system
+        # the repayment schedule is generated once, when the loan is activated
+        activated = self.status == self.LoanStatus.ACTIVE and (not self.active_on or self._state.adding)
         if self.status == self.LoanStatus.ACTIVE and not self.active_on:
             active_on = now().date()
             self.deduction_end_date = active_on + timedelta(days=30 * self.duration_in_months)
@@ -367,6 +321,10 @@ class Loan(models.Model):
 
         super().save(*args, **kwargs)
 
+        if activated:
+            from hr.services.loan_schedules import generate_schedule
+            generate_schedule(self)
+
 
 class LoanRepayment(models.Model):
     loan = models.ForeignKey(Loan, on_delete=models.CASCADE, related_name='repayments')
@@ -399,6 +357,33 @@ class LoanRepayment(models.Model):
     def __str__(self):
         return f"Repayment of {self.amount_paid} for Loan #{self.loan.id} on {self.date_paid}"
 
+class LoanSchedule(models.Model):
+    """
+    One installment of an active loan, generated in bulk when the loan is activated so payroll,
+    arrears and forecast reports read the amount due in a month instead of recomputing it.
+    """
+    loan = models.ForeignKey(Loan, on_delete=models.CASCADE, related_name='schedule')
+    period = models.PositiveIntegerField(verbose_name="Period")
+    due_date = models.DateField(verbose_name="Due Date")
+    installment = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Installment")
+    principal = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Principal")
+    interest = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Interest")
+    expected_balance = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Expected Balance")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Loan Schedule"
+        verbose_name_plural = "Loan Schedules"
+        unique_together = ('loan', 'period')
+        ordering = ['loan', 'period']
+        indexes = [
+            Index(fields=['due_date', 'loan'], name='loanschedule_due_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"Loan #{self.loan_id} installment {self.period} due {self.due_date}"
+
 class CreditUnion(models.Model):
     union_name = models.CharField(max_length=150, unique=True, verbose_name="Credit Union Description", help_text="Union can be welfare group, bank etc")
     amount = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, verbose_name="Amount (Default)", help_text="If entered, will be the default for all staff in this union, leave it blank for varying amount")
@@ -439,25 +424,12 @@ class CreditUnion(models.Model):
         #     raise ValidationError("Start date can not be in the past")
 
     def get_eligible_employees(self):
-        from hr.models.employee import Employee
-        # Get all active employee when all_employee is checked
-        eligiblie_employees = Employee.objects.active()
-       
-       # if all_employee is checked, return all but exclude staff that may be excluded
-        if self.all_employee:
-            if self.excluded_from.exists():
-                eligiblie_employees = eligiblie_employees.exclude(id__in=self.excluded_from.values_list('id', flat=True))
-            return eligiblie_employees
-        
-        # Apply other filters 
-        if self.applicable_to.exists():
-            eligiblie_employees = self.applicable_to.all()
-        if self.department.exists():
-            eligiblie_employees = eligiblie_employees.filter(job__department__in=self.department.all())
-        if self.excluded_from.exists():
-            eligiblie_employees = eligiblie_employees.exclude(id__in=self.excluded_from.values_list('id', flat=True))
-        
-        return eligiblie_employees
+        """
+        All active employees (less `excluded_from`) when `all_employee` is checked, otherwise
+        `applicable_to` or the active employees, filtered by `department` and `excluded_from`
+        """
+        from hr.services.eligibility import eligible_employees
+        return eligible_employees(self)
 
 
 
@@ -492,17 +464,37 @@ class StaffCreditUnion(models.Model):
 
 class StaffCreditUnionDeduction(models.Model):
     staff_credit_union = models.ForeignKey('StaffCreditUnion', on_delete=models.CASCADE, verbose_name="Staff Credit Union", related_name="staff_credit_unions")
+    # deductions logged before payrolls were linked were matched to their payroll by migration 0095, unmatched ones have none
+    payroll = models.ForeignKey('Payroll', on_delete=models.CASCADE, null=True, blank=True, related_name='credit_union_deductions', verbose_name="Related Payroll")
     amount_paid = models.DecimalField(max_digits=12, decimal_places=2)
     date_paid = models.DateField(default=now, verbose_name="Date Paid")
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)  
 
+    class Meta:
+        indexes = [
+            Index(fields=['payroll', 'staff_credit_union'], name='cu_deduction_payroll_idx'),
+        ]
+
     def __str__(self):
         return f"{self.staff_credit_union} - {self.amount_paid}"
 
 # Payroll 
 
+class PayrollQuerySet(models.QuerySet):
+    def completed(self):
+        """Excludes payrolls still being written by a queued or running PayrollRun."""
+        return self.exclude(runs__status__in=[PayrollRun.Status.QUEUED, PayrollRun.Status.RUNNING])
+
+class PayrollManager(models.Manager):
+    def get_queryset(self):
+        return PayrollQuerySet(self.model, using=self._db)
+
+    def completed(self):
+        """Shortcut to query only fully written payrolls."""
+        return self.get_queryset().completed()
+
 class Payroll(models.Model):
     PAYROLL_MONTH = (
     ('01', 'January'),
@@ -549,6 +541,9 @@ class Payroll(models.Model):
 
     pv_count = models.IntegerField(verbose_name="Number of Vouchers", default=0, editable=False)
 
+    # Custom Manager
+    objects = PayrollManager()
+
     class Meta:
         verbose_name_plural = "Payrolls"
         unique_together = ('process_month', 'process_year', 'payment_rate', 'description',   'condition')
@@ -580,30 +575,9 @@ class Payroll(models.Model):
         return ",".join(f"{emp.first_name} {emp.last_name}" for emp in self.excluded_from.all())
 
     def get_eligible_employees(self):
-        from hr.models.employee import Employee
-
-        employees = Employee.objects.active()
-
-        # First apply the condition filter
-        if self.condition != 'all':
-            employees = employees.filter(employment_type=self.condition)
-
-        # Apply remaining filters
-
-        if self.applicable_to.exists():
-            employees = employees.filter(id__in=self.applicable_to.values_list("id", flat=True))
-        if self.excluded_from.exists():
-            employees = employees.exclude(id__in=self.excluded_from.values_list("id", flat=True))
-        if self.department.exists():
-            employees = employees.filter(job__department__in=self.department.all())
-        if self.salary_grade.exists():
-            employees = employees.filter(salary_grade__in=self.salary_grade.all())
-        if self.designation.exists():
-            employees = employees.filter(designation__in=self.designation.all())
-        if self.step.exists():
-            employees = employees.filter(salary_grade__grade_step__in=self.step.all())
-
-        return employees
+        """Active employees matching the payroll's condition and every filter set on it"""
+        from hr.services.eligibility import eligible_employees
+        return eligible_employees(self)
     
 class PayrollItem(models.Model):
    
@@ -689,4 +663,83 @@ class PayrollError(models.Model):
         ]
 
     def __str__(self):
-        return f"Error for {self.employee} in Payroll {self.payroll}"
\ No newline at end of file
+        return f"Error for {self.employee} in Payroll {self.payroll}"
+
+class PayrollEmployeeSummary(models.Model):
+    """
+    One row per employee in a payroll with the figures otherwise spread across their payroll items,
+    written alongside the items at processing time so payslip and payroll views read a single row.
+    """
+    payroll = models.ForeignKey('Payroll', on_delete=models.CASCADE, related_name='summaries', verbose_name="Related Payroll")
+    employee = models.ForeignKey('hr.Employee', on_delete=models.CASCADE, related_name='payroll_summaries', verbose_name="Employee")
+    bank = models.ForeignKey('Bank', on_delete=models.SET_NULL, null=True, blank=True, related_name='payroll_summaries')
+    salary_grade = models.ForeignKey('SalaryGrade', on_delete=models.SET_NULL, null=True, blank=True, related_name='payroll_summaries')
+
+    basic_salary = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Basic Salary")
+    earning = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Earning")
+    deduction = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Deduction")
+    gross_salary = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Gross Salary")
+    taxable = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Taxable")
+    tax = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Tax")
+    tax_relief = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Tax Relief")
+    employee_ssnit = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Employee SSNIT")
+    employer_ssnit = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Employer SSNIT")
+    net_salary = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Net Salary")
+    # digest of the employee's payroll inputs, compared on recompute to skip unchanged employees
+    input_fingerprint = models.CharField(max_length=64, blank=True, default='', editable=False, verbose_name="Input Fingerprint")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Payroll Employee Summary"
+        verbose_name_plural = "Payroll Employee Summaries"
+        unique_together = ('payroll', 'employee')
+        indexes = [
+            Index(fields=['payroll', 'bank'], name='payrollsummary_bank_idx'),
+        ]
+
+    def __str__(self):
+        return f"Summary for {self.employee} in {self.payroll}"
+
+class PayrollRun(models.Model):
+    """
+    A queued payroll processing job. The process payroll form enqueues a run with the submitted
+    parameters and the `process_payroll_runs` command computes and writes it in employee chunks.
+    """
+    class Status(models.TextChoices):
+        QUEUED = 'queued', 'Queued'
+        RUNNING = 'running', 'Running'
+        COMPLETED = 'completed', 'Completed'
+        FAILED = 'failed', 'Failed'
+
+    payroll = models.ForeignKey('Payroll', on_delete=models.SET_NULL, null=True, blank=True, related_name='runs', verbose_name="Payroll")
+    parameters = models.JSONField(verbose_name="Payroll Parameters", help_text="Submitted payroll form data, M2M filters as lists of ids")
+    error_mode = models.CharField(max_length=12, choices=Payroll.ERROR_MODE, default='strict', verbose_name="Error Processing Mode")
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.QUEUED, verbose_name="Run Status")
+    total = models.PositiveIntegerField(default=0, verbose_name="Total Employees")
+    processed = models.PositiveIntegerField(default=0, verbose_name="Processed Employees")
+    error_count = models.PositiveIntegerField(default=0, verbose_name="Employees With Errors")
+    errors = models.JSONField(default=list, blank=True, verbose_name="Errors")
+    message = models.TextField(null=True, blank=True, verbose_name="Message")
+    timings = models.JSONField(default=dict, blank=True, verbose_name="Phase Timings (Seconds)")
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='payroll_runs')
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Payroll Run"
+        verbose_name_plural = "Payroll Runs"
+        indexes = [
+            Index(fields=['status', 'created_at'], name='payrollrun_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Payroll run #{self.id} ({self.get_status_display()})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.Status.COMPLETED, self.Status.FAILED)
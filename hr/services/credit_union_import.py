@@ -0,0 +1,128 @@
+"""
+Spreadsheet import of credit union member amounts and deduction dates.
+
+A CSV or XLSX file keyed by `employee_id` (the staff ID) sets the `amount`, `start_date` and
+`end_date` of the union's members; only the columns present in the file are changed and an empty
+date cell clears the date. Rows are streamed in chunks, each chunk is matched to the members with
+one query and written with `bulk_update`. Rows failing the checks of the set-employees form are
+reported with their row number and skipped.
+"""
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from hr.models.payroll import StaffCreditUnion
+from hr.services.spreadsheets import IMPORT_CHUNK_SIZE, SpreadsheetError, chunks, read_rows, staff_id
+
+EMPLOYEE_COLUMN = 'employee_id'
+
+# file column: StaffCreditUnion field
+FIELD_COLUMNS = {
+    'amount': 'amount',
+    'start_date': 'deduction_start_date',
+    'end_date': 'deduction_end_date',
+}
+
+
+def _blank(value):
+    return value is None or str(value).strip() == ''
+
+
+def parse_amount(value):
+    """Non negative amount from a spreadsheet cell, None when empty, raises ValueError otherwise"""
+    if _blank(value):
+        return None
+    try:
+        amount = Decimal(str(value).strip().replace(',', ''))
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"'{value}' is not an amount")
+    if amount < 0:
+        raise ValueError(f"'{value}' can not be negative")
+    return amount.quantize(Decimal('0.01'))
+
+
+def parse_day(value):
+    """Date from a spreadsheet cell (a date cell or YYYY-MM-DD text), None when empty, raises ValueError otherwise"""
+    if _blank(value):
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        day = parse_date(str(value).strip())
+    except ValueError:
+        day = None
+    if day is None:
+        raise ValueError(f"'{value}' is not a date (YYYY-MM-DD)")
+    return day
+
+
+def validate_membership(amount, start_date, end_date):
+    """Problems with a member's amount and deduction dates, as the set-employees form checks them"""
+    errors = []
+    if amount is None:
+        errors.append("Amount can not be empty")
+    if start_date and end_date and end_date < start_date:
+        errors.append("End date can not be earlier than start date")
+    if end_date and not start_date:
+        errors.append("Start date must be set if an end date is specified")
+    return errors
+
+
+def import_credit_union_members(credit_union, file, filename, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Update the members of `credit_union` from a spreadsheet, returns
+    {'updated': count, 'errors': [{'row', 'employee_id', 'message'}]}
+    """
+    updated = 0; errors = []
+    columns = None
+    now = timezone.now()
+    for chunk in chunks(read_rows(file, filename, (EMPLOYEE_COLUMN,), optional=tuple(FIELD_COLUMNS)), chunk_size):
+        if columns is None:
+            columns = [column for column in FIELD_COLUMNS if column in chunk[0][1]]
+            if not columns:
+                raise SpreadsheetError(f"The first row must name at least one of the {', '.join(repr(column) for column in FIELD_COLUMNS)} columns")
+
+        members = {
+            member.staff_id: member
+            for member in StaffCreditUnion.objects.filter(
+                credit_union=credit_union, employee__employee_id__in={staff_id(values[EMPLOYEE_COLUMN]) for _, values in chunk}
+            ).annotate(staff_id=F('employee__employee_id')).only('id', 'amount', 'deduction_start_date', 'deduction_end_date')
+        }
+
+        changed = {}
+        for number, values in chunk:
+            employee_id = staff_id(values[EMPLOYEE_COLUMN])
+            member = members.get(employee_id)
+            if member is None:
+                errors.append({'row': number, 'employee_id': employee_id, 'message': f"Not a member of {credit_union}"})
+                continue
+            # columns absent from the file keep the member's current values
+            result = {field: getattr(member, field) for field in FIELD_COLUMNS.values()}
+            try:
+                for column in columns:
+                    parse = parse_amount if column == 'amount' else parse_day
+                    result[FIELD_COLUMNS[column]] = parse(values[column])
+            except ValueError as e:
+                errors.append({'row': number, 'employee_id': employee_id, 'message': str(e)})
+                continue
+
+            problems = validate_membership(result['amount'], result['deduction_start_date'], result['deduction_end_date'])
+            if problems:
+                errors.extend({'row': number, 'employee_id': employee_id, 'message': problem} for problem in problems)
+                continue
+
+            for field, value in result.items():
+                setattr(member, field, value)
+            member.updated_at = now
+            # a staff ID repeated in the file keeps its last values
+            changed[member.id] = member
+
+        StaffCreditUnion.objects.bulk_update(changed.values(), [FIELD_COLUMNS[column] for column in columns] + ['updated_at'])
+        updated += len(changed)
+
+    return {'updated': updated, 'errors': errors}
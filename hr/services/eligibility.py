@@ -0,0 +1,331 @@
+"""
+Employee eligibility rules.
+
+SalaryItem, CreditUnion, Payroll, SMS and Meeting restrict employees by the records picked in
+their many-to-many fields (step, grade, job, department, designation, applicable_to,
+excluded_from). An `EligibilityRule` describes how a model's fields map onto employee lookups.
+Compiling a rule loads the ids of each relation with one query (none when the relation is
+prefetched) and turns them into a single `Q`, so eligible employees, counts and membership
+tests are one query against indexed columns. `EligibilityRule.matches` evaluates the same rule
+against a single employee in Python.
+
+Compiled ids are cached per rule version: saving the rule, or changing any of its relations
+(hr.signals.bump_rule_version), bumps its updated_at, which retires the cached version.
+
+When an employee's grade, job, designation, status or employment type changes,
+`sync_employee_eligibility` re-evaluates the salary item and credit union rules depending on
+the changed fields for that one employee and adds or removes their assignment rows and
+counters, instead of rescanning every rule. Rows an employee only stops qualifying for because
+they left the active statuses are kept, with their custom amounts and deduction history, and
+apply again if the employee is reactivated; payroll only ever processes active employees.
+"""
+from dataclasses import dataclass, replace
+from functools import partial
+from typing import Callable, Optional
+
+from django.core.cache import cache
+from django.db.models import Count, F, Q, prefetch_related_objects
+
+from hr.models.employee import ACTIVE_STATUSES, Employee
+from hr.models.payroll import CreditUnion, SalaryItem, StaffCreditUnion, StaffSalaryItem
+
+CACHE_KEY = 'hr:eligibility:{label}:{pk}'
+
+# Rules counted by one conditional aggregation query
+COUNT_BATCH_SIZE = 100
+
+
+@dataclass(frozen=True)
+class EligibilityRule:
+    # (relation, employee lookup) pairs, each non empty relation restricts employees to its records
+    filters: tuple = ()
+    applicable_to: Optional[str] = None
+    excluded_from: Optional[str] = None
+    # how employees in `applicable_to` are used:
+    # 'only' - they are the eligible employees, whatever their status and the other filters
+    # 'base' - they replace the active employees the other filters apply to
+    # 'filter' - they are one more filter
+    applicable_mode: str = 'filter'
+    active_only: bool = True
+    # boolean field which, when set, ignores every filter except `excluded_from`
+    all_field: Optional[str] = None
+    # receives a field getter and returns extra {employee field: value} filters (or None) for the rule's plain fields
+    condition: Optional[Callable] = None
+
+    @property
+    def relations(self):
+        return [relation for relation in (*dict(self.filters), self.applicable_to, self.excluded_from) if relation]
+
+    @property
+    def lookups(self):
+        return [lookup for _, lookup in self.filters]
+
+    def dependencies(self, value, ids):
+        """Employee fields (TRACKED_FIELDS) whose change can alter who the rule selects"""
+        if self.all_field and value(self.all_field):
+            return {'status'} if self.active_only else set()
+        if self.applicable_mode == 'only' and ids.get(self.applicable_to):
+            return set()
+
+        fields = {'status'} if self.active_only else set()
+        fields.update(lookup.split('__')[0] for relation, lookup in self.filters if ids[relation])
+        if self.condition and self.condition(value):
+            fields.update(self.condition(value))
+        return fields
+
+    def matches(self, value, ids, employee):
+        """Evaluate the rule against one employee, a dict of EMPLOYEE_VALUES, as build_q would"""
+        eligible = employee['status'] in ACTIVE_STATUSES or not self.active_only
+
+        if not (self.all_field and value(self.all_field)):
+            applicable = ids.get(self.applicable_to)
+            if applicable:
+                if self.applicable_mode == 'only':
+                    return employee['id'] in applicable
+                in_applicable = employee['id'] in applicable
+                eligible = in_applicable if self.applicable_mode == 'base' else eligible and in_applicable
+
+            for relation, lookup in self.filters:
+                if ids[relation] and employee[lookup] not in ids[relation]:
+                    return False
+
+            if self.condition:
+                for field, expected in (self.condition(value) or {}).items():
+                    if employee[field] != expected:
+                        return False
+
+        return eligible and employee['id'] not in (ids.get(self.excluded_from) or ())
+
+    def build_q(self, value, ids):
+        """Combine the plain field values and relation ids of a rule into one Q"""
+        q = Q(status__in=ACTIVE_STATUSES) if self.active_only else Q()
+        excluded = ids.get(self.excluded_from)
+
+        if not (self.all_field and value(self.all_field)):
+            applicable = ids.get(self.applicable_to)
+            if applicable:
+                if self.applicable_mode == 'only':
+                    return Q(pk__in=applicable)
+                q = Q(pk__in=applicable) if self.applicable_mode == 'base' else q & Q(pk__in=applicable)
+
+            for relation, lookup in self.filters:
+                if ids[relation]:
+                    q &= Q(**{f"{lookup}__in": ids[relation]})
+
+            if self.condition:
+                condition = self.condition(value)
+                if condition:
+                    q &= Q(**condition)
+
+        if excluded:
+            q &= ~Q(pk__in=excluded)
+        return q
+
+
+def _employment_type(value):
+    return {'employment_type': value('condition')} if value('condition') else None
+
+
+def _payroll_employment_type(value):
+    return {'employment_type': value('condition')} if value('condition') != 'all' else None
+
+
+RULES = {
+    'hr.salaryitem': EligibilityRule(
+        filters=(('step', 'salary_grade__grade_step'), ('salary_grade', 'salary_grade'), ('job', 'job'), ('department', 'job__department'), ('designation', 'designation')),
+        applicable_to='applicable_to', excluded_from='excluded_from', applicable_mode='only', condition=_employment_type,
+    ),
+    'hr.creditunion': EligibilityRule(
+        filters=(('department', 'job__department'),),
+        applicable_to='applicable_to', excluded_from='excluded_from', applicable_mode='base', all_field='all_employee',
+    ),
+    'hr.payroll': EligibilityRule(
+        filters=(('step', 'salary_grade__grade_step'), ('salary_grade', 'salary_grade'), ('department', 'job__department'), ('designation', 'designation')),
+        applicable_to='applicable_to', excluded_from='excluded_from', condition=_payroll_employment_type,
+    ),
+    'hr.sms': EligibilityRule(
+        filters=(('job', 'job'), ('salary_grade', 'salary_grade'), ('department', 'job__department')), active_only=False,
+    ),
+    'administration.meeting': EligibilityRule(
+        filters=(('job', 'job'), ('salary_grade', 'salary_grade'), ('department', 'job__department')), active_only=False,
+    ),
+}
+
+
+# Employee fields the rules filter on, a change to any of them can change eligibility
+TRACKED_FIELDS = ('salary_grade', 'job', 'designation', 'status', 'employment_type')
+
+# Values of one employee needed to evaluate every rule in Python
+EMPLOYEE_VALUES = sorted({'id', 'status', 'employment_type', 'salary_grade__amount', *(lookup for rule in RULES.values() for lookup in rule.lookups)})
+
+
+def get_rule(model):
+    return RULES[model._meta.label_lower]
+
+
+def _instance_ids(instance, relation):
+    prefetched = getattr(instance, '_prefetched_objects_cache', {})
+    if relation in prefetched:
+        return [related.pk for related in prefetched[relation]]
+    return list(getattr(instance, relation).values_list('pk', flat=True))
+
+
+def _cache_key(instance):
+    return CACHE_KEY.format(label=instance._meta.label_lower, pk=instance.pk)
+
+
+def _version(instance):
+    return instance.updated_at.timestamp() if instance.updated_at else None
+
+
+def _compile(instance):
+    ids = {relation: _instance_ids(instance, relation) for relation in get_rule(instance).relations}
+    cache.set(_cache_key(instance), {'version': _version(instance), 'ids': ids}, None)
+    return ids
+
+
+def compile_ids(instance):
+    """Relation ids of the rule `instance`, from the cache when its version was compiled before"""
+    cached = cache.get(_cache_key(instance))
+    if cached and cached['version'] == _version(instance):
+        return cached['ids']
+    return _compile(instance)
+
+
+def compile_rules(queryset):
+    """
+    Yield (instance, ids) for every rule in `queryset`, the relations of rules missing from the
+    cache are prefetched so compiling a whole catalog costs one query per relation
+    """
+    instances = list(queryset)
+    cached = cache.get_many([_cache_key(instance) for instance in instances])
+    stale = [instance for instance in instances if cached.get(_cache_key(instance), {}).get('version') != _version(instance)]
+    if stale:
+        prefetch_related_objects(stale, *get_rule(queryset.model).relations)
+
+    stale_ids = {instance.pk for instance in stale}
+    for instance in instances:
+        yield instance, _compile(instance) if instance.pk in stale_ids else cached[_cache_key(instance)]['ids']
+
+
+def compile_rule(instance):
+    """Return the Q selecting the employees eligible under `instance`"""
+    return get_rule(instance).build_q(lambda field: getattr(instance, field), compile_ids(instance))
+
+
+def eligible_employees(instance):
+    """Queryset of the employees eligible under a saved rule instance"""
+    return Employee.objects.filter(compile_rule(instance))
+
+
+def matching_employees(instance):
+    """Employees a saved rule instance selects whatever their status, inactive ones keep their rows for a reactivation"""
+    rule = replace(get_rule(instance), active_only=False)
+    return Employee.objects.filter(rule.build_q(lambda field: getattr(instance, field), compile_ids(instance)))
+
+
+def count_eligible(queryset, batch_size=COUNT_BATCH_SIZE):
+    """{pk: number of eligible employees} of every rule in `queryset`, one grouped query per batch of rules"""
+    rule = get_rule(queryset.model)
+    rules = list(compile_rules(queryset))
+    counts = {}
+    for start in range(0, len(rules), batch_size):
+        batch = rules[start:start + batch_size]
+        totals = Employee.objects.aggregate(**{
+            f"rule_{instance.pk}": Count('pk', filter=rule.build_q(partial(getattr, instance), ids) or None)
+            for instance, ids in batch
+        })
+        counts.update({instance.pk: totals[f"rule_{instance.pk}"] for instance, _ in batch})
+    return counts
+
+
+def is_eligible(instance, employee):
+    return eligible_employees(instance).filter(pk=employee.pk).exists()
+
+
+def filter_employees(model, data):
+    """Employees eligible under a rule of `model` given as form cleaned data, before it is saved"""
+    rule = get_rule(model)
+    ids = {}
+    for relation in rule.relations:
+        records = data.get(relation)
+        ids[relation] = list(records.values_list('pk', flat=True)) if records is not None else []
+    return Employee.objects.filter(rule.build_q(data.get, ids))
+
+
+def _evaluate(queryset, employee, changed):
+    """
+    Yield (instance, eligible, eligible if active) for the rules in `queryset` depending on any of
+    the `changed` employee fields, the last flag ignores the employee's status
+    """
+    rule = get_rule(queryset.model)
+    active_employee = {**employee, 'status': ACTIVE_STATUSES[0]}
+    for instance, ids in compile_rules(queryset):
+        value = partial(getattr, instance)
+        if changed is None or rule.dependencies(value, ids) & changed:
+            ids = {relation: set(related) for relation, related in ids.items()}
+            eligible = rule.matches(value, ids, employee)
+            yield instance, eligible, eligible or rule.matches(value, ids, active_employee)
+
+
+def sync_employee_eligibility(employee_id, changed=None):
+    """
+    Add or remove the salary item and credit union assignments of one employee after the
+    `changed` TRACKED_FIELDS were updated, `changed` is None for a new employee. 'status' only
+    counts as changed when the employee moved into or out of the active statuses.
+    """
+    from hr.services.salary_items import SalaryItemAmounts, recompute_factor_items
+
+    changed = set(changed) if changed is not None else None
+    employee = Employee.objects.values(*EMPLOYEE_VALUES).get(pk=employee_id)
+
+    # imported salary items keep the staff list they were imported with
+    assigned = dict(StaffSalaryItem.objects.filter(employee_id=employee_id).values_list('salary_item_id', 'id'))
+    added = []; removed = []; evaluated = []
+    for salary_item, eligible, eligible_if_active in _evaluate(SalaryItem.objects.filter(staff_source='filters'), employee, changed):
+        evaluated.append(salary_item.id)
+        if eligible and salary_item.id not in assigned:
+            amount = SalaryItemAmounts(salary_item, Employee.objects.filter(pk=employee_id)).amount(employee['salary_grade__amount'], employee_id=employee_id)
+            added.append(StaffSalaryItem(salary_item=salary_item, employee_id=employee_id, amount=amount))
+        elif not eligible_if_active and salary_item.id in assigned:
+            removed.append(salary_item.id)
+
+    StaffSalaryItem.objects.bulk_create(added)
+    if removed:
+        StaffSalaryItem.objects.filter(employee_id=employee_id, salary_item_id__in=removed).delete()
+
+    if changed is not None and 'status' in changed:
+        # kept rows no longer match the counters' one row per eligible employee, recount the evaluated items
+        counts = count_eligible(SalaryItem.objects.filter(id__in=evaluated))
+        SalaryItem.objects.bulk_update(
+            [SalaryItem(id=item_id, eligible_employee_count=count) for item_id, count in counts.items()], ['eligible_employee_count']
+        )
+    else:
+        # rows kept for an inactive employee were never counted
+        if removed and employee['status'] in ACTIVE_STATUSES:
+            SalaryItem.objects.filter(id__in=removed).update(eligible_employee_count=F('eligible_employee_count') - 1)
+        if added:
+            SalaryItem.objects.filter(id__in=[item.salary_item_id for item in added]).update(eligible_employee_count=F('eligible_employee_count') + 1)
+
+    # factor items follow the employee's new grade, and items computed from newly assigned items pick them up
+    if changed is None or 'salary_grade' in changed:
+        recompute_factor_items(employee_ids=[employee_id])
+    elif added:
+        recompute_factor_items(item_ids=[item.salary_item_id for item in added], employee_ids=[employee_id])
+
+    members = set(StaffCreditUnion.objects.filter(employee_id=employee_id).values_list('credit_union_id', flat=True))
+    joined = []; left = []
+    for credit_union, eligible, eligible_if_active in _evaluate(CreditUnion.objects.all(), employee, changed):
+        if eligible and credit_union.id not in members:
+            joined.append(StaffCreditUnion(
+                credit_union=credit_union, employee_id=employee_id, amount=credit_union.amount or 0,
+                deduction_start_date=credit_union.deduction_start_date, deduction_end_date=credit_union.deduction_end_date,
+            ))
+        elif not eligible_if_active and credit_union.id in members:
+            left.append(credit_union.id)
+
+    StaffCreditUnion.objects.bulk_create(joined)
+    if left:
+        StaffCreditUnion.objects.filter(employee_id=employee_id, credit_union_id__in=left).delete()
+
+    return {'salary_items_added': len(added), 'salary_items_removed': len(removed), 'credit_unions_joined': len(joined), 'credit_unions_left': len(left)}
@@ -0,0 +1,120 @@
+"""
+Employee photo derivatives.
+
+`Employee.save` used to open, resize and rewrite the photo on every save, status changes
+included. Saving now only flags a newly uploaded photo as pending (an empty `photo_hash`); the
+`process_employee_photos` command later hashes each pending photo and renders a fixed set of JPEG
+sizes from it in a process pool. Derivatives are named after the SHA-256 of the photo, so a photo
+whose content did not change (or one shared by many employees, like the default avatar) is
+rendered once and reused. A photo that can not be read is flagged as failed and keeps being served
+as uploaded until it is replaced. The original upload is left untouched.
+"""
+import hashlib
+import io
+import logging
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image
+
+from hr.services.workers import get_worker_count, process_pool
+
+logger = logging.getLogger(__name__)
+
+# size name: longest side in pixels
+PHOTO_SIZES = {
+    'avatar': 64,
+    'list': 160,
+    'detail': 800,
+}
+
+PHOTO_QUALITY = 85
+
+# photo_hash of a photo that could not be rendered, it is not retried until a new photo is saved
+PHOTO_FAILED = 'failed'
+
+BATCH_SIZE = 1000
+
+
+def photo_digest(name):
+    """SHA-256 of a stored photo, read in blocks"""
+    digest = hashlib.sha256()
+    with default_storage.open(name, 'rb') as file:
+        for block in iter(lambda: file.read(64 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def variant_name(digest, size):
+    return f"photos/derived/{digest[:2]}/{digest}_{size}.jpg"
+
+
+def render_photo(name):
+    """
+    Hash the stored photo `name` and render its missing derivatives, runs inside the worker processes.
+    Returns (name, digest, {size: derivative name}), or (name, None, error message) when the photo can not be read.
+    """
+    try:
+        digest = photo_digest(name)
+        variants = {size: variant_name(digest, size) for size in PHOTO_SIZES}
+        missing = [size for size, variant in variants.items() if not default_storage.exists(variant)]
+        if missing:
+            with default_storage.open(name, 'rb') as file:
+                image = Image.open(file)
+                image.load()
+            image = image.convert('RGB')
+            for size in missing:
+                derivative = image.copy()
+                derivative.thumbnail((PHOTO_SIZES[size], PHOTO_SIZES[size]), Image.Resampling.LANCZOS)
+                output = io.BytesIO()
+                derivative.save(output, 'JPEG', quality=PHOTO_QUALITY)
+                # the storage may pick another name, e.g. when a concurrent run saved the same derivative first
+                variants[size] = default_storage.save(variants[size], ContentFile(output.getvalue()))
+    except (OSError, ValueError) as e:
+        return name, None, str(e)
+    return name, digest, variants
+
+
+def process_pending_photos(workers=None, limit=None):
+    """
+    Render the derivatives of every employee photo flagged as pending (at most `limit` employees).
+    Returns the number of employees processed and the number whose photo could not be read, which
+    are flagged as failed so later runs skip them.
+    """
+    from hr.models.employee import Employee
+
+    pending = Employee.objects.filter(photo_hash='').exclude(photo='').order_by('id').values_list('id', 'photo')
+    if limit:
+        pending = pending[:limit]
+
+    # employees sharing a photo file (the default avatar) are rendered once
+    employees_by_photo = {}
+    for employee_id, name in pending:
+        employees_by_photo.setdefault(name, []).append(employee_id)
+    names = list(employees_by_photo)
+
+    workers = min(get_worker_count(workers), len(names))
+    if workers > 1:
+        with process_pool(workers) as executor:
+            results = list(executor.map(render_photo, names))
+    else:
+        results = [render_photo(name) for name in names]
+
+    # a photo replaced while rendering stays pending for the next run
+    current = dict(Employee.objects.filter(
+        id__in=[employee_id for ids in employees_by_photo.values() for employee_id in ids], photo_hash='',
+    ).values_list('id', 'photo'))
+
+    processed = []
+    failed = []
+    for name, digest, variants in results:
+        employee_ids = [employee_id for employee_id in employees_by_photo[name] if current.get(employee_id) == name]
+        if digest is None:
+            logger.warning(f"Employee photo {name} could not be processed: {variants}")
+            failed.extend(Employee(id=employee_id, photo_hash=PHOTO_FAILED, photo_variants={}) for employee_id in employee_ids)
+        else:
+            processed.extend(Employee(id=employee_id, photo_hash=digest, photo_variants=variants) for employee_id in employee_ids)
+
+    # bulk_update skips Employee.save and leaves updated_at alone, only the derivatives changed
+    Employee.objects.bulk_update(processed + failed, ['photo_hash', 'photo_variants'], batch_size=BATCH_SIZE)
+    return len(processed), len(failed)
@@ -0,0 +1,86 @@
+"""
+Batch loan repayment posting.
+
+Saving a LoanRepayment reloads and fully saves its loan, recomputing the installments and the
+status, so posting a payroll's loan deductions one repayment at a time costs several queries per
+loan. `post_loan_repayments` instead bulk creates the repayments of a payroll's `loan` items,
+decrements every outstanding balance with one UPDATE using F() expressions and settles the
+statuses with set based updates; the number of queries does not grow with the number of loans.
+
+Repayments carry the payroll's reference, so posting the same payroll twice is a no-op.
+
+`settle_loan_statuses` applies the transitions of `Loan.update_status` to a whole queryset, one
+UPDATE per status; the `sweep_loan_status` command runs it nightly over every loan.
+"""
+from decimal import Decimal
+import logging
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from hr.models.payroll import Loan, LoanRepayment, PayrollItem
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+ZERO = Value(Decimal('0.00'))
+
+
+def payment_reference(payroll):
+    """Reference of the repayments posted from `payroll`"""
+    return f"PAYROLL-{payroll.id}"
+
+
+def settle_loan_statuses(loans, today=None):
+    """
+    Mark the repaid loans of the `loans` queryset paid off and the active ones past their deduction
+    end date defaulted. Returns the number of loans moved to each status.
+    """
+    today = today or timezone.now().date()
+    now = timezone.now()
+    # each UPDATE re-checks its conditions on the rows it locks, so concurrent payroll postings are not overwritten
+    paid_off = loans.filter(
+        status__in=[Loan.LoanStatus.ACTIVE, Loan.LoanStatus.DEFAULTED], outstanding_balance__lte=0
+    ).update(status=Loan.LoanStatus.PAID_OFF, updated_at=now)
+    defaulted = loans.filter(
+        status=Loan.LoanStatus.ACTIVE, deduction_end_date__lt=today, outstanding_balance__gt=0
+    ).update(status=Loan.LoanStatus.DEFAULTED, updated_at=now)
+    return {Loan.LoanStatus.PAID_OFF: paid_off, Loan.LoanStatus.DEFAULTED: defaulted}
+
+
+def post_loan_repayments(payroll, date_paid=None):
+    """
+    Record the loan deductions of `payroll` as LoanRepayments and update the loans they repay.
+    Returns the number of repayments created.
+    """
+    reference = payment_reference(payroll)
+    date_paid = date_paid or timezone.now().date()
+
+    with transaction.atomic():
+        posted = LoanRepayment.objects.filter(loan=OuterRef('loan_id'), payment_reference=reference)
+        deductions = (
+            PayrollItem.objects.filter(payroll=payroll, item_type=PayrollItem.ItemType.LOAN, loan__isnull=False, amount__gt=0)
+            .exclude(Exists(posted)).values('loan_id').annotate(total=Sum('amount')).order_by('loan_id')
+        )
+        repayments = LoanRepayment.objects.bulk_create([
+            LoanRepayment(loan_id=row['loan_id'], amount_paid=row['total'], date_paid=date_paid, payment_reference=reference)
+            for row in deductions
+        ], batch_size=BATCH_SIZE)
+        if not repayments:
+            return 0
+
+        loans = Loan.objects.filter(id__in=[repayment.loan_id for repayment in repayments])
+        paid = LoanRepayment.objects.filter(loan=OuterRef('pk'), payment_reference=reference).values('loan').annotate(total=Sum('amount_paid')).values('total')
+
+        # balances never go below zero, as in LoanRepayment.save
+        loans.update(
+            outstanding_balance=Greatest(F('outstanding_balance') - Coalesce(Subquery(paid), ZERO), ZERO),
+            updated_at=timezone.now(),
+        )
+        settle_loan_statuses(loans, date_paid)
+
+    logger.info(f"{payroll}: posted {len(repayments)} loan repayment(s)")
+    return len(repayments)
@@ -0,0 +1,90 @@
+"""
+Loan amortization schedules.
+
+A loan's installment used to be derived again on every save and payroll took
+`min(monthly_installment, outstanding_balance)` for each loan it deducted. When a loan becomes
+active its whole schedule is now generated in one `bulk_create`: one LoanSchedule row per month
+with the due date, installment, principal/interest split and the balance expected after it.
+Payroll reads what is due with a single grouped query on the indexed `due_date`: the loan's
+outstanding balance less the balance the schedule expected by the end of the processing month.
+Installments of a month without a payroll, or not posted in full, are therefore caught up by the
+next payroll, and repayments made outside payroll reduce it. Repayments only reach the balance
+when a payroll is posted, so a payroll should be posted before the next month is processed.
+Arrears or forecast reports can read the table directly.
+
+Interest is simple interest as in `Loan.calculate_installments`, spread evenly over the periods;
+amounts are rounded to cents and the last period absorbs the rounding so the schedule adds up to
+the total repayable amount.
+"""
+import calendar
+from datetime import date
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.db import transaction
+from django.db.models import Min
+
+from hr.models.payroll import LoanSchedule
+
+BATCH_SIZE = 1000
+
+CENT = Decimal('0.01')
+
+
+def schedule_rows(loan):
+    """(period, due_date, installment, principal, interest, expected_balance) for every month of `loan`"""
+    periods = loan.duration_in_months
+    if not periods or not loan.active_on:
+        return []
+
+    principal_amount = Decimal(loan.principal_amount)
+    total = Decimal(loan.total_repayable_amount).quantize(CENT)
+    installment = Decimal(loan.monthly_installment).quantize(CENT)
+    principal = (principal_amount / periods).quantize(CENT)
+
+    rows = []
+    balance = total; principal_left = principal_amount
+    for period in range(1, periods + 1):
+        # the first installment is due in the month the loan becomes active
+        due_date = loan.active_on + relativedelta(months=period - 1)
+        if period == periods:
+            installment, principal = balance, principal_left
+        balance -= installment; principal_left -= principal
+        rows.append((period, due_date, installment, principal, installment - principal, balance))
+    return rows
+
+
+def build_schedule(loan):
+    """Unsaved LoanSchedule rows of `loan`"""
+    return [
+        LoanSchedule(loan=loan, period=period, due_date=due_date, installment=installment, principal=principal, interest=interest, expected_balance=balance)
+        for period, due_date, installment, principal, interest, balance in schedule_rows(loan)
+    ]
+
+
+def generate_schedule(loan):
+    """Replace the schedule of `loan`, returns the number of periods created"""
+    with transaction.atomic():
+        LoanSchedule.objects.filter(loan=loan).delete()
+        created = LoanSchedule.objects.bulk_create(build_schedule(loan), batch_size=BATCH_SIZE)
+    return len(created)
+
+
+def month_range(process_month, process_year):
+    """First and last day of a processing month"""
+    month = int(process_month)
+    return date(process_year, month, 1), date(process_year, month, calendar.monthrange(process_year, month)[1])
+
+
+def installments_due(balances, process_month, process_year):
+    """
+    {loan_id: amount due} in the processing month of the scheduled loans in `balances`
+    ({loan_id: outstanding balance}), overdue installments included
+    """
+    _, end = month_range(process_month, process_year)
+    # expected balances only go down, the lowest one due so far is the latest
+    expected = dict(
+        LoanSchedule.objects.filter(loan_id__in=balances, due_date__lte=end).values('loan_id').annotate(balance=Min('expected_balance'))
+        .order_by().values_list('loan_id', 'balance')
+    )
+    return {loan_id: max(balance - expected[loan_id], 0) for loan_id, balance in balances.items() if loan_id in expected}
@@ -0,0 +1,417 @@
+"""
+Set-based payroll computation.
+
+Rather than querying salary items, credit unions, loans and tax blocks for every
+employee, the engine loads all inputs for the eligible population up front in a
+fixed number of queries, keeps them in dicts keyed by employee id and then computes
+each employee in memory. The number of queries therefore does not grow with headcount.
+
+Every computed employee also gets a fingerprint of their inputs (grade amount, bank, salary
+items, credit unions, loans, tax relief and the tax table version), stored on their
+PayrollEmployeeSummary, so a payroll can later recompute only the employees whose inputs changed.
+"""
+from collections import defaultdict
+from datetime import date
+import hashlib
+import logging
+import time
+
+from django.db.models import Exists, OuterRef, Q
+
+from hr.models.payroll import (
+    Bank, Loan, LoanSchedule, PayrollEmployeeSummary, PayrollError, PayrollItem, SalaryGrade, StaffCreditUnion,
+    StaffCreditUnionDeduction, StaffSalaryItem,
+)
+from hr.services.loan_schedules import installments_due
+from hr.services.tax_table import get_tax_table
+from hr.services.workers import get_worker_count, process_pool
+
+logger = logging.getLogger(__name__)
+
+# Smallest population the engine computes in parallel
+PAYROLL_PARALLEL_MIN_EMPLOYEES = 2000
+
+EMPLOYEE_FIELDS = ('id', 'first_name', 'last_name', 'salary_grade_id', 'bank_id', 'tax_relief')
+
+# PayrollEmployeeSummary columns and the payroll item each is read from
+SUMMARY_FIELDS = {
+    'basic_salary': 'basic_salary',
+    'earning': 'earning',
+    'deduction': 'deduction',
+    'gross_salary': 'gross_salary',
+    'taxable': 'taxability',
+    'tax': 'tax',
+    'tax_relief': 'tax_relief',
+    'employee_ssnit': 'employee_ssnit',
+    'employer_ssnit': 'employer_ssnit',
+    'net_salary': 'net_salary',
+}
+
+
+def employee_display_name(employee):
+    """Mirror Employee.__str__ for the plain employee dicts used by the engine"""
+    return f"{employee['first_name'].capitalize()} {employee['last_name'].capitalize()}"
+
+
+class PayrollInputs:
+    """All the data needed to compute a payroll, keyed by employee id"""
+
+    def __init__(self, employees, salary_grades, banks, salary_items, credit_unions, loans, tax_table):
+        self.employees = employees
+        self.salary_grades = salary_grades
+        self.banks = banks
+        self.salary_items = salary_items
+        self.credit_unions = credit_unions
+        self.loans = loans
+        self.tax_table = tax_table
+
+    @classmethod
+    def load(cls, employees, process_year, today, process_month=None):
+        """
+        Bulk load every payroll input for the `employees` queryset.
+        Each relation is fetched with a single query using the employee queryset as a subquery.
+        """
+        employee_ids = employees.values('id')
+
+        employee_rows = list(employees.order_by('id').values(*EMPLOYEE_FIELDS))
+
+        salary_grades = {
+            grade['id']: grade
+            for grade in SalaryGrade.objects.filter(employees__in=employee_ids).distinct().values('id', 'grade', 'amount', 'grade_step_id')
+        }
+
+        banks = {
+            bank['id']: bank
+            for bank in Bank.objects.filter(employees__in=employee_ids).distinct().values('id', 'bank_name')
+        }
+
+        salary_items = defaultdict(list)
+        staff_salary_items = StaffSalaryItem.objects.filter(
+            Q(employee_id__in=employee_ids) & Q(amount__gt=0) & (Q(salary_item__expires_on__isnull=True) | Q(salary_item__expires_on__gte=today))
+        ).order_by('id').values('employee_id', 'salary_item_id', 'amount', 'salary_item__effect')
+        for row in staff_salary_items:
+            salary_items[row['employee_id']].append(row)
+
+        credit_unions = defaultdict(list)
+        staff_credit_unions = StaffCreditUnion.objects.filter(employee_id__in=employee_ids, amount__isnull=False).filter(
+            Q(deduction_start_date__isnull=False,
+              deduction_end_date__isnull=True,
+              deduction_start_date__lte=today
+            ) |
+            Q(deduction_start_date__isnull=False,
+              deduction_end_date__isnull=False,
+              deduction_start_date__lte=today,
+              deduction_end_date__gte=today
+            )
+        ).order_by('id').values('id', 'employee_id', 'amount', 'credit_union_id', 'credit_union__union_name')
+        for row in staff_credit_unions:
+            credit_unions[row['employee_id']].append(row)
+
+        loans = defaultdict(list)
+        staff_loans = list(Loan.objects.filter(
+            employee_id__in=employee_ids, status='active', outstanding_balance__gt=0, deduction_end_date__gt=today
+        ).annotate(scheduled=Exists(LoanSchedule.objects.filter(loan=OuterRef('pk')))).order_by('id').values(
+            'id', 'employee_id', 'loan_type', 'outstanding_balance', 'monthly_installment', 'scheduled'
+        ))
+        # scheduled loans deduct what is due by the end of the processing month (arrears included), older loans their monthly installment
+        due = installments_due({row['id']: row['outstanding_balance'] for row in staff_loans if row['scheduled']}, process_month or today.month, process_year)
+        for row in staff_loans:
+            row['installment'] = due.get(row['id'], 0) if row['scheduled'] else row['monthly_installment']
+            if row['installment'] > 0:
+                loans[row['employee_id']].append(row)
+
+        tax_table = get_tax_table(process_year)
+
+        return cls(employee_rows, salary_grades, banks, salary_items, credit_unions, loans, tax_table)
+
+    def shard(self, count):
+        """Split the inputs into at most `count` contiguous runs of employees (ordered by id)"""
+        size = -(-len(self.employees) // count) or 1
+        shards = []
+        for start in range(0, len(self.employees), size):
+            employees = self.employees[start:start + size]
+            ids = [employee['id'] for employee in employees]
+            grade_ids = {employee['salary_grade_id'] for employee in employees}
+            bank_ids = {employee['bank_id'] for employee in employees}
+            shards.append(PayrollInputs(
+                employees,
+                {grade_id: grade for grade_id, grade in self.salary_grades.items() if grade_id in grade_ids},
+                {bank_id: bank for bank_id, bank in self.banks.items() if bank_id in bank_ids},
+                {employee_id: self.salary_items[employee_id] for employee_id in ids if employee_id in self.salary_items},
+                {employee_id: self.credit_unions[employee_id] for employee_id in ids if employee_id in self.credit_unions},
+                {employee_id: self.loans[employee_id] for employee_id in ids if employee_id in self.loans},
+                self.tax_table,
+            ))
+        return shards
+
+
+class EmployeePayroll:
+    """The computed payroll lines of a single employee"""
+
+    def __init__(self, employee):
+        self.employee = employee
+        self.items = []
+        self.union_deductions = []
+        self.error_category = None
+        self.error_message = None
+        self.fingerprint = None
+
+    @property
+    def is_valid(self):
+        return self.error_category is None
+
+    def add_item(self, item_type, amount=None, entry=None, **extra):
+        self.items.append(dict(item_type=item_type, amount=amount, entry=entry, **extra))
+
+    def fail(self, category, message):
+        self.error_category = category
+        self.error_message = message
+
+
+class PayrollResult:
+    """Outcome of a payroll computation, ready to be written in bulk"""
+
+    def __init__(self, employee_results, process_date):
+        self.employee_results = employee_results
+        self.process_date = process_date
+
+    @property
+    def employee_count(self):
+        return len(self.employee_results)
+
+    @property
+    def valid_results(self):
+        return [result for result in self.employee_results if result.is_valid]
+
+    @property
+    def errors(self):
+        return [result.error_message for result in self.employee_results if not result.is_valid]
+
+    def build_items(self, payroll, results=None):
+        """Build the PayrollItem rows of `results` (every valid employee by default)"""
+        results = self.valid_results if results is None else results
+        return [
+            PayrollItem(payroll=payroll, employee_id=result.employee['id'], **item)
+            for result in results
+            for item in result.items
+        ]
+
+    def build_summaries(self, payroll, results=None):
+        """Build the PayrollEmployeeSummary rows of `results` (every valid employee by default)"""
+        results = self.valid_results if results is None else results
+        summaries = []
+        for result in results:
+            amounts = {item['item_type']: item['amount'] for item in result.items}
+            summaries.append(PayrollEmployeeSummary(
+                payroll=payroll, employee_id=result.employee['id'], bank_id=result.bank['id'], salary_grade_id=result.salary_grade['id'],
+                input_fingerprint=result.fingerprint, **{field: amounts[item_type] for field, item_type in SUMMARY_FIELDS.items()}
+            ))
+        return summaries
+
+    def build_errors(self, payroll):
+        return [
+            PayrollError(payroll=payroll, employee_id=result.employee['id'], error_category=result.error_category)
+            for result in self.employee_results
+            if not result.is_valid
+        ]
+
+    def build_union_deductions(self, payroll, results=None):
+        """Build the StaffCreditUnionDeduction rows of `results` (every valid employee by default)"""
+        results = self.valid_results if results is None else results
+        return [
+            StaffCreditUnionDeduction(payroll=payroll, staff_credit_union_id=staff_credit_union_id, amount_paid=amount, date_paid=self.process_date)
+            for result in results
+            for staff_credit_union_id, amount in result.union_deductions
+        ]
+
+
+class PayrollCalculator:
+    """
+    The pure, per-employee part of the payroll computation. It only works on PayrollInputs
+    (plain dicts and the compiled tax table) so it can run in worker processes.
+    """
+
+    def __init__(self, payment_rate):
+        self.payment_rate = payment_rate
+
+    def compute(self, inputs):
+        """Return the EmployeePayroll of every employee in `inputs`, in input order"""
+        results = [self.compute_employee(employee, inputs) for employee in inputs.employees]
+
+        # tax the whole workforce in one call, then settle each employee
+        pending = [result for result in results if result.is_valid]
+        taxes = inputs.tax_table.tax_many([result.taxable for result in pending])
+        for result, income_tax in zip(pending, taxes):
+            self.settle_employee(result, income_tax)
+
+        return results
+
+    def fingerprint(self, employee, inputs):
+        """Digest of every input that affects the payroll lines of `employee`"""
+        salary_grade = inputs.salary_grades.get(employee['salary_grade_id']) or {}
+        employee_inputs = (
+            salary_grade.get('amount'), salary_grade.get('grade_step_id'), employee['bank_id'], employee['tax_relief'],
+            [(row['salary_item_id'], row['amount'], row['salary_item__effect']) for row in inputs.salary_items.get(employee['id'], [])],
+            [(row['id'], row['credit_union_id'], row['amount']) for row in inputs.credit_unions.get(employee['id'], [])],
+            [(row['id'], row['loan_type'], row['outstanding_balance'], row['installment']) for row in inputs.loans.get(employee['id'], [])],
+            inputs.tax_table.version, float(self.payment_rate),
+        )
+        return hashlib.sha1(repr(employee_inputs).encode()).hexdigest()
+
+    def compute_employee(self, employee, inputs):
+        """Compute everything up to the taxable amount of an employee"""
+        result = EmployeePayroll(employee)
+        result.fingerprint = self.fingerprint(employee, inputs)
+        staff_total_earnings = 0; staff_total_deductions = 0
+
+        # 1. Basic salary
+        salary_grade = inputs.salary_grades.get(employee['salary_grade_id'])
+        if not salary_grade:
+            result.fail('salary_grade', f"{employee_display_name(employee)}: Update salary grade details (grade/step/amount)")
+            return result
+
+        basic_salary = float(salary_grade['amount'])
+
+        # compute tax relief
+        tax_relief = float(employee['tax_relief'] or 0)
+        if tax_relief > 0:
+            tax_relief = (self.payment_rate * tax_relief) / 100
+
+        # Check if employee has bank details
+        bank = inputs.banks.get(employee['bank_id'])
+        if not bank:
+            result.fail('bank', f"{employee_display_name(employee)}: Update bank details (bank/account number/branch etc)")
+            return result
+
+        # compute for employee & employer ssnits
+        employer_ssnit = (basic_salary * 13) / 100
+        employee_ssnit = (basic_salary * 5.5) / 100
+
+        # Salary items
+        for staff_item in inputs.salary_items.get(employee['id'], []):
+            item_amount = float(staff_item['amount'])
+
+            if staff_item['salary_item__effect'] == 'addition':
+                item_entry = 'debit'
+                staff_total_earnings += item_amount
+            else:
+                item_entry = 'credit'
+                staff_total_deductions += item_amount
+
+            result.add_item('salary_item', item_amount, item_entry, dependency=staff_item['salary_item_id'], salary_item_id=staff_item['salary_item_id'])
+
+        # Credit unions
+        for staff_credit_union in inputs.credit_unions.get(employee['id'], []):
+            monthly_deduction = float(staff_credit_union['amount'])
+            result.union_deductions.append((staff_credit_union['id'], staff_credit_union['amount']))
+
+            staff_total_deductions += monthly_deduction
+            result.add_item('credit_union', monthly_deduction, 'credit', description=staff_credit_union['credit_union__union_name'], dependency=staff_credit_union['credit_union_id'], credit_union_id=staff_credit_union['credit_union_id'])
+
+        # Loans
+        for loan in inputs.loans.get(employee['id'], []):
+            """pay monthly installment if outstanding balance is greater else pay what it is left. This is because there is a posibility for employee to pay some using other means (like bank transfer/pay-in-slip) apart from payroll"""
+            repayment_amount = float(min(loan['installment'], loan['outstanding_balance']))
+
+            staff_total_deductions += repayment_amount
+            result.add_item('loan', repayment_amount, 'credit', description=Loan.LoanType(loan['loan_type']).label, dependency=loan['id'], loan_id=loan['id'])
+
+        # save earnings and deductions
+        result.add_item('earning', staff_total_earnings, 'debit')
+        result.add_item('deduction', staff_total_deductions, 'credit')
+
+        """add total staff earnings to basic salary which will be gross/taxable.."""
+        gross = basic_salary + staff_total_earnings
+
+        result.salary_grade = salary_grade
+        result.bank = bank
+        result.basic_salary = basic_salary
+        result.gross = gross
+        result.taxable = gross - employee_ssnit - tax_relief
+        result.tax_relief = tax_relief
+        result.employer_ssnit = employer_ssnit
+        result.employee_ssnit = employee_ssnit
+        result.total_deductions = staff_total_deductions
+        return result
+
+    def settle_employee(self, result, income_tax):
+        """Apply income tax to a computed employee and record the remaining payroll lines"""
+        employee = result.employee
+
+        # Add tax and employee ssnit to staff total deductions
+        staff_total_deductions = result.total_deductions + income_tax + result.employee_ssnit
+
+        net = result.gross - staff_total_deductions
+
+        total_debit = result.gross
+        total_credit = net + staff_total_deductions
+
+        result.add_item('net_salary', net, 'credit')
+        result.add_item('gross_salary', result.gross, 'credit')
+        result.add_item('taxability', result.taxable, 'credit')
+        result.add_item('bank', net, 'credit', dependency=result.bank['id'], bank_id=result.bank['id'])
+        result.add_item('basic_salary', result.basic_salary, 'debit')
+        result.add_item('salary_grade', dependency=result.salary_grade['id'])
+        result.add_item('step', dependency=result.salary_grade['grade_step_id'])
+        result.add_item('tax', income_tax, 'credit')
+        result.add_item('employer_ssnit', result.employer_ssnit, 'credit')
+        result.add_item('employee_ssnit', result.employee_ssnit, 'credit')
+        result.add_item('tax_relief', result.tax_relief, 'debit')
+
+        logger.debug(f"Employee: {employee_display_name(employee)} Total Credit: {total_credit} - Total Debit: {total_debit}")
+
+        """Test double entry, amounts are persisted to 2 decimal places so compare at that precision"""
+        if round(total_credit, 2) != round(total_debit, 2):
+            msg = f"{employee_display_name(employee)}: Total credit {total_credit} differs from debit {total_debit}"
+            logger.warning(msg)
+            result.fail('double_entry', msg)
+
+
+def compute_shard(payment_rate, inputs):
+    """Compute one shard of a payroll, runs inside the worker processes"""
+    return PayrollCalculator(payment_rate).compute(inputs)
+
+
+class PayrollEngine:
+    """
+    Computes a payroll for a queryset of employees.
+
+    With more than one worker (the PAYROLL_WORKERS setting by default) and a large enough
+    population, the loaded inputs are split into contiguous employee id ranges that are
+    computed in a process pool and merged back in id order, giving the same result as the
+    serial path.
+
+    Usage:
+        result = PayrollEngine(payroll, employees).run()
+        PayrollItem.objects.bulk_create(result.build_items(payroll))
+    """
+
+    # Below this many employees process start-up costs more than it saves
+    parallel_threshold = PAYROLL_PARALLEL_MIN_EMPLOYEES
+
+    def __init__(self, payroll, employees, today=None, workers=None):
+        self.payroll = payroll
+        self.employees = employees
+        self.today = today or date.today()
+        self.workers = get_worker_count(workers)
+        self.timings = {}
+
+    def run(self):
+        started = time.perf_counter()
+        inputs = PayrollInputs.load(self.employees, self.payroll.process_year, self.today, self.payroll.process_month)
+        loaded = time.perf_counter()
+
+        if self.workers > 1 and len(inputs.employees) >= self.parallel_threshold:
+            results = self.compute_parallel(inputs)
+        else:
+            results = PayrollCalculator(self.payroll.payment_rate).compute(inputs)
+
+        self.timings['load'] = round(loaded - started, 3)
+        self.timings['compute'] = round(time.perf_counter() - loaded, 3)
+        return PayrollResult(results, self.today)
+
+    def compute_parallel(self, inputs):
+        shards = inputs.shard(self.workers)
+        with process_pool(len(shards)) as executor:
+            shard_results = executor.map(compute_shard, [self.payroll.payment_rate] * len(shards), shards)
+            return [result for results in shard_results for result in results]
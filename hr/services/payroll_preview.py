@@ -0,0 +1,80 @@
+"""
+Payroll preview.
+
+Runs the payroll engine for the submitted filters and aggregates the outcome in memory,
+so payroll officers can check totals and missing employee details before processing.
+Nothing is written to the database.
+"""
+from collections import defaultdict
+
+from hr.models.payroll import PayrollError
+from hr.services.payroll_engine import PayrollEngine
+
+PREVIEW_TOTALS = ('gross', 'net', 'tax', 'employee_ssnit', 'employer_ssnit')
+
+NO_DEPARTMENT = 'No Department'
+
+
+def _empty_totals():
+    totals = {field: 0.0 for field in PREVIEW_TOTALS}
+    totals['employees'] = 0
+    return totals
+
+
+def _add_to(totals, figures):
+    for field in PREVIEW_TOTALS:
+        totals[field] += figures[field]
+    totals['employees'] += 1
+
+
+def _rounded(totals):
+    return {key: round(value, 2) if isinstance(value, float) else value for key, value in totals.items()}
+
+
+def preview_payroll(payroll, employees):
+    """
+    Compute `payroll` for the `employees` queryset and return the aggregate
+    gross/net/tax/SSNIT overall, per bank and per department, along with the
+    errors that processing would record.
+    """
+    engine = PayrollEngine(payroll, employees)
+    result = engine.run()
+
+    departments = dict(employees.values_list('id', 'job__department__department_name'))
+    error_categories = dict(PayrollError.ERROR_CATEGORY)
+
+    overall = _empty_totals()
+    by_bank = defaultdict(_empty_totals)
+    by_department = defaultdict(_empty_totals)
+
+    for employee_result in result.valid_results:
+        items = {item['item_type']: item['amount'] for item in employee_result.items}
+        figures = {
+            'gross': items['gross_salary'],
+            'net': items['net_salary'],
+            'tax': items['tax'],
+            'employee_ssnit': items['employee_ssnit'],
+            'employer_ssnit': items['employer_ssnit'],
+        }
+        _add_to(overall, figures)
+        _add_to(by_bank[employee_result.bank['bank_name']], figures)
+        _add_to(by_department[departments.get(employee_result.employee['id']) or NO_DEPARTMENT], figures)
+
+    errors = [
+        {
+            'employee': employee_result.employee['id'],
+            'category': error_categories.get(employee_result.error_category, employee_result.error_category),
+            'message': employee_result.error_message,
+        }
+        for employee_result in result.employee_results
+        if not employee_result.is_valid
+    ]
+
+    return {
+        'employee_count': result.employee_count,
+        'totals': _rounded(overall),
+        'banks': {bank: _rounded(totals) for bank, totals in sorted(by_bank.items())},
+        'departments': {department: _rounded(totals) for department, totals in sorted(by_department.items())},
+        'errors': errors,
+        'timings': engine.timings,
+    }
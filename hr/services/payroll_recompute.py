@@ -0,0 +1,63 @@
+"""
+Incremental payroll re-runs.
+
+A processed payroll stores a fingerprint of each employee's inputs on their payroll summary.
+Recomputing a payroll runs the engine for everyone in it, compares the fresh fingerprints with
+the stored ones and only deletes and regenerates the payroll items of employees whose inputs changed or who were
+previously left out with a PayrollError. Rows of unchanged employees are not touched.
+"""
+import logging
+
+from django.db import transaction
+
+from hr.models.employee import Employee
+from hr.models.payroll import PayrollEmployeeSummary, PayrollError, PayrollItem, StaffCreditUnionDeduction
+from hr.services.payroll_engine import PayrollEngine, PayrollResult
+
+logger = logging.getLogger(__name__)
+
+# Number of payroll items written per INSERT statement
+PAYROLL_BATCH_SIZE = 1000
+
+
+def recompute_payroll(payroll):
+    """
+    Regenerate the payroll items and credit union deductions of employees in `payroll` whose inputs
+    changed since it was processed.
+
+    Returns a dict with the number of `recomputed`, `unchanged` and `errors` employees.
+    """
+    item_employees = PayrollItem.objects.filter(payroll=payroll).values_list('employee_id', flat=True)
+    error_employees = set(PayrollError.objects.filter(payroll=payroll).values_list('employee_id', flat=True))
+    employees = Employee.objects.filter(id__in=set(item_employees) | error_employees)
+
+    stored_fingerprints = dict(PayrollEmployeeSummary.objects.filter(payroll=payroll).values_list('employee_id', 'input_fingerprint'))
+
+    result = PayrollEngine(payroll, employees).run()
+
+    changed = [
+        employee_result for employee_result in result.employee_results
+        if employee_result.employee['id'] in error_employees
+        or stored_fingerprints.get(employee_result.employee['id']) != employee_result.fingerprint
+    ]
+    changed_result = PayrollResult(changed, result.process_date)
+    changed_ids = [employee_result.employee['id'] for employee_result in changed]
+
+    with transaction.atomic():
+        PayrollItem.objects.filter(payroll=payroll, employee_id__in=changed_ids).delete()
+        PayrollError.objects.filter(payroll=payroll, employee_id__in=changed_ids).delete()
+        PayrollEmployeeSummary.objects.filter(payroll=payroll, employee_id__in=changed_ids).delete()
+        StaffCreditUnionDeduction.objects.filter(payroll=payroll, staff_credit_union__employee_id__in=changed_ids).delete()
+
+        PayrollItem.objects.bulk_create(changed_result.build_items(payroll), batch_size=PAYROLL_BATCH_SIZE)
+        PayrollEmployeeSummary.objects.bulk_create(changed_result.build_summaries(payroll), batch_size=PAYROLL_BATCH_SIZE)
+        StaffCreditUnionDeduction.objects.bulk_create(changed_result.build_union_deductions(payroll), batch_size=PAYROLL_BATCH_SIZE)
+        PayrollError.objects.bulk_create(changed_result.build_errors(payroll))
+
+    summary = {
+        'recomputed': len(changed),
+        'unchanged': result.employee_count - len(changed),
+        'errors': len(changed_result.errors),
+    }
+    logger.info(f"{payroll} recomputed: {summary}")
+    return summary
@@ -0,0 +1,195 @@
+"""
+Background payroll runs.
+
+The process payroll form only enqueues a PayrollRun with the submitted parameters. The
+`process_payroll_runs` management command claims queued runs, computes them with the payroll
+engine and writes the payroll items in employee chunks, each chunk in its own short transaction,
+so no request has to wait on a full run and row locks are only held for one chunk at a time.
+Until its run completes the payroll is hidden from the payroll views (`Payroll.objects.completed()`),
+and runs left running longer than `PAYROLL_RUN_TIMEOUT` (their worker died) are failed and their
+partial payroll discarded before the next run is claimed.
+"""
+from datetime import timedelta
+import logging
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, transaction
+from django.utils import timezone
+
+from hr.models.employee import Department, Designation, Employee
+from hr.models.payroll import (
+    Payroll, PayrollEmployeeSummary, PayrollError, PayrollItem, PayrollRun, SalaryGrade, SalaryStep, StaffCreditUnionDeduction,
+)
+from hr.services.eligibility import filter_employees
+from hr.services.payroll_engine import PayrollEngine
+
+logger = logging.getLogger(__name__)
+
+# Number of employees whose payroll items are committed per transaction
+PAYROLL_CHUNK_SIZE = 500
+
+PAYROLL_FIELDS = ('process_month', 'process_year', 'description', 'condition', 'error_mode', 'payment_rate')
+
+PAYROLL_FILTERS = {
+    'step': SalaryStep,
+    'salary_grade': SalaryGrade,
+    'designation': Designation,
+    'department': Department,
+    'applicable_to': Employee,
+    'excluded_from': Employee,
+}
+
+
+def enqueue_payroll_run(cleaned_data, user=None):
+    """Queue a payroll run from the cleaned data of a PayrollForm"""
+    parameters = {field: cleaned_data.get(field) for field in PAYROLL_FIELDS}
+    for name in PAYROLL_FILTERS:
+        parameters[name] = list(cleaned_data[name].values_list('id', flat=True))
+
+    return PayrollRun.objects.create(
+        parameters=parameters,
+        error_mode=parameters['error_mode'],
+        requested_by=user if user is not None and user.is_authenticated else None,
+    )
+
+
+def get_run_filter_data(run):
+    """Rebuild PayrollForm-like cleaned data (M2M filters as querysets) from a run's parameters"""
+    data = {field: run.parameters.get(field) for field in PAYROLL_FIELDS}
+    for name, model in PAYROLL_FILTERS.items():
+        data[name] = model.objects.filter(id__in=run.parameters.get(name) or [])
+    return data
+
+
+def fail_stale_runs(now=None):
+    """Fail runs left running past PAYROLL_RUN_TIMEOUT and discard their partial payrolls, returns the number failed"""
+    now = now or timezone.now()
+    cutoff = now - timedelta(seconds=settings.PAYROLL_RUN_TIMEOUT)
+    stale = list(PayrollRun.objects.filter(status=PayrollRun.Status.RUNNING, started_at__lt=cutoff).values_list('id', flat=True))
+    if not stale:
+        return 0
+
+    with transaction.atomic():
+        # items, summaries, errors and deductions cascade with the payroll
+        Payroll.objects.filter(runs__id__in=stale).delete()
+        failed = PayrollRun.objects.filter(id__in=stale, status=PayrollRun.Status.RUNNING).update(
+            status=PayrollRun.Status.FAILED, message="Payroll run was abandoned before it completed. Please process it again", finished_at=now,
+        )
+    logger.warning(f"Failed {failed} abandoned payroll run(s): {stale}")
+    return failed
+
+
+def claim_next_run():
+    """
+    Mark the oldest queued run as running and return it, or None when the queue is empty.
+    Claiming is a conditional UPDATE so concurrent workers never pick the same run.
+    Abandoned runs are failed first so their payrolls do not block the queue.
+    """
+    fail_stale_runs()
+    for run_id in PayrollRun.objects.filter(status=PayrollRun.Status.QUEUED).order_by('created_at').values_list('id', flat=True):
+        claimed = PayrollRun.objects.filter(id=run_id, status=PayrollRun.Status.QUEUED).update(
+            status=PayrollRun.Status.RUNNING, started_at=timezone.now()
+        )
+        if claimed:
+            return PayrollRun.objects.get(id=run_id)
+    return None
+
+
+class PayrollRunProcessor:
+    """Compute and write a single claimed PayrollRun"""
+
+    def __init__(self, run, chunk_size=PAYROLL_CHUNK_SIZE, workers=None):
+        self.run = run
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.timings = {}
+
+    def process(self):
+        started = time.perf_counter()
+        payroll = None
+        try:
+            data = get_run_filter_data(self.run)
+            payroll = Payroll(**{field: data[field] for field in PAYROLL_FIELDS})
+
+            eligible_employees = filter_employees(Payroll, data)
+            if not eligible_employees.exists():
+                return self.fail('Your selected filters did not match any employees. Please adjust and try again.')
+
+            engine = PayrollEngine(payroll, eligible_employees, workers=self.workers)
+            result = engine.run()
+            self.timings.update(engine.timings)
+
+            errors = result.errors
+            self.update(total=result.employee_count, error_count=len(errors))
+
+            # Strict mode: abort and report the errors, nothing else is written
+            if self.run.error_mode == 'strict' and errors:
+                logger.warning(f"Strict mode aborted due to {len(errors)} error(s).")
+                return self.fail(f"Payroll aborted due to {len(errors)} error(s)", errors=errors)
+
+            write_started = time.perf_counter()
+            with transaction.atomic():
+                payroll.save()
+                for name in PAYROLL_FILTERS:
+                    getattr(payroll, name).set(data[name])
+
+                # Mute mode: errors saved for later reference
+                if errors:
+                    PayrollError.objects.bulk_create(result.build_errors(payroll))
+
+                # log credit union deductions, only once the payroll itself is written
+                StaffCreditUnionDeduction.objects.bulk_create(result.build_union_deductions(payroll), batch_size=self.chunk_size)
+                self.update(payroll=payroll, processed=len(errors))
+
+            processed = len(errors)
+            valid_results = result.valid_results
+            for start in range(0, len(valid_results), self.chunk_size):
+                chunk = valid_results[start:start + self.chunk_size]
+                with transaction.atomic():
+                    PayrollItem.objects.bulk_create(result.build_items(payroll, chunk))
+                    PayrollEmployeeSummary.objects.bulk_create(result.build_summaries(payroll, chunk))
+                    processed += len(chunk)
+                    self.update(processed=processed)
+            self.timings['write'] = round(time.perf_counter() - write_started, 3)
+
+            if errors:
+                success_message = f"Payroll processed {result.employee_count} employee(s) successfully with {len(errors)} warning(s)"
+            else:
+                success_message = f"Payroll processed {result.employee_count} employee(s) successfully"
+            logger.info(success_message)
+
+            self.timings['total'] = round(time.perf_counter() - started, 3)
+            self.update(status=PayrollRun.Status.COMPLETED, message=success_message, timings=self.timings, finished_at=timezone.now())
+
+        except IntegrityError as e:
+            logger.error(e)
+            self.discard(payroll)
+            self.fail("An error occured during processing. Please try again later")
+        except DatabaseError as e:
+            logger.error(e)
+            self.discard(payroll)
+            self.fail('A database error occured while processing payroll. Please try again later')
+        except Exception as e:
+            logger.exception(e)
+            self.discard(payroll)
+            self.fail("An unexpected error occured while processing payroll. Please contact system admin")
+
+        return self.run
+
+    def update(self, **fields):
+        for field, value in fields.items():
+            setattr(self.run, field, value)
+        PayrollRun.objects.filter(id=self.run.id).update(**fields)
+
+    def fail(self, message, errors=None):
+        self.update(
+            status=PayrollRun.Status.FAILED, message=message, errors=list(errors or []),
+            timings=self.timings, finished_at=timezone.now(),
+        )
+        return self.run
+
+    def discard(self, payroll):
+        """Remove a partially written payroll, its items and errors cascade with it"""
+        if payroll is not None and payroll.pk:
+            Payroll.objects.filter(id=payroll.pk).delete()
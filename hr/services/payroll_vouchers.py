@@ -0,0 +1,100 @@
+"""
+Bank payment voucher totals of a payroll.
+
+All the totals come from a single grouped query over the payroll's items, keyed by
+(bank, item_type, entry, salary_item, credit_union, loan_type), and are reshaped per bank
+in Python. Posted payrolls no longer change, so their totals are cached indefinitely.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Sum
+
+from hr.models.payroll import Loan, PayrollItem
+
+CACHE_KEY = 'hr:payroll-vouchers:{id}:{updated_at}'
+
+
+def _voucher(bank_name):
+    return {
+        'bank_name': bank_name,
+        'bank_balance': 0,
+        'earning_salary_items': [],
+        'deduction_salary_items': [],
+        'credit_unions': [],
+        'loans': [],
+        'total_employee_ssnit': 0,
+        'total_employer_ssnit': 0,
+        'total_tax': 0,
+        'total_tax_relief': 0,
+        'total_basic_salaries': 0,
+    }
+
+
+def compute_voucher_totals(payroll):
+    """Return the voucher totals of every bank in `payroll`, ordered by bank name"""
+    rows = PayrollItem.objects.filter(payroll=payroll, employee__bank__isnull=False).values(
+        'employee__bank_id', 'employee__bank__bank_name', 'item_type', 'entry', 'bank_id',
+        'salary_item__id', 'salary_item__alias_name', 'credit_union__id', 'credit_union__union_name', 'loan__loan_type',
+    ).annotate(total=Sum('amount')).order_by()
+
+    vouchers = {}
+    loans = defaultdict(lambda: defaultdict(Decimal))
+    for row in rows:
+        bank_id = row['employee__bank_id']
+        voucher = vouchers.setdefault(bank_id, _voucher(row['employee__bank__bank_name']))
+        item_type = row['item_type']
+        total = row['total'] or 0
+
+        if item_type == 'bank' and row['bank_id'] == bank_id:
+            voucher['bank_balance'] += total
+        elif item_type == 'salary_item':
+            key = 'earning_salary_items' if row['entry'] == 'debit' else 'deduction_salary_items'
+            voucher[key].append({'salary_item__id': row['salary_item__id'], 'salary_item__alias_name': row['salary_item__alias_name'], 'total': total})
+        elif item_type == 'credit_union':
+            voucher['credit_unions'].append({'credit_union__id': row['credit_union__id'], 'credit_union__union_name': row['credit_union__union_name'], 'total': total})
+        elif item_type == 'loan':
+            loans[bank_id][row['loan__loan_type']] += total
+        elif item_type == 'employee_ssnit':
+            voucher['total_employee_ssnit'] += total
+        elif item_type == 'employer_ssnit':
+            voucher['total_employer_ssnit'] += total
+        elif item_type == 'tax':
+            voucher['total_tax'] += total
+        elif item_type == 'tax_relief':
+            voucher['total_tax_relief'] += total
+        elif item_type == 'basic_salary':
+            voucher['total_basic_salaries'] += total
+
+    for bank_id, voucher in vouchers.items():
+        voucher['loans'] = [
+            {'loan_type': Loan.LoanType(loan_type).label if loan_type else 'N/A', 'total': total}
+            for loan_type, total in sorted(loans[bank_id].items(), key=lambda loan: loan[0] or '')
+        ]
+        voucher['total_earning_salary_items'] = sum(si['total'] for si in voucher['earning_salary_items'])
+        voucher['total_deduction_salary_items'] = sum(si['total'] for si in voucher['deduction_salary_items'])
+        voucher['total_credit_unions'] = sum(cu['total'] for cu in voucher['credit_unions'])
+        voucher['total_loans'] = sum(loan['total'] for loan in voucher['loans'])
+
+        voucher['total_debit'] = voucher['total_earning_salary_items'] + voucher['total_basic_salaries'] + voucher['total_tax_relief'] + voucher['total_employer_ssnit']
+        voucher['total_credit'] = (
+            voucher['bank_balance'] + voucher['total_deduction_salary_items'] + voucher['total_credit_unions'] + voucher['total_loans']
+            + voucher['total_employee_ssnit'] + voucher['total_tax'] + voucher['total_employer_ssnit']
+        )
+
+    return sorted(vouchers.values(), key=lambda voucher: voucher['bank_name'])
+
+
+def get_voucher_totals(payroll):
+    """Voucher totals of `payroll`, served from the cache once the payroll is posted"""
+    if not payroll.posted:
+        return compute_voucher_totals(payroll)
+
+    # posting (or any later change) saves the payroll and bumps updated_at, which retires the old key
+    key = CACHE_KEY.format(id=payroll.id, updated_at=payroll.updated_at.timestamp())
+    vouchers = cache.get(key)
+    if vouchers is None:
+        vouchers = compute_voucher_totals(payroll)
+        cache.set(key, vouchers, None)
+    return vouchers
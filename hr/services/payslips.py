@@ -0,0 +1,168 @@
+"""
+Payslips.
+
+`build_payslip_context` turns an employee's payroll items into the context of
+`core/document/payslip_printout.html`. `stream_payslip_zip` exports the payslips of a whole
+payroll: employees are handled in chunks, each chunk's items are loaded in one query and the
+payslips are rendered by a process pool, and the ZIP is streamed out as it is written so
+memory stays bounded by a single chunk.
+"""
+import logging
+import zipfile
+
+from django.template.loader import render_to_string
+
+from hr.models.employee import Employee
+from hr.models.payroll import Loan, PayrollItem
+from hr.services.workers import get_worker_count, process_pool
+
+logger = logging.getLogger(__name__)
+
+PAYSLIP_TEMPLATE = 'core/document/payslip_printout.html'
+
+PAYSLIP_ITEM_FIELDS = (
+    'employee_id', 'item_type', 'entry', 'amount',
+    'salary_item__alias_name', 'loan__loan_type', 'credit_union__union_name',
+)
+
+# Number of employees whose payslips are loaded and rendered at a time
+PAYSLIP_CHUNK_SIZE = 200
+
+
+def build_payslip_context(payroll, employee, items):
+    """Build the payslip context of `employee` from their payroll items (dicts of PAYSLIP_ITEM_FIELDS)"""
+    earnings = []
+    deductions = []
+    basic_salary = None;  tax_relief = None
+
+    tax = {}; ssnit = {}; loans = []; unions = []; other_deductions = []
+
+    for item in items:
+        item_type = item['item_type']
+        entry = item['entry']
+        amount = item['amount']
+        # retrieve all items with type 'salary item'
+        if item_type == 'salary_item' and entry == 'debit':
+            earnings.append({'item':item['salary_item__alias_name'], 'amount':amount })
+
+        # for items of type tax, ssnit, loan etc with a credit entry, these are deductions
+        elif item_type == 'tax':
+            tax = {'item':'Income Tax', 'amount':amount }
+        elif item_type == 'employee_ssnit':
+             ssnit = {'item':'SSNIT (Employee)', 'amount':amount}
+        elif item_type == 'loan':
+             loans.append({'item': f"Loan ({ Loan.LoanType(item['loan__loan_type']).label })", 'amount':amount})
+        elif item_type == 'credit_union':
+             unions.append({'item':f"{item['credit_union__union_name']}", 'amount':amount})
+        elif item_type == 'salary_item' and entry == 'credit':
+             other_deductions.append({'item':item['salary_item__alias_name'], 'amount':amount })
+        elif item_type == 'basic_salary':
+             basic_salary = amount
+        elif item_type == 'tax_relief':
+            tax_relief = amount
+
+    # Ensure deduction_list are arranged in this order; tax, ssnit, loan, credit union an
+    deductions.extend(filter(None, [tax, ssnit]))
+    deductions.extend(loans)
+    deductions.extend(unions)
+    deductions.extend(other_deductions)
+
+    # make the basic salary first item in the earning list
+    if basic_salary is not None:
+        earnings.insert(0, {'item':'Basic Salary', 'amount':basic_salary})
+
+    # compute for annual salary
+    annual_salary = (basic_salary * 12) if basic_salary is not None else None
+
+    gross_salary = sum(item['amount'] for item in earnings)
+    total_deductions = sum(item['amount'] for item in deductions)
+    net_salary = gross_salary - total_deductions
+
+    return {
+        'title':f"Staff Payslip",
+        'payroll':payroll,
+        'employee':employee,
+        'earnings':earnings,
+        'deductions':deductions,
+        'gross_salary':gross_salary,
+        'net_salary':net_salary,
+        'annual_salary':annual_salary,
+        'tax_relief':tax_relief,
+        'total_deductions':total_deductions
+    }
+
+
+def payslip_filename(payroll, employee):
+    return f"payslip_{employee.employee_id}_{payroll.process_year}_{payroll.process_month}.html"
+
+
+def render_payslip(payslip):
+    """Render one (filename, context) payslip, runs inside the worker processes"""
+    filename, context = payslip
+    return filename, render_to_string(PAYSLIP_TEMPLATE, context)
+
+
+def iter_payslip_contexts(payroll, chunk_size=PAYSLIP_CHUNK_SIZE):
+    """Yield lists of (filename, context) for the employees of `payroll`, one chunk of employees at a time"""
+    employee_ids = list(Employee.objects.filter(
+        id__in=PayrollItem.objects.filter(payroll=payroll).values('employee_id')
+    ).order_by('employee_id').values_list('id', flat=True))
+    employees = Employee.objects.select_related('designation', 'job__department', 'bank').order_by('employee_id')
+
+    for start in range(0, len(employee_ids), chunk_size):
+        chunk_ids = employee_ids[start:start + chunk_size]
+
+        items = {}
+        for item in PayrollItem.objects.filter(payroll=payroll, employee_id__in=chunk_ids).order_by('id').values(*PAYSLIP_ITEM_FIELDS):
+            items.setdefault(item['employee_id'], []).append(item)
+
+        yield [
+            (payslip_filename(payroll, employee), build_payslip_context(payroll, employee, items.get(employee.id, [])))
+            for employee in employees.filter(id__in=chunk_ids)
+        ]
+
+
+def iter_payslips(payroll, workers=None, chunk_size=PAYSLIP_CHUNK_SIZE):
+    """Yield (filename, html) for every payslip of `payroll`, rendered by `workers` processes"""
+    workers = get_worker_count(workers)
+
+    if workers <= 1:
+        for payslips in iter_payslip_contexts(payroll, chunk_size):
+            yield from map(render_payslip, payslips)
+        return
+
+    with process_pool(workers) as executor:
+        for payslips in iter_payslip_contexts(payroll, chunk_size):
+            yield from executor.map(render_payslip, payslips, chunksize=max(1, len(payslips) // workers))
+
+
+class _StreamBuffer:
+    """Write-only file object whose contents are handed out and cleared as the ZIP is written"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_payslip_zip(payroll, workers=None, chunk_size=PAYSLIP_CHUNK_SIZE):
+    """Yield the bytes of a ZIP archive holding every payslip of `payroll`"""
+    buffer = _StreamBuffer()
+    count = 0
+    with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for filename, html in iter_payslips(payroll, workers, chunk_size):
+            archive.writestr(filename, html)
+            count += 1
+            yield buffer.drain()
+    yield buffer.drain()
+    logger.info(f"Exported {count} payslip(s) for {payroll}")
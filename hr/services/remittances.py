@@ -0,0 +1,101 @@
+"""
+Credit union remittances of a payroll.
+
+Every month the deductions of each credit union (or welfare group) are remitted to it with a list
+of the members they were taken from. The source of truth is the credit union deduction log
+(`StaffCreditUnionDeduction`), whose rows are linked to the payroll that deducted them: the
+remittance is one grouped query over the payroll's deductions, summing each member's amounts per
+union; member counts and union totals are added up from those lines in Python. Posted payrolls no
+longer change, so their remittances are cached indefinitely (and computed when the payroll is
+posted), and exports are produced from the cached lines without touching the database.
+"""
+import csv
+from decimal import Decimal
+import io
+
+from django.core.cache import cache
+from django.db.models import F, Sum
+
+import openpyxl
+
+from hr.models.payroll import StaffCreditUnionDeduction
+
+CENT = Decimal('0.01')
+
+CACHE_KEY = 'hr:payroll-remittances:{id}:{updated_at}'
+
+COLUMNS = ('Credit Union', 'Staff ID', 'Staff Name', 'Amount')
+
+
+def compute_remittances(payroll):
+    """Remittance of every credit union in `payroll`, ordered by union name"""
+    rows = StaffCreditUnionDeduction.objects.filter(payroll=payroll).values(
+        credit_union_id=F('staff_credit_union__credit_union_id'), union_name=F('staff_credit_union__credit_union__union_name'),
+        employee_id=F('staff_credit_union__employee__employee_id'), first_name=F('staff_credit_union__employee__first_name'),
+        last_name=F('staff_credit_union__employee__last_name'),
+    ).annotate(amount=Sum('amount_paid')).order_by('union_name', 'employee_id')
+
+    remittances = {}
+    for row in rows:
+        amount = Decimal(row['amount'] or 0).quantize(CENT)
+        remittance = remittances.setdefault(row['credit_union_id'], {
+            'credit_union_id': row['credit_union_id'], 'union_name': row['union_name'], 'members': 0, 'total': Decimal('0.00'), 'lines': [],
+        })
+        remittance['members'] += 1
+        remittance['total'] += amount
+        remittance['lines'].append({
+            'employee_id': row['employee_id'],
+            'name': f"{row['first_name'].capitalize()} {row['last_name'].capitalize()}",
+            'amount': amount,
+        })
+    return list(remittances.values())
+
+
+def get_remittances(payroll, credit_union_id=None):
+    """Remittances of `payroll` (optionally of one union), served from the cache once the payroll is posted"""
+    if not payroll.posted:
+        remittances = compute_remittances(payroll)
+    else:
+        # posting (or any later change) saves the payroll and bumps updated_at, which retires the old key
+        key = CACHE_KEY.format(id=payroll.id, updated_at=payroll.updated_at.timestamp())
+        remittances = cache.get(key)
+        if remittances is None:
+            remittances = compute_remittances(payroll)
+            cache.set(key, remittances, None)
+
+    if credit_union_id is not None:
+        remittances = [remittance for remittance in remittances if remittance['credit_union_id'] == credit_union_id]
+    return remittances
+
+
+def _rows(remittances):
+    yield COLUMNS
+    for remittance in remittances:
+        for line in remittance['lines']:
+            yield remittance['union_name'], line['employee_id'], line['name'], line['amount']
+        yield remittance['union_name'], '', f"Total ({remittance['members']} member(s))", remittance['total']
+
+
+class _Echo:
+    """File-like object handing back what csv.writer writes, so each row can be streamed"""
+
+    def write(self, value):
+        return value
+
+
+def stream_remittance_csv(remittances):
+    """Yield the remittance lines and union totals as CSV, one row at a time"""
+    writer = csv.writer(_Echo())
+    for row in _rows(remittances):
+        yield writer.writerow(row)
+
+
+def remittance_xlsx(remittances):
+    """The remittance lines and union totals as XLSX bytes"""
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Remittance')
+    for row in _rows(remittances):
+        sheet.append(list(row))
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
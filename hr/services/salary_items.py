@@ -0,0 +1,212 @@
+"""
+Bulk staff salary item assignment.
+
+Applying a salary item to its eligible employees used to create (or save) one
+StaffSalaryItem per employee, and factor items looked their dependency up once per employee.
+`SalaryItemAmounts` resolves the dependency once and computes amounts from the basic salary of
+each employee, read in the same query as the employee ids; rows are then written with
+`bulk_create`/`bulk_update` in batches.
+
+A factor item is a percentage of the basic salary or of the employee's own amount of another
+salary item, which may itself be a factor item. `SalaryItemGraph` orders the items so every
+dependency comes first and rejects cycles; `recompute_factor_items` evaluates the factor items
+of many employees in that order in one pass, keeping each item's resolved amounts in an array
+indexed by employee.
+"""
+from decimal import Decimal
+
+from django.db.models import F
+from django.utils import timezone
+
+from hr.models.payroll import SalaryItem, StaffSalaryItem
+
+BATCH_SIZE = 1000
+
+CENT = Decimal('0.01')
+
+
+class DependencyCycleError(Exception):
+    """Raised when factor salary items depend on each other in a loop"""
+
+
+def get_dependency_id(rate_type, rate_dependency):
+    """Id of the salary item a factor item is computed from, None for 'Basic' and other rate types"""
+    if rate_type != 'factor' or rate_dependency in (None, '', 'Basic'):
+        return None
+    try:
+        return int(rate_dependency)
+    except (TypeError, ValueError):
+        return None
+
+
+class SalaryItemGraph:
+    """Dependencies between salary items, an item points to the item its factor is computed from"""
+
+    def __init__(self, items):
+        # {id: {'item_name', 'rate_type', 'rate_amount', 'rate_dependency'}}
+        self.items = items
+        self.dependencies = {item_id: get_dependency_id(item['rate_type'], item['rate_dependency']) for item_id, item in items.items()}
+
+    @classmethod
+    def load(cls):
+        return cls({item['id']: item for item in SalaryItem.objects.values('id', 'item_name', 'rate_type', 'rate_amount', 'rate_dependency')})
+
+    def set_dependency(self, item_id, rate_type, rate_dependency):
+        """Point `item_id` (None for an unsaved item) at a new dependency, as a pending form would"""
+        if item_id is not None:
+            self.dependencies[item_id] = get_dependency_id(rate_type, rate_dependency)
+
+    def order(self, item_ids=None):
+        """
+        Items of `item_ids` (all items by default) and everything they depend on, each item after its
+        dependency. Raises DependencyCycleError when a dependency chain loops back on itself.
+        """
+        ordered = []; done = set()
+        for start in (self.items if item_ids is None else item_ids):
+            path = []
+            item_id = start
+            while item_id is not None and item_id not in done and item_id in self.items:
+                if item_id in path:
+                    names = [self.items[step]['item_name'] for step in path[path.index(item_id):]] + [self.items[item_id]['item_name']]
+                    raise DependencyCycleError(f"Salary items depend on each other in a loop: {' -> '.join(names)}")
+                path.append(item_id)
+                item_id = self.dependencies.get(item_id)
+
+            for step in reversed(path):
+                done.add(step)
+                ordered.append(step)
+        return ordered
+
+    def dependents(self, item_ids):
+        """`item_ids` and every item depending on them directly or through other items"""
+        found = set(item_ids)
+        grown = True
+        while grown:
+            grown = False
+            for item_id, dependency in self.dependencies.items():
+                if dependency in found and item_id not in found:
+                    found.add(item_id); grown = True
+        return found
+
+
+class SalaryItemAmounts:
+    """Amount of a salary item for one employee, by rate type"""
+
+    def __init__(self, salary_item, employees=None):
+        self.rate_type = salary_item.rate_type
+        self.rate_amount = salary_item.rate_amount
+        self.dependency_id = get_dependency_id(salary_item.rate_type, salary_item.rate_dependency)
+
+        # factor items computed from another item use each employee's own amount of it, loaded once
+        self.dependency_amounts = {}
+        if self.dependency_id is not None:
+            rows = StaffSalaryItem.objects.filter(salary_item_id=self.dependency_id)
+            if employees is not None:
+                rows = rows.filter(employee_id__in=employees.values('id'))
+            self.dependency_amounts = dict(rows.values_list('employee_id', 'amount'))
+
+    def amount(self, basic_salary, variable=None, employee_id=None):
+        if self.rate_type == 'fix':
+            return self.rate_amount
+        elif self.rate_type == 'factor':
+            if self.dependency_id is not None:
+                base = self.dependency_amounts.get(employee_id) or Decimal('0')
+            else:
+                base = basic_salary or Decimal('0')
+            return (self.rate_amount / 100) * base
+        # variable items are multiplied by each employee's variable, 0 until one is set
+        return variable * self.rate_amount if variable else 0
+
+
+def assign_salary_item(salary_item, employees):
+    """Create the StaffSalaryItem of `salary_item` for every employee in the `employees` queryset, returns the number created"""
+    amounts = SalaryItemAmounts(salary_item, employees)
+    staff_salary_items = [
+        StaffSalaryItem(salary_item=salary_item, employee_id=employee_id, amount=amounts.amount(basic_salary, employee_id=employee_id))
+        for employee_id, basic_salary in employees.values_list('id', 'salary_grade__amount')
+    ]
+    StaffSalaryItem.objects.bulk_create(staff_salary_items, batch_size=BATCH_SIZE)
+    return len(staff_salary_items)
+
+
+def recalculate_salary_item(salary_item, previous_rate_type, employee_ids=None):
+    """
+    Recompute the amount of existing StaffSalaryItems of `salary_item` after its rate changed,
+    optionally limited to `employee_ids`, and return the number updated
+    """
+    amounts = SalaryItemAmounts(salary_item)
+    staff_salary_items = StaffSalaryItem.objects.filter(salary_item=salary_item).only('id', 'employee_id', 'variable', 'amount')
+    if employee_ids is not None:
+        staff_salary_items = staff_salary_items.filter(employee_id__in=employee_ids)
+    staff_salary_items = staff_salary_items.annotate(basic_salary=F('employee__salary_grade__amount'))
+
+    # bulk_update skips auto_now, so updated_at is set explicitly
+    now = timezone.now()
+    updated = []
+    for staff_salary in staff_salary_items:
+        # reset variable if there is a transition from variable to fix
+        if salary_item.rate_type == 'fix' and previous_rate_type == 'variable':
+            staff_salary.variable = 0
+        staff_salary.amount = amounts.amount(staff_salary.basic_salary, staff_salary.variable, staff_salary.employee_id)
+        staff_salary.updated_at = now
+        updated.append(staff_salary)
+
+    StaffSalaryItem.objects.bulk_update(updated, ['variable', 'amount', 'updated_at'], batch_size=BATCH_SIZE)
+    return len(updated)
+
+
+def recompute_factor_items(item_ids=None, employee_ids=None):
+    """
+    Recompute the factor items in `item_ids` and every item depending on them (all factor items by
+    default) for all employees, or only `employee_ids`, in dependency order. Returns the number of
+    StaffSalaryItems whose amount changed.
+    """
+    graph = SalaryItemGraph.load()
+    targets = set(graph.items) if item_ids is None else graph.dependents(item_ids)
+    targets = {item_id for item_id in targets if graph.items[item_id]['rate_type'] == 'factor'}
+    if not targets:
+        return 0
+    order = graph.order(targets)
+
+    rows = StaffSalaryItem.objects.filter(salary_item_id__in=order)
+    if employee_ids is not None:
+        rows = rows.filter(employee_id__in=employee_ids)
+    rows = rows.values_list('id', 'employee_id', 'salary_item_id', 'amount', 'employee__salary_grade__amount')
+
+    # one array per item, indexed by employee position, holding the row id and resolved amount
+    positions = {}; basic_salaries = []
+    row_ids = {item_id: [] for item_id in order}
+    amounts = {item_id: [] for item_id in order}
+    for row_id, employee_id, item_id, amount, basic_salary in rows:
+        if employee_id not in positions:
+            positions[employee_id] = len(basic_salaries)
+            basic_salaries.append(basic_salary or Decimal('0'))
+            for item in order:
+                row_ids[item].append(None); amounts[item].append(None)
+        index = positions[employee_id]
+        row_ids[item_id][index] = row_id
+        amounts[item_id][index] = amount
+
+    now = timezone.now()
+    changed = []
+    for item_id in order:
+        if item_id not in targets:
+            continue
+        rate = graph.items[item_id]['rate_amount'] / 100
+        dependency = graph.dependencies[item_id]
+        # amounts of the dependency are already resolved, it comes earlier in the order
+        dependency_amounts = amounts.get(dependency)
+        for index, row_id in enumerate(row_ids[item_id]):
+            if row_id is None:
+                continue
+            if dependency is None:
+                base = basic_salaries[index]
+            else:
+                base = (dependency_amounts[index] if dependency_amounts else None) or Decimal('0')
+            amount = (rate * base).quantize(CENT)
+            if amount != amounts[item_id][index]:
+                changed.append(StaffSalaryItem(id=row_id, amount=amount, updated_at=now))
+            amounts[item_id][index] = amount
+
+    StaffSalaryItem.objects.bulk_update(changed, ['amount', 'updated_at'], batch_size=BATCH_SIZE)
+    return len(changed)
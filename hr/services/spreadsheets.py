@@ -0,0 +1,76 @@
+"""
+Streaming CSV/XLSX readers shared by the staff imports.
+
+Files are read row by row (XLSX in openpyxl's read-only mode) and handed to the importers in
+chunks, so an import matches each chunk of staff with one query and writes it with one
+`bulk_update` whatever the size of the file. The first row names the columns.
+"""
+import csv
+import io
+import os
+
+import openpyxl
+
+IMPORT_CHUNK_SIZE = 1000
+
+
+class SpreadsheetError(Exception):
+    """Raised when a file can not be imported at all, row level problems are reported instead"""
+
+
+def _header(cells):
+    return [str(cell).strip().lower().replace(' ', '_') if cell is not None else '' for cell in cells]
+
+
+def _csv_rows(file):
+    yield from csv.reader(io.TextIOWrapper(file, encoding='utf-8-sig', newline=''))
+
+
+def _xlsx_rows(file):
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def read_rows(file, filename, required, optional=()):
+    """
+    Yield (row number, {column: value}) for the data rows of a CSV or XLSX `file`. Every `required`
+    column must be named in the header, `optional` columns are left out of the rows when absent.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.csv':
+        rows = _csv_rows(file)
+    elif extension in ('.xlsx', '.xlsm'):
+        rows = _xlsx_rows(file)
+    else:
+        raise SpreadsheetError(f"Unsupported file type '{extension}', upload a CSV or XLSX file")
+
+    header = _header(next(rows, []))
+    missing = [column for column in required if column not in header]
+    if missing:
+        raise SpreadsheetError(f"The first row must name the {', '.join(repr(column) for column in required)} column(s)")
+    indexes = {column: header.index(column) for column in (*required, *optional) if column in header}
+
+    for number, row in enumerate(rows, start=2):
+        cells = list(row) + [None] * (len(header) - len(row))
+        if not any(cell not in (None, '') for cell in cells):
+            continue
+        yield number, {column: cells[index] for column, index in indexes.items()}
+
+
+def staff_id(value):
+    """Staff ID read from a cell, '' when empty"""
+    return str(value).strip() if value is not None else ''
+
+
+def chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
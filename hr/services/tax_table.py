@@ -0,0 +1,106 @@
+"""
+Precompiled PAYE tax tables.
+
+A year's tax blocks are loaded once and compiled into cumulative thresholds and
+cumulative tax so that the tax on any amount is a bisect lookup plus one
+multiplication. Compiled tables are cached under a version read from the database
+on every lookup (the latest `updated_at`, highest id and count of the year's blocks),
+so any write to the blocks retires the cached table in every process, including the
+long-running payroll worker, without relying on a shared cache.
+"""
+from bisect import bisect_right
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, the batched API falls back to bisect
+    np = None
+
+CACHE_KEY = 'hr:tax-table:{year}:{version}'
+
+# retired versions are never read again, let them expire
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+class TaxTable:
+    """
+    Progressive tax table for a single year.
+
+    Blocks are applied in ascending order of rate: the first `block` of the taxable
+    amount is taxed at the first rate, the next `block` at the second rate and so on.
+    A block left blank (or the last block) is open ended and taxes the remainder.
+    """
+
+    def __init__(self, year, blocks):
+        self.year = year
+        self.blocks = [(block, rate or 0) for block, rate in blocks]
+
+        # lower bound of each band, tax accumulated below that bound and band rate as a fraction
+        self.thresholds = []
+        self.cumulative_tax = []
+        self.rates = []
+
+        lower = 0.0; accumulated = 0.0
+        for block, rate in self.blocks:
+            self.thresholds.append(lower)
+            self.cumulative_tax.append(accumulated)
+            self.rates.append(rate / 100)
+            if block is None:
+                break
+            lower += block
+            accumulated += (rate / 100) * block
+
+        digest = hashlib.sha1(repr((year, self.blocks)).encode()).hexdigest()
+        self.version = digest[:12]
+
+    def __bool__(self):
+        return bool(self.rates)
+
+    def tax(self, amount):
+        """Return the tax on a single taxable amount"""
+        amount = float(amount)
+        if amount <= 0 or not self.rates:
+            return 0.0
+        band = bisect_right(self.thresholds, amount) - 1
+        return self.cumulative_tax[band] + self.rates[band] * (amount - self.thresholds[band])
+
+    def tax_many(self, amounts):
+        """Return the tax on each of `amounts` in one pass"""
+        if np is None or not self.rates:
+            return [self.tax(amount) for amount in amounts]
+
+        amounts = np.asarray(amounts, dtype=float)
+        thresholds = np.asarray(self.thresholds)
+        bands = np.searchsorted(thresholds, amounts, side='right') - 1
+        bands = np.clip(bands, 0, None)
+        taxes = np.asarray(self.cumulative_tax)[bands] + np.asarray(self.rates)[bands] * (amounts - thresholds[bands])
+        return np.where(amounts > 0, taxes, 0.0).tolist()
+
+    @classmethod
+    def load(cls, year):
+        from hr.models.payroll import Tax
+
+        blocks = Tax.objects.filter(year=year).order_by('rate', 'id').values_list('block', 'rate')
+        return cls(year, list(blocks))
+
+
+def tax_blocks_version(year):
+    """Version of the year's tax blocks, changes with every insert, update or delete"""
+    from hr.models.payroll import Tax
+
+    version = Tax.objects.filter(year=year).aggregate(updated_at=Max('updated_at'), last_id=Max('id'), count=Count('id'))
+    updated_at = version['updated_at'].timestamp() if version['updated_at'] else 0
+    return f"{updated_at}-{version['last_id'] or 0}-{version['count']}"
+
+
+def get_tax_table(year):
+    """Return the compiled tax table for `year`, loading it when the year's blocks changed"""
+    key = CACHE_KEY.format(year=year, version=tax_blocks_version(year))
+    table = cache.get(key)
+    if table is None:
+        table = TaxTable.load(year)
+        cache.set(key, table, CACHE_TIMEOUT)
+    return table
@@ -0,0 +1,90 @@
+"""
+Spreadsheet import of variable salary item quantities.
+
+Variable items (overtime hours and the like) pay `variable * rate_amount`. Instead of typing
+every quantity into the set-variable form, a CSV or XLSX file with `employee_id` and `variable`
+columns is streamed row by row. Each chunk of rows is matched to staff through one `in_bulk`
+lookup on the staff ID, and the amounts are written with `bulk_update`. Invalid rows are
+reported with their row number and skipped, they do not abort the rest of the file.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.utils import timezone
+
+from hr.models.employee import Employee
+from hr.models.payroll import StaffSalaryItem
+from hr.services.salary_items import recompute_factor_items
+from hr.services.spreadsheets import IMPORT_CHUNK_SIZE, SpreadsheetError, chunks, read_rows, staff_id
+
+EMPLOYEE_COLUMN = 'employee_id'
+VARIABLE_COLUMN = 'variable'
+
+
+class VariableImportError(SpreadsheetError):
+    """Raised when variables are imported for a salary item that is not a variable item"""
+
+
+def iter_rows(file, filename):
+    """Yield (row number, employee_id, variable) for the data rows of a CSV or XLSX `file`"""
+    for number, values in read_rows(file, filename, (EMPLOYEE_COLUMN, VARIABLE_COLUMN)):
+        yield number, staff_id(values[EMPLOYEE_COLUMN]), values[VARIABLE_COLUMN]
+
+
+def parse_variable(value):
+    """Whole, non negative quantity from a spreadsheet cell, raises ValueError otherwise"""
+    try:
+        number = Decimal(str(value).strip())
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"'{value}' is not a number")
+    if number != number.to_integral_value():
+        raise ValueError(f"'{value}' is not a whole number")
+    if number < 0:
+        raise ValueError(f"'{value}' can not be negative")
+    return int(number)
+
+
+def import_variables(salary_item, file, filename, chunk_size=IMPORT_CHUNK_SIZE):
+    """
+    Set the variables of `salary_item` from a spreadsheet, returns
+    {'updated': count, 'errors': [{'row', 'employee_id', 'message'}]}
+    """
+    if salary_item.rate_type != 'variable':
+        raise VariableImportError(f"{salary_item} is not a variable salary item")
+
+    updated = 0; errors = []
+    now = timezone.now()
+    for chunk in chunks(iter_rows(file, filename), chunk_size):
+        employees = Employee.objects.in_bulk([employee_id for _, employee_id, _ in chunk if employee_id], field_name='employee_id')
+        staff_salary_items = {
+            staff_salary.employee_id: staff_salary
+            for staff_salary in StaffSalaryItem.objects.filter(salary_item=salary_item, employee__in=employees.values()).only('id', 'employee_id')
+        }
+
+        changed = {}
+        for number, employee_id, value in chunk:
+            employee = employees.get(employee_id)
+            if employee is None:
+                errors.append({'row': number, 'employee_id': employee_id, 'message': "Unknown staff ID"})
+                continue
+            staff_salary = staff_salary_items.get(employee.id)
+            if staff_salary is None:
+                errors.append({'row': number, 'employee_id': employee_id, 'message': f"{employee} is not eligible for {salary_item}"})
+                continue
+            try:
+                variable = parse_variable(value)
+            except ValueError as e:
+                errors.append({'row': number, 'employee_id': employee_id, 'message': str(e)})
+                continue
+
+            staff_salary.variable = variable
+            staff_salary.amount = variable * salary_item.rate_amount
+            staff_salary.updated_at = now
+            # a staff ID repeated in the file keeps its last value
+            changed[staff_salary.id] = staff_salary
+
+        StaffSalaryItem.objects.bulk_update(changed.values(), ['variable', 'amount', 'updated_at'])
+        updated += len(changed)
+
+    # factor items computed from this item follow the new amounts
+    recompute_factor_items(item_ids=[salary_item.id])
+    return {'updated': updated, 'errors': errors}
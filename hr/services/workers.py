@@ -0,0 +1,26 @@
+"""
+Process pools for CPU bound payroll work.
+
+Workers only receive plain data, but unpickling the task functions imports the hr models,
+so workers started with the spawn method (the default outside Linux) must set up Django
+first. This module deliberately imports nothing from the apps for the same reason.
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+
+def init_worker():
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+def get_worker_count(workers=None):
+    """Explicit worker count, else the PAYROLL_WORKERS setting"""
+    return max(1, workers or getattr(settings, 'PAYROLL_WORKERS', 1))
+
+
+def process_pool(workers):
+    return ProcessPoolExecutor(max_workers=workers, initializer=init_worker)
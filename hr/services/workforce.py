@@ -0,0 +1,127 @@
+"""
+Synthetic workforce generator.
+
+Creates a realistic payroll population (grades and steps, banks, departments, salary items,
+credit unions, loans and a tax table) with bulk inserts, for benchmarking payroll processing
+on a local database. Every generated record is tagged with `prefix` so it never collides
+with real data; the benchmark command runs it inside a transaction that is rolled back.
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+import random
+
+from hr.models.employee import Department, Designation, Employee, Job
+from hr.models.payroll import (
+    Bank, CreditUnion, Loan, SalaryGrade, SalaryItem, SalaryStep, StaffCreditUnion, StaffSalaryItem, Tax,
+)
+
+BATCH_SIZE = 1000
+
+# Monthly PAYE blocks (block, rate) used when the year has no tax table yet
+TAX_BLOCKS = [(490, 0), (110, 5), (130, 10), (3166.67, 17.5), (16000, 25), (30520, 30), (None, 35)]
+
+EARNINGS = ['Transport', 'Housing', 'Utility', 'Risk', 'Responsibility', 'Fuel', 'Overtime', 'Clothing']
+DEDUCTIONS = ['Union Dues', 'Provident Fund', 'Staff Welfare', 'Rent Recovery']
+CREDIT_UNIONS = ['Credit Union', 'Welfare', 'Cooperative', 'Sports Club']
+DEPARTMENTS = ['Finance', 'Human Resource', 'Operations', 'Sales', 'Procurement', 'IT', 'Audit', 'Logistics']
+DESIGNATIONS = ['Assistant', 'Officer', 'Senior Officer', 'Principal Officer', 'Manager', 'Director']
+
+
+def _bulk_create(model, objects, refetch):
+    created = model.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+    if created and created[0].pk is None:
+        # backends without RETURNING support (MySQL) leave primary keys unset, read the rows back
+        return list(refetch())
+    return created
+
+
+def generate_workforce(count, year=None, prefix='BM', seed=0):
+    """Create `count` employees with payroll inputs and return the number of rows created per model"""
+    rng = random.Random(seed)
+    today = date.today()
+    year = year or today.year
+    created = {}
+
+    steps = _bulk_create(SalaryStep, [SalaryStep(step=step) for step in (1, 2)], lambda: SalaryStep.objects.order_by('-id')[:2][::-1])
+    grades = _bulk_create(SalaryGrade, [
+        SalaryGrade(grade=f"{prefix}-G{grade:02d}", step=index + 1, grade_step=step, amount=Decimal(1500 + grade * 450 + index * 120))
+        for grade in range(1, 13)
+        for index, step in enumerate(steps)
+    ], lambda: SalaryGrade.objects.filter(grade__startswith=f"{prefix}-"))
+    banks = _bulk_create(Bank, [Bank(bank_name=f"{prefix} Bank {number:02d}") for number in range(1, 11)], lambda: Bank.objects.filter(bank_name__startswith=f"{prefix} "))
+    departments = _bulk_create(
+        Department, [Department(department_name=f"{prefix} {name}", location='Head Office') for name in DEPARTMENTS],
+        lambda: Department.objects.filter(department_name__startswith=f"{prefix} "),
+    )
+    jobs = _bulk_create(Job, [
+        Job(job_title=f"{department.department_name} {title}", min_salary=Decimal('1000'), max_salary=Decimal('20000'), department=department)
+        for department in departments
+        for title in ('Staff', 'Lead')
+    ], lambda: Job.objects.filter(department__in=departments))
+    designations = _bulk_create(Designation, [
+        Designation(code=f"{prefix}{level}", title=f"{prefix} {title}", level=str(level))
+        for level, title in enumerate(DESIGNATIONS, start=1)
+    ], lambda: Designation.objects.filter(code__startswith=prefix))
+    salary_items = _bulk_create(
+        SalaryItem,
+        [SalaryItem(item_name=f"{prefix} {name}", alias_name=name, effect='addition', rate_amount=Decimal(rng.randint(50, 600)), condition='full_time') for name in EARNINGS]
+        + [SalaryItem(item_name=f"{prefix} {name}", alias_name=name, effect='deduction', rate_amount=Decimal(rng.randint(20, 150)), condition='full_time') for name in DEDUCTIONS],
+        lambda: SalaryItem.objects.filter(item_name__startswith=f"{prefix} ").order_by('id'),
+    )
+    credit_unions = _bulk_create(
+        CreditUnion, [CreditUnion(union_name=f"{prefix} {name}", amount=Decimal(rng.randint(10, 200))) for name in CREDIT_UNIONS],
+        lambda: CreditUnion.objects.filter(union_name__startswith=f"{prefix} ").order_by('id'),
+    )
+
+    if not Tax.objects.filter(year=year).exists():
+        Tax.objects.bulk_create([Tax(year=year, block=block, rate=rate) for block, rate in TAX_BLOCKS])
+        created['tax'] = len(TAX_BLOCKS)
+
+    employees = _bulk_create(Employee, [
+        Employee(
+            first_name=f"{prefix.lower()}first{number}", last_name=f"{prefix.lower()}last{number}", employee_id=f"{prefix}{number:07d}",
+            email=f"{prefix.lower()}{number}@benchmark.local", phone_number=f"{prefix}{number:010d}", account_number=f"{prefix}AC{number:010d}",
+            tin=f"{prefix}T{number:010d}", ssnit=f"{prefix}S{number:010d}", hire_date=date(2015, 1, 1) + timedelta(days=rng.randint(0, 3000)),
+            salary_grade=rng.choice(grades), job=rng.choice(jobs), designation=rng.choice(designations), branch='Main',
+            # about 1 in 100 employees lacks bank details, as happens in practice
+            bank=rng.choice(banks) if rng.random() > 0.01 else None,
+            tax_relief=Decimal(rng.choice([0, 0, 0, 50, 100])),
+        )
+        for number in range(count)
+    ], lambda: Employee.objects.filter(employee_id__startswith=prefix).order_by('employee_id'))
+
+    staff_salary_items = []; staff_credit_unions = []; loans = []
+    for employee in employees:
+        for salary_item in rng.sample(salary_items, rng.randint(3, 6)):
+            staff_salary_items.append(StaffSalaryItem(salary_item=salary_item, employee=employee, amount=salary_item.rate_amount))
+
+        if rng.random() < 0.4:
+            for credit_union in rng.sample(credit_unions, rng.randint(1, 2)):
+                staff_credit_unions.append(StaffCreditUnion(credit_union=credit_union, employee=employee, amount=credit_union.amount, deduction_start_date=date(2020, 1, 1)))
+
+        if rng.random() < 0.3:
+            principal = Decimal(rng.randint(5, 100) * 100)
+            duration = rng.choice([6, 12, 24, 36])
+            installment = (principal / duration).quantize(Decimal('0.01'))
+            active_on = today - timedelta(days=30 * rng.randint(0, duration - 1))
+            loans.append(Loan(
+                employee=employee, loan_type=rng.choice(Loan.LoanType.values), principal_amount=principal, duration_in_months=duration,
+                monthly_installment=installment, total_repayable_amount=installment * duration, outstanding_balance=installment * rng.randint(1, duration),
+                status=Loan.LoanStatus.ACTIVE, applied_on=active_on, active_on=active_on, deduction_end_date=active_on + timedelta(days=30 * duration),
+            ))
+
+    StaffSalaryItem.objects.bulk_create(staff_salary_items, batch_size=BATCH_SIZE)
+    StaffCreditUnion.objects.bulk_create(staff_credit_unions, batch_size=BATCH_SIZE)
+    Loan.objects.bulk_create(loans, batch_size=BATCH_SIZE)
+
+    created.update({
+        'employees': len(employees),
+        'salary_grades': len(grades),
+        'banks': len(banks),
+        'departments': len(departments),
+        'salary_items': len(salary_items),
+        'staff_salary_items': len(staff_salary_items),
+        'staff_credit_unions': len(staff_credit_unions),
+        'loans': len(loans),
+    })
+    return created
@@ -0,0 +1,79 @@
+"""
+Signal handlers of the hr app, connected in HrConfig.ready.
+"""
+from django.apps import apps
+from django.db.models.signals import m2m_changed, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from hr.models.employee import ACTIVE_STATUSES, Employee
+from hr.services.eligibility import RULES, TRACKED_FIELDS, get_rule, sync_employee_eligibility
+
+# column names of the tracked fields, foreign keys are compared by id
+TRACKED_ATTNAMES = {field: Employee._meta.get_field(field).attname for field in TRACKED_FIELDS}
+
+
+@receiver(pre_save, sender=Employee)
+def remember_eligibility_fields(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Keep the stored values of the tracked fields so post_save can tell which ones changed"""
+    instance._eligibility_previous = None
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and not set(update_fields) & set(TRACKED_FIELDS):
+        return
+    instance._eligibility_previous = Employee.objects.filter(pk=instance.pk).values(*TRACKED_ATTNAMES.values()).first()
+
+
+@receiver(post_save, sender=Employee)
+def sync_eligibility(sender, instance, created, raw=False, **kwargs):
+    """Bring the employee's salary item and credit union assignments in line with their new attributes"""
+    if raw:
+        return
+
+    if created:
+        changed = None
+    else:
+        previous = getattr(instance, '_eligibility_previous', None)
+        if previous is None:
+            return
+        changed = [field for field, attname in TRACKED_ATTNAMES.items() if previous[attname] != getattr(instance, attname)]
+        # moving between active statuses (active <-> on_leave) can not change eligibility
+        if 'status' in changed and (previous['status'] in ACTIVE_STATUSES) == (instance.status in ACTIVE_STATUSES):
+            changed.remove('status')
+        if not changed:
+            return
+
+    sync_employee_eligibility(instance.pk, changed)
+
+
+def _through_field(through, model):
+    return next(field for field in through._meta.get_fields() if field.many_to_one and field.related_model is model)
+
+
+def bump_rule_version(sender, instance, action, reverse, model, pk_set, **kwargs):
+    """
+    Relation changes made without saving the rule (`.set()`, `.add()`, the admin, the reverse side)
+    bump its updated_at, which retires its compiled eligibility ids in every process
+    """
+    if reverse and action == 'pre_clear':
+        # the rules losing this record are only known before the clear
+        rule_field = _through_field(sender, model)
+        instance._cleared_rules = set(sender.objects.filter(**{_through_field(sender, type(instance)).name: instance.pk}).values_list(rule_field.attname, flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    now = timezone.now()
+    if reverse:
+        rule_ids = instance.__dict__.pop('_cleared_rules', set()) if action == 'post_clear' else pk_set
+        if rule_ids:
+            model.objects.filter(pk__in=rule_ids).update(updated_at=now)
+    else:
+        type(instance).objects.filter(pk=instance.pk).update(updated_at=now)
+        instance.updated_at = now
+
+
+for label in RULES:
+    rule_model = apps.get_model(label)
+    for relation in get_rule(rule_model).relations:
+        m2m_changed.connect(bump_rule_version, sender=getattr(rule_model, relation).through, dispatch_uid=f"eligibility:{label}:{relation}")
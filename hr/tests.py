@@ -1,3 +1,855 @@
-from django.test import TestCase
+import csv
+from datetime import date, timedelta
+import io
+import tempfile
+import zipfile
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+import openpyxl
+from PIL import Image
+
+from hr.models.employee import SMS, Department, Employee, Job
+from hr.models.payroll import (
+    Bank, CreditUnion, Loan, LoanRepayment, LoanSchedule, Payroll, PayrollItem, PayrollRun, SalaryGrade, SalaryItem, SalaryStep,
+    StaffCreditUnion, StaffCreditUnionDeduction, StaffSalaryItem, Tax,
+)
+from hr.services.credit_union_import import import_credit_union_members
+from hr.services.employee_photos import PHOTO_FAILED, PHOTO_SIZES, process_pending_photos
+from hr.services.eligibility import count_eligible, eligible_employees, is_eligible
+from hr.services.loan_repayments import post_loan_repayments
+from hr.services.loan_schedules import generate_schedule
+from hr.services.payroll_engine import PayrollEngine
+from hr.services.payroll_preview import preview_payroll
+from hr.services.payroll_recompute import recompute_payroll
+from hr.services.payroll_runs import PayrollRunProcessor, claim_next_run
+from hr.services.payroll_vouchers import get_voucher_totals
+from hr.services.payslips import stream_payslip_zip
+from hr.forms.payroll_forms import SalaryItemForm
+from hr.services.remittances import compute_remittances, get_remittances
+from hr.services.salary_items import assign_salary_item, recalculate_salary_item, recompute_factor_items
+from hr.services.variable_import import import_variables
+from hr.services.workforce import generate_workforce
+from hr.services.tax_table import TaxTable, get_tax_table
+
+
+class PayrollEngineTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.step = SalaryStep.objects.create(step=1)
+        cls.grade = SalaryGrade.objects.create(grade='G1', grade_step=cls.step, amount=Decimal('3000.00'))
+        cls.bank = Bank.objects.create(bank_name='Test Bank')
+        cls.allowance = SalaryItem.objects.create(item_name='Transport', alias_name='Transport', rate_amount=Decimal('200.00'), condition='full_time')
+        cls.welfare = CreditUnion.objects.create(union_name='Welfare', amount=Decimal('20.00'))
+        Tax.objects.bulk_create([
+            Tax(year=2024, block=490, rate=0),
+            Tax(year=2024, block=110, rate=5),
+            Tax(year=2024, block=130, rate=10),
+            Tax(year=2024, block=100000, rate=17.5),
+        ])
+
+    def create_employees(self, count, offset=0):
+        # bulk_create skips Employee.save which post-processes the photo on disk
+        employees = Employee.objects.bulk_create([
+            Employee(
+                first_name=f'first{i}', last_name=f'last{i}', employee_id=f'S{i:05d}', email=f'staff{i}@revlo.test',
+                phone_number=f'02{i:08d}', account_number=f'AC{i:08d}', tin=f'T{i:08d}', ssnit=f'SS{i:08d}',
+                hire_date=date(2020, 1, 1), salary_grade=self.grade, bank=self.bank,
+            )
+            for i in range(offset, offset + count)
+        ])
+        StaffSalaryItem.objects.bulk_create([StaffSalaryItem(salary_item=self.allowance, employee=e, amount=Decimal('200.00')) for e in employees])
+        StaffCreditUnion.objects.bulk_create([
+            StaffCreditUnion(credit_union=self.welfare, employee=e, amount=Decimal('20.00'), deduction_start_date=date(2020, 1, 1))
+            for e in employees
+        ])
+        for employee in employees:
+            # active since the first processed month, deduction_end_date is checked against today
+            loan = Loan(
+                employee=employee, principal_amount=Decimal('1200.00'), duration_in_months=12, applied_on=date(2020, 1, 1), status=Loan.LoanStatus.ACTIVE,
+                active_on=date(2024, 1, 1), deduction_end_date=date.today() + timedelta(days=365),
+            )
+            loan.save()
+        return employees
+
+    def run_payroll(self, process_month='01', process_year=2024):
+        payroll = Payroll(process_month=process_month, process_year=process_year, payment_rate=100)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            result = PayrollEngine(payroll, Employee.objects.active()).run()
+        return result, len(queries)
+
+    def test_query_count_does_not_grow_with_headcount(self):
+        self.create_employees(3)
+        small_result, small_queries = self.run_payroll()
+
+        self.create_employees(30, offset=3)
+        large_result, large_queries = self.run_payroll()
+
+        self.assertEqual(small_result.employee_count, 3)
+        self.assertEqual(large_result.employee_count, 33)
+        self.assertEqual(small_queries, large_queries)
+
+    def test_tax_table_follows_block_changes_without_invalidation(self):
+        # writes made by another process never reach this process's cache, only the database
+        cache.clear()
+        table = get_tax_table(2024)
+        self.assertEqual(get_tax_table(2024).version, table.version)
+
+        Tax.objects.filter(year=2024, rate=10).update(rate=12, updated_at=timezone.now())
+        updated = get_tax_table(2024)
+        self.assertNotEqual(updated.version, table.version)
+        self.assertAlmostEqual(updated.tax(730), 5.5 + 130 * 0.12)
+
+        Tax.objects.filter(year=2024, rate=5).delete()
+        self.assertNotEqual(get_tax_table(2024).version, updated.version)
+
+    def test_parallel_computation_matches_serial(self):
+        employees = self.create_employees(7)
+        Employee.objects.filter(id=employees[3].id).update(bank=None)
+        payroll = Payroll(process_month='01', process_year=2024, payment_rate=100)
+
+        serial = PayrollEngine(payroll, Employee.objects.active(), workers=1).run()
+        engine = PayrollEngine(payroll, Employee.objects.active(), workers=3)
+        engine.parallel_threshold = 0
+        parallel = engine.run()
+
+        self.assertEqual([r.employee for r in parallel.employee_results], [r.employee for r in serial.employee_results])
+        self.assertEqual([r.items for r in parallel.employee_results], [r.items for r in serial.employee_results])
+        self.assertEqual(parallel.errors, serial.errors)
+
+    def test_employee_payroll_lines(self):
+        self.create_employees(1)
+        result, _ = self.run_payroll()
+        self.assertEqual(result.errors, [])
+
+        items = {item['item_type']: item for item in result.employee_results[0].items}
+        self.assertEqual(items['basic_salary']['amount'], 3000.0)
+        self.assertEqual(items['earning']['amount'], 200.0)
+        self.assertEqual(items['gross_salary']['amount'], 3200.0)
+        self.assertEqual(items['loan']['amount'], 100.0)
+        self.assertEqual(items['credit_union']['amount'], 20.0)
+        self.assertEqual(items['bank']['amount'], items['net_salary']['amount'])
+
+    def test_loan_schedule_is_generated_on_activation(self):
+        employee = self.create_employees(1)[0]
+        loan = Loan(employee=employee, principal_amount=Decimal('1000.00'), interest_rate=Decimal('10.00'), duration_in_months=3, applied_on=date(2024, 1, 2), status=Loan.LoanStatus.APPROVED)
+        loan.save()
+        self.assertFalse(loan.schedule.exists())
+
+        loan.status = Loan.LoanStatus.ACTIVE
+        loan.save()
+        self.assertEqual(list(loan.schedule.values_list('period', flat=True)), [1, 2, 3])
+        self.assertEqual(loan.schedule.first().due_date, loan.active_on)
+
+        # regenerated from the end of a month, later due dates are clipped to the month end
+        loan.active_on = date(2024, 1, 31)
+        self.assertEqual(generate_schedule(loan), 3)
+
+        schedule = list(loan.schedule.values_list('due_date', 'installment', 'principal', 'interest', 'expected_balance'))
+        self.assertEqual(schedule, [
+            (date(2024, 1, 31), Decimal('366.67'), Decimal('333.33'), Decimal('33.34'), Decimal('733.33')),
+            (date(2024, 2, 29), Decimal('366.67'), Decimal('333.33'), Decimal('33.34'), Decimal('366.66')),
+            (date(2024, 3, 31), Decimal('366.66'), Decimal('333.34'), Decimal('33.32'), Decimal('0.00')),
+        ])
+
+    def test_loan_deduction_follows_schedule(self):
+        employee = self.create_employees(1)[0]
+
+        def loan_deduction(process_month, process_year=2024):
+            result, _ = self.run_payroll(process_month=process_month, process_year=process_year)
+            return sum(item['amount'] for item in result.employee_results[0].items if item['item_type'] == 'loan')
+
+        self.assertEqual(loan_deduction('01'), 100.0)
+        # months without a payroll are caught up by the next one
+        Loan.objects.filter(employee=employee).update(outstanding_balance=Decimal('1100.00'))
+        self.assertEqual(loan_deduction('04'), 300.0)
+        # repayments made outside payroll reduce what is due
+        Loan.objects.filter(employee=employee).update(outstanding_balance=Decimal('700.00'))
+        self.assertEqual(loan_deduction('04'), 0)
+
+        # the twelve installments ran from January to December 2024, what is left is overdue
+        Loan.objects.filter(employee=employee).update(outstanding_balance=Decimal('150.00'))
+        self.assertEqual(loan_deduction('01', 2025), 150.0)
+        Loan.objects.filter(employee=employee).update(outstanding_balance=Decimal('0.00'))
+        self.assertEqual(loan_deduction('01', 2025), 0)
+
+    def test_employee_without_bank_is_reported(self):
+        employee = self.create_employees(1)[0]
+        Employee.objects.filter(id=employee.id).update(bank=None)
+        result, _ = self.run_payroll()
+
+        self.assertEqual(len(result.errors), 1)
+        self.assertEqual(result.build_items(Payroll()), [])
+        self.assertEqual(result.employee_results[0].error_category, 'bank')
+
+
+    def queue_run(self, error_mode='mute'):
+        return PayrollRun.objects.create(
+            parameters={'process_month': '01', 'process_year': 2024, 'description': '', 'condition': 'all', 'error_mode': error_mode, 'payment_rate': 100},
+            error_mode=error_mode,
+        )
+
+    def test_queued_run_is_written_in_chunks(self):
+        self.create_employees(5)
+        self.queue_run()
+
+        run = PayrollRunProcessor(claim_next_run(), chunk_size=2).process()
+
+        self.assertEqual(run.status, PayrollRun.Status.COMPLETED)
+        self.assertEqual((run.total, run.processed, run.error_count), (5, 5, 0))
+        self.assertEqual(PayrollItem.objects.filter(payroll=run.payroll, item_type='net_salary').count(), 5)
+        self.assertIsNone(claim_next_run())
+
+        summary = run.payroll.summaries.get(employee=PayrollItem.objects.filter(payroll=run.payroll).first().employee)
+        net_item = PayrollItem.objects.get(payroll=run.payroll, employee=summary.employee, item_type='net_salary')
+        self.assertEqual(run.payroll.summaries.count(), 5)
+        self.assertEqual((summary.net_salary, summary.bank, summary.salary_grade), (net_item.amount, self.bank, self.grade))
+        self.assertEqual(summary.gross_salary, Decimal('3200.00'))
+        self.assertEqual(
+            StaffCreditUnionDeduction.objects.filter(payroll=run.payroll).aggregate(total=Sum('amount_paid'))['total'], Decimal('100.00')
+        )
+
+    def test_strict_run_with_errors_writes_nothing(self):
+        employee = self.create_employees(2)[0]
+        Employee.objects.filter(id=employee.id).update(bank=None)
+        self.queue_run(error_mode='strict')
+
+        run = PayrollRunProcessor(claim_next_run()).process()
+
+        self.assertEqual(run.status, PayrollRun.Status.FAILED)
+        self.assertEqual(len(run.errors), 1)
+        self.assertFalse(Payroll.objects.exists())
+        self.assertFalse(StaffCreditUnionDeduction.objects.exists())
+
+    def test_unfinished_run_payroll_is_hidden_and_abandoned_runs_fail(self):
+        self.create_employees(2)
+        run = PayrollRunProcessor(self.queue_run()).process()
+        self.assertEqual(Payroll.objects.completed().get(), run.payroll)
+
+        # a worker that died mid run leaves it running with a partly written payroll
+        stale = self.queue_run()
+        payroll = Payroll.objects.create(process_month='02', process_year=2024, payment_rate=100)
+        PayrollRun.objects.filter(id=stale.id).update(
+            status=PayrollRun.Status.RUNNING, payroll=payroll, started_at=timezone.now() - timedelta(days=1),
+        )
+        self.assertEqual(list(Payroll.objects.completed()), [run.payroll])
+
+        self.assertIsNone(claim_next_run())
+        stale.refresh_from_db()
+        self.assertEqual(stale.status, PayrollRun.Status.FAILED)
+        self.assertFalse(Payroll.objects.filter(id=payroll.id).exists())
+        self.assertTrue(Payroll.objects.filter(id=run.payroll.id).exists())
+
+    def test_preview_aggregates_without_writing(self):
+        employee = self.create_employees(3)[0]
+        Employee.objects.filter(id=employee.id).update(bank=None)
+        payroll = Payroll(process_month='01', process_year=2024, payment_rate=100)
+
+        with CaptureQueriesContext(connection) as queries:
+            preview = preview_payroll(payroll, Employee.objects.active())
+
+        self.assertFalse([q for q in queries.captured_queries if not q['sql'].lstrip().upper().startswith('SELECT')])
+        self.assertEqual(preview['employee_count'], 3)
+        self.assertEqual(preview['totals']['employees'], 2)
+        self.assertEqual(preview['totals']['gross'], 6400.0)
+        self.assertEqual(preview['banks']['Test Bank']['employees'], 2)
+        self.assertEqual(preview['departments']['No Department']['gross'], 6400.0)
+        self.assertEqual([error['employee'] for error in preview['errors']], [employee.id])
+
+    def test_recompute_only_touches_changed_employees(self):
+        employees = self.create_employees(4)
+        Employee.objects.filter(id=employees[0].id).update(bank=None)
+        self.queue_run()
+        payroll = PayrollRunProcessor(claim_next_run()).process().payroll
+        self.assertFalse(payroll.summaries.filter(input_fingerprint='').exists())
+        self.assertFalse(PayrollItem.objects.filter(payroll=payroll, item_type='fingerprint').exists())
+
+        StaffSalaryItem.objects.filter(employee=employees[1]).update(amount=Decimal('500.00'))
+        Employee.objects.filter(id=employees[0].id).update(bank=self.bank)
+        untouched = set(PayrollItem.objects.filter(payroll=payroll, employee__in=employees[2:]).values_list('id', flat=True))
+
+        self.assertEqual(recompute_payroll(payroll), {'recomputed': 2, 'unchanged': 2, 'errors': 0})
+        self.assertFalse(payroll.errors.exists())
+        self.assertEqual(PayrollItem.objects.get(payroll=payroll, employee=employees[1], item_type='earning').amount, Decimal('500.00'))
+        self.assertEqual(payroll.summaries.get(employee=employees[1]).earning, Decimal('500.00'))
+        self.assertEqual(payroll.summaries.count(), 4)
+        self.assertTrue(untouched <= set(PayrollItem.objects.filter(payroll=payroll).values_list('id', flat=True)))
+        self.assertEqual(recompute_payroll(payroll)['recomputed'], 0)
+
+    def test_loan_repayments_are_posted_in_bulk(self):
+        employees = self.create_employees(3)
+        # a loan from before schedules deducts its monthly installment, capped at what is left
+        LoanSchedule.objects.filter(loan__employee=employees[0]).delete()
+        Loan.objects.filter(employee=employees[0]).update(outstanding_balance=Decimal('50.00'))
+        self.queue_run()
+        payroll = PayrollRunProcessor(claim_next_run()).process().payroll
+
+        self.assertEqual(post_loan_repayments(payroll, date_paid=date(2024, 1, 31)), 3)
+        loans = {loan.employee_id: loan for loan in Loan.objects.all()}
+        self.assertEqual((loans[employees[0].id].outstanding_balance, loans[employees[0].id].status), (Decimal('0.00'), Loan.LoanStatus.PAID_OFF))
+        self.assertEqual((loans[employees[1].id].outstanding_balance, loans[employees[1].id].status), (Decimal('1100.00'), Loan.LoanStatus.ACTIVE))
+        self.assertEqual(
+            sorted(LoanRepayment.objects.filter(payment_reference=f'PAYROLL-{payroll.id}').values_list('amount_paid', flat=True)),
+            [Decimal('50.00'), Decimal('100.00'), Decimal('100.00')],
+        )
+
+        # posting again finds every deduction already repaid
+        self.assertEqual(post_loan_repayments(payroll), 0)
+        self.assertEqual(Loan.objects.get(employee=employees[1]).outstanding_balance, Decimal('1100.00'))
+
+    def test_loan_status_sweep(self):
+        employees = self.create_employees(3)
+        Loan.objects.filter(employee=employees[0]).update(outstanding_balance=Decimal('0.00'))
+        Loan.objects.filter(employee=employees[1]).update(deduction_end_date=date(2024, 12, 31))
+
+        out = io.StringIO()
+        with self.assertNumQueries(2):
+            call_command('sweep_loan_status', '--date', '2025-01-15', stdout=out)
+
+        statuses = dict(Loan.objects.values_list('employee_id', 'status'))
+        self.assertEqual(statuses, {
+            employees[0].id: Loan.LoanStatus.PAID_OFF, employees[1].id: Loan.LoanStatus.DEFAULTED, employees[2].id: Loan.LoanStatus.ACTIVE,
+        })
+        self.assertIn('1 paid off, 1 defaulted', out.getvalue())
+
+    def test_credit_union_members_are_imported_and_bulk_edited(self):
+        employees = self.create_employees(3)
+        rows = [
+            'Employee ID,Amount,End Date',
+            f'{employees[0].employee_id},35,2025-12-31',
+            f'{employees[1].employee_id},abc,',
+            'S99999,5,',
+            f'{employees[2].employee_id},10,2019-01-01',
+        ]
+        summary = import_credit_union_members(self.welfare, io.BytesIO('\n'.join(rows).encode()), 'welfare.csv', chunk_size=2)
+
+        self.assertEqual(summary['updated'], 1)
+        self.assertEqual([error['row'] for error in summary['errors']], [3, 4, 5])
+        members = {member.employee_id: member for member in StaffCreditUnion.objects.all()}
+        self.assertEqual((members[employees[0].id].amount, members[employees[0].id].deduction_start_date, members[employees[0].id].deduction_end_date), (Decimal('35.00'), date(2020, 1, 1), date(2025, 12, 31)))
+        self.assertEqual(members[employees[1].id].amount, Decimal('20.00'))
+
+        self.client.force_login(get_user_model().objects.create_user(email='hr@revlo.test'))
+        response = self.client.post(reverse('creditunion-set-details', args=[self.welfare.id]), {
+            'id[]': [members[employees[1].id].id, members[employees[2].id].id],
+            'amount[]': ['25', '30'], 'start-date[]': ['2024-01-01', '2024-01-01'], 'end-date[]': ['', ''],
+        })
+        self.assertEqual(response.json()['status'], 'success')
+        self.assertEqual(
+            set(StaffCreditUnion.objects.filter(employee__in=employees[1:]).values_list('amount', 'deduction_start_date')),
+            {(Decimal('25.00'), date(2024, 1, 1)), (Decimal('30.00'), date(2024, 1, 1))},
+        )
+
+        response = self.client.post(reverse('creditunion-set-details', args=[self.welfare.id]), {
+            'id[]': ['x1'], 'amount[]': ['25'], 'start-date[]': [''], 'end-date[]': [''],
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], ["Record on line 1 is not a member of this credit union"])
+
+    def test_credit_union_remittance(self):
+        employees = self.create_employees(3)
+        self.queue_run()
+        payroll = PayrollRunProcessor(claim_next_run()).process().payroll
+        cache.clear()
+
+        with self.assertNumQueries(1):
+            [remittance] = compute_remittances(payroll)
+        self.assertEqual((remittance['union_name'], remittance['members'], remittance['total']), ('Welfare', 3, Decimal('60.00')))
+        self.assertEqual([line['employee_id'] for line in remittance['lines']], [employee.employee_id for employee in employees])
+
+        payroll.posted = True
+        payroll.save()
+        get_remittances(payroll)
+        self.client.force_login(get_user_model().objects.create_user(email='hr@revlo.test'))
+        with self.assertNumQueries(3):
+            # session, user and payroll, the remittance itself comes from the cache
+            response = self.client.get(reverse('credit-union-remittance-export', args=[payroll.id]))
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(rows[0], ['Credit Union', 'Staff ID', 'Staff Name', 'Amount'])
+        self.assertEqual(rows[1], ['Welfare', employees[0].employee_id, 'First0 Last0', '20.00'])
+        self.assertEqual(rows[-1], ['Welfare', '', 'Total (3 member(s))', '60.00'])
+
+        response = self.client.get(reverse('credit-union-remittance-export', args=[payroll.id]), {'format': 'xlsx'})
+        sheet = openpyxl.load_workbook(io.BytesIO(response.content)).active
+        self.assertEqual([cell.value for cell in sheet[sheet.max_row]], ['Welfare', None, 'Total (3 member(s))', 60])
+
+    def test_voucher_totals_are_cached_once_posted(self):
+        self.create_employees(3)
+        self.queue_run()
+        payroll = PayrollRunProcessor(claim_next_run()).process().payroll
+        cache.clear()
+
+        [voucher] = get_voucher_totals(payroll)
+        self.assertEqual(voucher['bank_name'], 'Test Bank')
+        self.assertEqual(voucher['bank_balance'], payroll.summaries.aggregate(total=Sum('net_salary'))['total'])
+        self.assertEqual(voucher['loans'], [{'loan_type': 'Salary Advance', 'total': Decimal('300.00')}])
+        self.assertEqual(voucher['total_basic_salaries'], Decimal('9000.00'))
+
+        payroll.posted = True
+        payroll.save()
+        get_voucher_totals(payroll)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_voucher_totals(payroll)[0]['bank_balance'], voucher['bank_balance'])
+
+    def test_payslips_are_exported_as_zip(self):
+        employees = self.create_employees(3)
+        self.queue_run()
+        payroll = PayrollRunProcessor(claim_next_run()).process().payroll
+
+        # employee ids, then items and employees for each of the 2 chunks
+        with self.assertNumQueries(5):
+            data = b''.join(stream_payslip_zip(payroll, workers=1, chunk_size=2))
+
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            names = archive.namelist()
+            payslip = archive.read(names[0]).decode()
+        self.assertEqual(len(names), 3)
+        self.assertIn(employees[0].employee_id, names[0])
+        self.assertIn('Transport', payslip)
+        self.assertIn('Loan (Salary Advance)', payslip)
+
+
+class SalaryItemAssignmentTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        step = SalaryStep.objects.create(step=1)
+        grades = [SalaryGrade.objects.create(grade=f'G{i}', grade_step=step, amount=Decimal(1000 * i)) for i in (1, 2)]
+        Employee.objects.bulk_create([
+            Employee(
+                first_name=f'first{i}', last_name=f'last{i}', employee_id=f'S{i:05d}', email=f'staff{i}@revlo.test',
+                phone_number=f'02{i:08d}', account_number=f'AC{i:08d}', tin=f'T{i:08d}', ssnit=f'SS{i:08d}',
+                hire_date=date(2020, 1, 1), salary_grade=grades[i % 2],
+            )
+            for i in range(6)
+        ])
+        cls.housing = SalaryItem.objects.create(item_name='Housing', alias_name='Housing', rate_amount=Decimal('400.00'))
+
+    def test_factor_amounts_are_assigned_in_bulk(self):
+        basic = SalaryItem.objects.create(item_name='Risk', alias_name='Risk', rate_type='factor', rate_amount=Decimal('10'), rate_dependency='Basic')
+        with self.assertNumQueries(2):
+            self.assertEqual(assign_salary_item(basic, Employee.objects.all()), 6)
+        self.assertEqual(
+            sorted(set(StaffSalaryItem.objects.filter(salary_item=basic).values_list('employee__salary_grade__amount', 'amount'))),
+            [(Decimal('1000.00'), Decimal('100.00')), (Decimal('2000.00'), Decimal('200.00'))],
+        )
+
+        assign_salary_item(self.housing, Employee.objects.filter(id__in=Employee.objects.order_by('id').values_list('id', flat=True)[:4]))
+        dependent = SalaryItem.objects.create(item_name='Rent', alias_name='Rent', rate_type='factor', rate_amount=Decimal('50'), rate_dependency=str(self.housing.id))
+        # the employees' amounts of the dependency are loaded once, whatever the headcount
+        with self.assertNumQueries(3):
+            assign_salary_item(dependent, Employee.objects.all())
+        self.assertEqual(sorted(StaffSalaryItem.objects.filter(salary_item=dependent).values_list('amount', flat=True)), [0] * 2 + [Decimal('200.00')] * 4)
+
+    def test_factor_chains_are_recomputed_in_dependency_order(self):
+        risk = SalaryItem.objects.create(item_name='Risk', alias_name='Risk', rate_type='factor', rate_amount=Decimal('10'), rate_dependency='Basic')
+        hazard = SalaryItem.objects.create(item_name='Hazard', alias_name='Hazard', rate_type='factor', rate_amount=Decimal('50'), rate_dependency=str(risk.id))
+        for item in (risk, hazard):
+            assign_salary_item(item, Employee.objects.all())
+
+        SalaryGrade.objects.update(amount=Decimal('5000'))
+        # one read of every row involved, one bulk update
+        with self.assertNumQueries(3):
+            self.assertEqual(recompute_factor_items(), 12)
+        self.assertEqual(set(StaffSalaryItem.objects.filter(salary_item=hazard).values_list('amount', flat=True)), {Decimal('250.00')})
+        self.assertEqual(recompute_factor_items(item_ids=[risk.id]), 0)
+
+    def test_dependency_cycles_are_rejected(self):
+        risk = SalaryItem.objects.create(item_name='Risk', alias_name='Risk', rate_type='factor', rate_amount=Decimal('10'), rate_dependency='Basic')
+        hazard = SalaryItem.objects.create(item_name='Hazard', alias_name='Hazard', rate_type='factor', rate_amount=Decimal('50'), rate_dependency=str(risk.id))
+        form = SalaryItemForm(instance=risk, data={
+            'item_name': 'Risk', 'alias_name': 'Risk', 'effect': 'addition', 'rate_type': 'factor',
+            'rate_amount': '10', 'rate_dependency': str(hazard.id), 'condition': 'full_time',
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn('Risk -> Hazard -> Risk', form.non_field_errors()[0])
+
+    def test_rate_change_is_recalculated_in_bulk(self):
+        item = SalaryItem.objects.create(item_name='Overtime', alias_name='Overtime', rate_type='variable', rate_amount=Decimal('15'))
+        assign_salary_item(item, Employee.objects.all())
+        StaffSalaryItem.objects.filter(salary_item=item).update(variable=4)
+
+        item.rate_type = 'fix'
+        item.save()
+        with self.assertNumQueries(2):
+            self.assertEqual(recalculate_salary_item(item, 'variable'), 6)
+        self.assertEqual(set(StaffSalaryItem.objects.filter(salary_item=item).values_list('variable', 'amount')), {(0, Decimal('15.00'))})
+
+    def test_variables_are_imported_from_csv(self):
+        item = SalaryItem.objects.create(item_name='Overtime', alias_name='Overtime', rate_type='variable', rate_amount=Decimal('15'))
+        employees = list(Employee.objects.order_by('id'))
+        assign_salary_item(item, Employee.objects.filter(id__in=[e.id for e in employees[:4]]))
+        rows = [
+            'Employee ID,Name,Variable',
+            f'{employees[0].employee_id},first,10',
+            f'{employees[1].employee_id},second,2.5',
+            'S99999,unknown,3',
+            f'{employees[4].employee_id},not eligible,3',
+            '',
+            f'{employees[2].employee_id},third,4',
+        ]
+        upload = SimpleUploadedFile('overtime.csv', '\n'.join(rows).encode())
+        self.client.force_login(get_user_model().objects.create_user(email='hr@revlo.test'))
+
+        response = self.client.post(reverse('salaryitem-import-variable', args=[item.id]), {'file': upload})
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            set(StaffSalaryItem.objects.filter(salary_item=item, variable__isnull=False).values_list('employee_id', 'variable', 'amount')),
+            {(employees[0].id, 10, Decimal('150.00')), (employees[2].id, 4, Decimal('60.00'))},
+        )
+        summary = import_variables(item, io.BytesIO('\n'.join(rows).encode()), 'overtime.csv', chunk_size=2)
+        self.assertEqual(summary['updated'], 2)
+        self.assertEqual([(error['row'], error['employee_id']) for error in summary['errors']], [(3, employees[1].employee_id), (4, 'S99999'), (5, employees[4].employee_id)])
+
+        workbook = openpyxl.Workbook()
+        workbook.active.append(['Employee ID', 'Variable'])
+        workbook.active.append([employees[3].employee_id, 6])
+        output = io.BytesIO()
+        workbook.save(output)
+        output.seek(0)
+        self.assertEqual(import_variables(item, output, 'overtime.xlsx')['updated'], 1)
+        self.assertEqual(StaffSalaryItem.objects.get(salary_item=item, employee=employees[3]).amount, Decimal('90.00'))
+
+    def test_update_view_diffs_eligible_employees(self):
+        assign_salary_item(self.housing, self.housing.get_eligible_employees())
+        kept, added = Employee.objects.order_by('id')[:2]
+        StaffSalaryItem.objects.filter(salary_item=self.housing, employee=added).delete()
+        self.client.force_login(get_user_model().objects.create_user(email='hr@revlo.test'))
+
+        response = self.client.post(reverse('salaryitem-update', args=[self.housing.id]), {
+            'item_name': 'Housing', 'alias_name': 'Housing', 'effect': 'addition', 'rate_type': 'fix',
+            'rate_amount': '450.00', 'condition': 'full_time', 'applicable_to': [kept.id, added.id],
+        })
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            set(StaffSalaryItem.objects.filter(salary_item=self.housing).values_list('employee_id', 'amount')),
+            {(kept.id, Decimal('450.00')), (added.id, Decimal('450.00'))},
+        )
+        self.housing.refresh_from_db()
+        self.assertEqual(self.housing.eligible_employee_count, 2)
+
+    def test_update_view_recomputes_factor_items_after_assigning(self):
+        assign_salary_item(self.housing, Employee.objects.filter(id__in=Employee.objects.order_by('id').values_list('id', flat=True)[:4]))
+        rent = SalaryItem.objects.create(item_name='Rent', alias_name='Rent', rate_type='factor', rate_amount=Decimal('50'), rate_dependency=str(self.housing.id))
+        assign_salary_item(rent, Employee.objects.all())
+        self.client.force_login(get_user_model().objects.create_user(email='hr@revlo.test'))
+
+        response = self.client.post(reverse('salaryitem-update', args=[self.housing.id]), {
+            'item_name': 'Housing', 'alias_name': 'Housing', 'effect': 'addition', 'rate_type': 'fix',
+            'rate_amount': '500.00', 'condition': 'full_time',
+        })
+
+        self.assertEqual(response.status_code, 302)
+        # the two employees given housing by this update get their rent too
+        self.assertEqual(list(StaffSalaryItem.objects.filter(salary_item=rent).values_list('amount', flat=True)), [Decimal('250.00')] * 6)
+
+    def test_update_view_keeps_rows_of_inactive_employees(self):
+        assign_salary_item(self.housing, self.housing.get_eligible_employees())
+        suspended, dropped = Employee.objects.order_by('id')[:2]
+        StaffSalaryItem.objects.filter(salary_item=self.housing, employee=suspended).update(amount=Decimal('999.00'))
+        suspended.status = 'inactive'
+        suspended.save()
+        self.client.force_login(get_user_model().objects.create_user(email='hr@revlo.test'))
+
+        response = self.client.post(reverse('salaryitem-update', args=[self.housing.id]), {
+            'item_name': 'Housing', 'alias_name': 'Housing', 'effect': 'addition', 'rate_type': 'fix',
+            'rate_amount': '300.00', 'condition': 'full_time', 'excluded_from': [dropped.id],
+        })
+
+        self.assertEqual(response.status_code, 302)
+        # the inactive employee still matches the item and keeps the row, the other one no longer matches
+        self.assertTrue(StaffSalaryItem.objects.filter(salary_item=self.housing, employee=suspended).exists())
+        self.assertFalse(StaffSalaryItem.objects.filter(salary_item=self.housing, employee=dropped).exists())
+        self.housing.refresh_from_db()
+        self.assertEqual(self.housing.eligible_employee_count, 4)
+
+
+class EligibilityRuleTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        step = SalaryStep.objects.create(step=1)
+        cls.grade = SalaryGrade.objects.create(grade='G1', grade_step=step, amount=Decimal('1000'))
+        cls.finance = Department.objects.create(department_name='Finance', location='HQ')
+        job = Job.objects.create(job_title='Accountant', min_salary=1000, max_salary=5000, department=cls.finance)
+        cls.employees = Employee.objects.bulk_create([
+            Employee(
+                first_name=f'first{i}', last_name=f'last{i}', employee_id=f'S{i:05d}', email=f'staff{i}@revlo.test',
+                phone_number=f'02{i:08d}', account_number=f'AC{i:08d}', tin=f'T{i:08d}', ssnit=f'SS{i:08d}',
+                hire_date=date(2020, 1, 1), salary_grade=cls.grade, job=job if i % 2 else None,
+                status='terminated' if i == 5 else 'active', employment_type='part_time' if i == 4 else 'full_time',
+            )
+            for i in range(6)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_rule_is_compiled_once_per_version(self):
+        item = SalaryItem.objects.create(item_name='Risk', alias_name='Risk', rate_amount=Decimal('50'))
+        item.department.add(self.finance)
+        item.excluded_from.add(self.employees[1])
+
+        # one query per relation, then the count itself
+        with self.assertNumQueries(8):
+            self.assertEqual(item.get_eligible_employees().count(), 1)
+        with self.assertNumQueries(1):
+            self.assertTrue(is_eligible(item, self.employees[3]))
+
+        item.condition = 'part_time'
+        item.excluded_from.clear()
+        item.save()
+        self.assertEqual(list(item.get_eligible_employees()), [])
+
+    def test_relation_changes_without_save_retire_the_compiled_rule(self):
+        item = SalaryItem.objects.create(item_name='Risk', alias_name='Risk', rate_amount=Decimal('50'))
+        item.department.add(self.finance)
+        self.assertEqual(SalaryItem.objects.get(id=item.id).get_eligible_employees().count(), 2)
+
+        # another process holding the rule only sees the bumped version in the database
+        self.employees[1].excluded_salary_items.add(item)
+        self.assertEqual(SalaryItem.objects.get(id=item.id).get_eligible_employees().count(), 1)
+        item.department.clear()
+        self.assertEqual(SalaryItem.objects.get(id=item.id).get_eligible_employees().count(), 3)
+        self.employees[1].excluded_salary_items.clear()
+        self.assertEqual(SalaryItem.objects.get(id=item.id).get_eligible_employees().count(), 4)
+
+    def test_applicable_employees_override_other_filters(self):
+        item = SalaryItem.objects.create(item_name='Risk', alias_name='Risk', rate_amount=Decimal('50'), condition='part_time')
+        item.applicable_to.add(self.employees[0], self.employees[5])
+        self.assertEqual(set(eligible_employees(item)), {self.employees[0], self.employees[5]})
+
+        union = CreditUnion.objects.create(union_name='Welfare', amount=Decimal('20'))
+        union.applicable_to.add(self.employees[0], self.employees[1], self.employees[5])
+        union.department.add(self.finance)
+        self.assertEqual(set(union.get_eligible_employees()), {self.employees[1], self.employees[5]})
+
+        union.all_employee = True
+        union.save()
+        self.assertEqual(union.get_eligible_employees().count(), 5)
+
+    def test_employee_changes_are_applied_incrementally(self):
+        item = SalaryItem.objects.create(item_name='Risk', alias_name='Risk', rate_type='factor', rate_amount=Decimal('10'), rate_dependency='Basic')
+        item.department.add(self.finance)
+        item.save()
+        assign_salary_item(item, item.get_eligible_employees())
+        item.update_eligible_employee_count()
+        union = CreditUnion.objects.create(union_name='Welfare', amount=Decimal('20'), all_employee=True)
+        StaffCreditUnion.objects.bulk_create([StaffCreditUnion(credit_union=union, employee=e, amount=union.amount) for e in union.get_eligible_employees()])
+        other_grade = SalaryGrade.objects.create(grade='G2', grade_step=self.grade.grade_step, amount=Decimal('2000'))
+
+        # save_base sends the save signals without Employee.save resizing the photo on disk
+        employee = Employee.objects.get(id=self.employees[0].id)
+        employee.job = Job.objects.get(department=self.finance)
+        employee.save_base()
+        self.assertEqual(StaffSalaryItem.objects.get(salary_item=item, employee=employee).amount, Decimal('100.00'))
+
+        employee.salary_grade = other_grade
+        employee.save_base()
+        self.assertEqual(StaffSalaryItem.objects.get(salary_item=item, employee=employee).amount, Decimal('200.00'))
+
+        # leaving the active statuses keeps the assignments and their custom amounts for a reactivation
+        StaffCreditUnion.objects.filter(credit_union=union, employee=employee).update(amount=Decimal('75.00'))
+        employee.status = 'terminated'
+        employee.save_base()
+        self.assertTrue(StaffSalaryItem.objects.filter(salary_item=item, employee=employee).exists())
+        item.refresh_from_db()
+        self.assertEqual(item.eligible_employee_count, item.get_eligible_employees().count())
+
+        employee.status = 'active'
+        employee.save_base()
+        self.assertEqual(StaffCreditUnion.objects.get(credit_union=union, employee=employee).amount, Decimal('75.00'))
+        self.assertEqual(StaffSalaryItem.objects.filter(salary_item=item, employee=employee).count(), 1)
+        item.refresh_from_db()
+        self.assertEqual(item.eligible_employee_count, item.get_eligible_employees().count())
+
+        # a criterion other than status still removes the assignment
+        employee.job = None
+        employee.save_base()
+        self.assertFalse(StaffSalaryItem.objects.filter(salary_item=item, employee=employee).exists())
+
+        # unrelated fields leave the assignments alone
+        with self.assertNumQueries(2):
+            employee.first_name = 'renamed'
+            employee.save_base()
+
+    def test_counts_stay_exact_for_inactive_employees(self):
+        item = SalaryItem.objects.create(item_name='Risk', alias_name='Risk', rate_amount=Decimal('10'))
+        item.salary_grade.add(self.grade)
+        assign_salary_item(item, item.get_eligible_employees())
+        item.update_eligible_employee_count()
+        other_grade = SalaryGrade.objects.create(grade='G2', grade_step=self.grade.grade_step, amount=Decimal('2000'))
+
+        employee = Employee.objects.get(id=self.employees[0].id)
+        employee.status = 'terminated'
+        employee.save_base()
+        # the kept row of an inactive employee is not counted, and removing it later does not uncount it
+        employee.salary_grade = other_grade
+        employee.save_base()
+        self.assertFalse(StaffSalaryItem.objects.filter(salary_item=item, employee=employee).exists())
+        item.refresh_from_db()
+        self.assertEqual(item.eligible_employee_count, item.get_eligible_employees().count())
+
+        # moving between active statuses can not change eligibility
+        employee = Employee.objects.get(id=self.employees[1].id)
+        with self.assertNumQueries(2):
+            employee.status = Employee.Status.ON_LEAVE
+            employee.save_base()
+
+    def test_counts_are_computed_in_grouped_queries(self):
+        items = [SalaryItem.objects.create(item_name=f'Item {i}', alias_name=f'Item {i}', rate_amount=Decimal('10')) for i in range(3)]
+        items[0].department.add(self.finance)
+        items[1].applicable_to.add(self.employees[5])
+        items[2].condition = 'part_time'
+        items[2].save()
+
+        # one query per relation for the whole catalog, then one count query
+        with self.assertNumQueries(9):
+            counts = count_eligible(SalaryItem.objects.all())
+        self.assertEqual(counts, {items[0].id: 2, items[1].id: 1, items[2].id: 1})
+
+        call_command('update_eligible_count', stdout=io.StringIO())
+        self.assertEqual(list(SalaryItem.objects.order_by('id').values_list('eligible_employee_count', flat=True)), [2, 1, 1])
+
+        since = timezone.now()
+        SalaryItem.objects.filter(id=items[0].id).update(eligible_employee_count=0, updated_at=since - timedelta(days=1))
+        SalaryItem.objects.filter(id=items[1].id).update(eligible_employee_count=0, updated_at=since)
+        call_command('update_eligible_count', since=since.isoformat(), stdout=io.StringIO())
+        self.assertEqual(list(SalaryItem.objects.order_by('id').values_list('eligible_employee_count', flat=True)), [0, 1, 1])
+
+    def test_sms_recipients_include_every_status(self):
+        sms = SMS.objects.create(message='Meeting at noon', sms_date=timezone.now())
+        sms.department.add(self.finance)
+        self.assertEqual(set(sms.get_sms_employees()), {self.employees[1], self.employees[3], self.employees[5]})
+
+
+class EmployeePhotoTestCase(TestCase):
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        image = io.BytesIO()
+        Image.new('RGB', (1200, 900), 'teal').save(image, 'PNG')
+        self.photo = default_storage.save('photos/staff.png', ContentFile(image.getvalue()))
+        self.employees = Employee.objects.bulk_create([
+            Employee(
+                first_name=f'first{i}', last_name=f'last{i}', employee_id=f'P{i:05d}', email=f'photo{i}@revlo.test',
+                phone_number=f'03{i:08d}', hire_date=date(2020, 1, 1), photo=self.photo,
+            )
+            for i in range(2)
+        ])
+
+    def test_pending_photos_are_rendered_once_per_content(self):
+        self.assertEqual(process_pending_photos(workers=1), (2, 0))
+
+        first, second = Employee.objects.order_by('id')
+        self.assertEqual(first.photo_hash, second.photo_hash)
+        self.assertEqual(set(first.photo_variants), set(PHOTO_SIZES))
+        with default_storage.open(first.photo_variants['detail']) as file:
+            self.assertEqual(Image.open(file).size, (800, 600))
+        self.assertTrue(first.photo_urls['list'].endswith(f"{first.photo_hash}_list.jpg"))
+        self.assertEqual(process_pending_photos(workers=1), (0, 0))
+
+    def test_save_only_flags_a_changed_photo(self):
+        process_pending_photos(workers=1)
+        employee = Employee.objects.get(id=self.employees[0].id)
+        digest = employee.photo_hash
+
+        employee.status = Employee.Status.ON_LEAVE
+        employee.save()
+        self.assertEqual(Employee.objects.get(id=employee.id).photo_hash, digest)
+        with default_storage.open(self.photo) as file:
+            self.assertEqual(Image.open(file).size, (1200, 900))
+
+        employee.photo = SimpleUploadedFile('new.png', default_storage.open(self.photo).read())
+        employee.save()
+        employee = Employee.objects.get(id=employee.id)
+        self.assertEqual((employee.photo_hash, employee.photo_variants), ('', {}))
+        # until it is rendered the new upload itself is served
+        self.assertEqual(employee.photo_urls['avatar'], employee.photo.url)
+        # the new upload has the same content, so its derivatives are reused
+        self.assertEqual(process_pending_photos(workers=1), (1, 0))
+        self.assertEqual(Employee.objects.get(id=employee.id).photo_hash, digest)
+
+    def test_derivatives_keep_the_name_they_were_saved_under(self):
+        process_pending_photos(workers=1)
+        Employee.objects.filter(id=self.employees[0].id).update(photo_hash='', photo_variants={})
+
+        # another run saves the derivatives between the existence check and this run's save
+        exists, checked = default_storage.exists, set()
+        def exists_once_missing(name):
+            if name.startswith('photos/derived/') and name not in checked:
+                checked.add(name)
+                return False
+            return exists(name)
+
+        with mock.patch.object(default_storage, 'exists', side_effect=exists_once_missing):
+            self.assertEqual(process_pending_photos(workers=1), (1, 0))
+        employee = Employee.objects.get(id=self.employees[0].id)
+        self.assertEqual(set(employee.photo_variants), set(PHOTO_SIZES))
+        for name in employee.photo_variants.values():
+            self.assertTrue(default_storage.exists(name))
+        self.assertNotEqual(employee.photo_variants, Employee.objects.get(id=self.employees[1].id).photo_variants)
+
+    def test_unreadable_photos_are_not_retried(self):
+        broken = default_storage.save('photos/broken.png', ContentFile(b'not an image'))
+        Employee.objects.filter(id=self.employees[1].id).update(photo=broken)
+
+        self.assertEqual(process_pending_photos(workers=1), (1, 1))
+        employee = Employee.objects.get(id=self.employees[1].id)
+        self.assertEqual((employee.photo_hash, employee.photo_urls['avatar']), (PHOTO_FAILED, employee.photo.url))
+        self.assertEqual(process_pending_photos(workers=1), (0, 0))
+
+
+class WorkforceGeneratorTestCase(TestCase):
+
+    def test_generated_workforce_can_be_processed(self):
+        created = generate_workforce(50, year=2023, seed=1)
+        self.assertEqual(created['employees'], 50)
+        self.assertEqual(created['tax'], 7)
+
+        cache.clear()
+        result = PayrollEngine(Payroll(process_month='01', process_year=2023, payment_rate=100), Employee.objects.active()).run()
+        self.assertEqual(result.employee_count, 50)
+        self.assertTrue(all(r.error_category == 'bank' for r in result.employee_results if not r.is_valid))
+        self.assertTrue(any(item['item_type'] == 'loan' for r in result.valid_results for item in r.items))
+
+
+class TaxTableTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.table = TaxTable(2024, [(490, 0), (110, 5), (130, 10), (3166.67, 17.5), (None, 25)])
+
+    def test_tax_is_progressive(self):
+        self.assertEqual(self.table.tax(0), 0)
+        self.assertEqual(self.table.tax(400), 0)
+        self.assertAlmostEqual(self.table.tax(550), 3.0)
+        self.assertAlmostEqual(self.table.tax(730), 5.5 + 13)
+        self.assertAlmostEqual(self.table.tax(5000), 5.5 + 13 + 3166.67 * 0.175 + (5000 - 3896.67) * 0.25)
+
+    def test_batched_tax_matches_scalar_tax(self):
+        amounts = [-10, 0, 490, 555.55, 730, 1000, 3896.67, 12000]
+        self.assertEqual(self.table.tax_many(amounts), [self.table.tax(amount) for amount in amounts])
+
+    def test_empty_table_taxes_nothing(self):
+        self.assertEqual(TaxTable(2024, []).tax_many([100, 200]), [0.0, 0.0])
@@ -31,6 +31,7 @@ urlpatterns += [
     path('salary-items/<int:pk>/delete/', delete_salary_item, name='salaryitem-delete'),
     path('salary-items/<int:pk>/employees/', SalaryItemEmployeeDetailView.as_view(), name='salaryitem-employee'),
     path('salary-items/<int:pk>/set-variable/', SalaryItemVariableDetailView.as_view(), name="salaryitem-variable"),
+    path('salary-items/<int:pk>/import-variable/', import_salary_item_variables, name="salaryitem-import-variable"),
 ]
 
 # Loan
@@ -51,18 +52,24 @@ urlpatterns += [
       path('credit-unions/<int:pk>/delete/', delete_credit_union, name='creditunion-delete'),
       path('credit-unions/<int:pk>/detail/', CreditUnionDetailView.as_view(), name='creditunion-detail'),
       path('credit-unions/api/', CreditUnionListApiView.as_view(), name='creditunion-list-api'),
-      path('credit-unions/<int:pk>/set-employee-detail/', CreditUnionSetEmployeeDetailView.as_view(), name='creditunion-set-details'),  
+      path('credit-unions/<int:pk>/set-employee-detail/', CreditUnionSetEmployeeDetailView.as_view(), name='creditunion-set-details'),
+      path('credit-unions/<int:pk>/import-employee-detail/', import_credit_union_members_view, name='creditunion-import-details'),  
 ]
 
 # Payroll
 urlpatterns += [
       path('process-payroll/', PayrollCreateView.as_view(), name='payroll-add'),
+      path('process-payroll/preview/', PayrollPreviewView.as_view(), name='payroll-preview'),
+      path('payroll-runs/<int:pk>/status/', payroll_run_status, name='payroll-run-status'),
       path('', PayrollListView.as_view(), name='payroll-list'),
       path('payrolls/api/', PayrollListApiView.as_view(), name='payroll-list-api'),
       path('<int:pk>/delete/', delete_payroll, name='payroll-delete'),
+      path('<int:pk>/recompute/', recompute_payroll_view, name='payroll-recompute'),
+      path('<int:pk>/post/', post_payroll_view, name='payroll-post'),
       path('<int:pk>/detail/', PayrollDetailView.as_view(), name='payroll-detail'),
       path('payslips/', PayrollPayslipListView.as_view(), name='payroll-payslip'),
       path('print-payslip/<str:uri_params>/', generate_payslip, name='generate-payslip'),
+      path('<int:pk>/export-payslips/', export_payslips, name='export-payslips'),
       path('<int:pk>/initiate-payment-vouchers/', PayrollVoucherDetailView.as_view(), name='payroll-voucher'),
     
 
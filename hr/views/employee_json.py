@@ -16,7 +16,7 @@ class EmployeeListApiView(LoginRequiredMixin, BaseDatatableView):
     def render_column(self, row, column):
 
         if column == 'photo':
-            return row.photo.url
+            return row.photo_urls['list']
         
         if column == 'employee_id':
             return row.employee_id
@@ -57,7 +57,7 @@ class EmployeeListApiView(LoginRequiredMixin, BaseDatatableView):
             #  f"<span class='badge bg-{status}'>{row.get_status_display()}</span>"
         
         if column == 'first_name':  # Display employee photo with name
-            photo_url = row.photo.url
+            photo_url = row.photo_urls['list']
             url = reverse('employee-detail', args=[row.id])
 
             # return f'<img src="{photo_url}"  alt="contact-img" title="contact-img" class="rounded-circle me-2 avatar-sm"> <a href="{url}" class="text-body fw-semibold">{row.first_name} {row.last_name}</a>'
@@ -126,7 +126,7 @@ class DepartmentListApiView(LoginRequiredMixin, BaseDatatableView):
             if row.manager is None:
                 return 'N/A'
             else:
-                photo_url = row.manager.photo.url
+                photo_url = row.manager.photo_urls['avatar']
                 return f'<img src="{photo_url}"  alt="contact-img" title="contact-img" class="rounded-circle me-2" heigth="20px" width="30px"> {row.manager.first_name} {row.manager.last_name}'
         
         if column == 'id':
@@ -172,7 +172,7 @@ class JobHistoryListApiView(LoginRequiredMixin, BaseDatatableView):
         if column == 'employee':  # Display employee photo with name
             url = reverse('employee-detail', args=[row.employee.id])
 
-            return {'photoURL':row.employee.photo.url, 'staffURL':url,  'firstName':row.employee.first_name, 'lastName':row.employee.last_name }
+            return {'photoURL':row.employee.photo_urls['avatar'], 'staffURL':url,  'firstName':row.employee.first_name, 'lastName':row.employee.last_name }
             
         if column == 'id':
             return row.id
@@ -319,7 +319,7 @@ class SMSAPIView(LoginRequiredMixin, BaseDatatableView):
             return {'theme':theme, 'status':row.get_status_display()}
 
         if column == 'attendees':
-            return len(row.get_sms_employees())
+            return row.get_sms_employees().count()
 
         return super().render_column(row, column)
     
@@ -139,7 +139,7 @@ class LeaveBalanceAPIView(LoginRequiredMixin, BaseDatatableView):
         
         if column == 'employee':
             employee = row.employee
-            return {'name':f"{employee.first_name} {employee.last_name}", 'photo':employee.photo.url, 'status':employee.status}
+            return {'name':f"{employee.first_name} {employee.last_name}", 'photo':employee.photo_urls['avatar'], 'status':employee.status}
              
         return super().render_column(row, column)
       
@@ -1,11 +1,12 @@
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.contrib.auth.decorators import login_required, permission_required
 
-from hr.models.payroll import SalaryGrade, Tax, SalaryItem, Loan, CreditUnion, Payroll, Bank
+from hr.models.payroll import SalaryGrade, Tax, SalaryItem, Loan, CreditUnion, Payroll, Bank, PayrollEmployeeSummary, PayrollError
 from django_datatables_view.base_datatable_view import BaseDatatableView
 from django.utils.html import escape
 from datetime import date
-from django.db.models import Q, Count
+from django.db.models import Q, Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 import json
 from django.utils import timezone
 from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
@@ -268,7 +269,12 @@ class PayrollListApiView(LoginRequiredMixin, BaseDatatableView):
         return qs
     
     def get_initial_queryset(self):
-        return Payroll.objects.annotate(employee_count=Count('items__employee', distinct=True), employee_error=Count('errors__employee', distinct=True))
+        employee_count = PayrollEmployeeSummary.objects.filter(payroll=OuterRef('pk')).values('payroll').annotate(total=Count('id')).values('total')
+        employee_error = PayrollError.objects.filter(payroll=OuterRef('pk')).values('payroll').annotate(total=Count('employee', distinct=True)).values('total')
+        return Payroll.objects.completed().annotate(
+            employee_count=Coalesce(Subquery(employee_count), 0),
+            employee_error=Coalesce(Subquery(employee_error), 0),
+        )
             
 class BankListApiView(LoginRequiredMixin, BaseDatatableView):
     model = Bank 
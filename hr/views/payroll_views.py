@@ -1,18 +1,30 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.contrib.auth.decorators import login_required, permission_required
-from django.views.generic import ListView, CreateView, UpdateView, DetailView, DeleteView
-from django.urls import reverse_lazy
+from django.views.generic import ListView, CreateView, UpdateView, DetailView, DeleteView, FormView
+from django.urls import reverse, reverse_lazy
 from django.contrib import messages
 from django.utils import timezone
 from hr.models.payroll import *
 from hr.models.employee import Employee
 from django.db import transaction, DatabaseError, IntegrityError
-from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
-from ..forms.payroll_forms import SalaryItemForm, LoanForm, CreditUnionForm, PayrollForm
-from django.db.models import Q, Prefetch, Sum, Count
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from ..forms.payroll_forms import SalaryItemForm, LoanForm, CreditUnionForm, PayrollForm, VariableImportForm, CreditUnionImportForm
+from django.db.models import Q, Prefetch, Sum, Count, Exists, OuterRef
 from hr.models.payroll import SalaryGrade, Tax
-from .utils import compute_factor, get_filtered_staff_credit_union, get_filtered_staff_payroll
+from .utils import get_filtered_staff_credit_union, get_filtered_staff_payroll
+from hr.services.loan_repayments import post_loan_repayments
+from hr.services.payroll_preview import preview_payroll
+from hr.services.payroll_recompute import recompute_payroll
+from hr.services.payroll_runs import enqueue_payroll_run
+from hr.services.payroll_vouchers import get_voucher_totals
+from hr.services.remittances import get_remittances
+from hr.services.salary_items import assign_salary_item, recalculate_salary_item, recompute_factor_items
+from hr.services.credit_union_import import import_credit_union_members
+from hr.services.eligibility import matching_employees
+from hr.services.spreadsheets import SpreadsheetError
+from hr.services.variable_import import import_variables
+from hr.services.payslips import PAYSLIP_ITEM_FIELDS, PAYSLIP_TEMPLATE, build_payslip_context, stream_payslip_zip
 from decimal import Decimal
 import logging
 from pprint import pprint
@@ -192,30 +204,15 @@ class SalaryItemCreateView(LoginRequiredMixin, CreateView):
                     salary_item.delete()
                     return self.form_invalid(form)
 
-                print(salary_item.rate_type)
-
                 # We create staff salary item for each employee with this salary item
-                for employee in employees:
-                    # Deduce actual amount based on 'rate' of 'type' fix or factor
-                    # for fix rate, the rate amount is used
-                    # for factor, (rate amount / 100) * Basic or another salary item (rate amount)
-                    rate_type = salary_item.rate_type
-                    if rate_type == 'fix':
-                        amount = salary_item.rate_amount
-                    elif rate_type == 'factor':
-                        amount = compute_factor(employee, salary_item.rate_amount, salary_item.rate_dependency)
-                    else:
-                        # for variable, set the default amount to 0
-                        amount = 0
-                    StaffSalaryItem.objects.create(
-                        salary_item=salary_item,
-                        employee=employee,
-                        amount=amount,
-                    )
+                # for fix rate, the rate amount is used
+                # for factor, (rate amount / 100) * Basic or another salary item (rate amount)
+                # for variable, the default amount is 0
+                assigned = assign_salary_item(salary_item, employees)
 
-                messages.success(self.request, f"Salary item [{form.instance.item_name}] successfully created and applied to { employees.count() } employee(s)")
+                messages.success(self.request, f"Salary item [{form.instance.item_name}] successfully created and applied to { assigned } employee(s)")
             
-                salary_item.update_eligible_employee_count()
+                salary_item.update_eligible_employee_count(assigned)
                 return redirect(self.get_success_url())
 
             except IntegrityError:
@@ -239,79 +236,51 @@ class SalaryItemUpdateView(LoginRequiredMixin, UpdateView):
             return reverse_lazy('salaryitem-employee', kwargs={'pk':salary_item.id})
     
     def get_context_data(self, **kwargs):
-        salary_item = self.get_object()
+        salary_item = self.object
         context =  super().get_context_data(**kwargs)
         context['title'] = f"Update {salary_item.item_name}"
         context['rate_type'] = self.request.POST.get('rate_type') if self.request.method == "POST" else salary_item.rate_type
         context['rate_dependency'] = self.request.POST.get('rate_dependency') or salary_item.rate_dependency 
-        context['real_old_employees'] = salary_item.get_eligible_employees()
         return context
     
 
     def form_valid(self, form):
-        # Retrieve the previous instance before saving changes to get old state of eligible employees (will be used later for accurate comparision of new state of employee)
-        old_instance = self.get_object()
-        old_employees = set(old_instance.get_eligible_employees())
+        # The form's initial data holds the state of the salary item before this update, the existing
+        # staff salary items hold its old eligible employees, so only the new state is evaluated, in SQL
+        previous_rate_type = form.initial['rate_type']
 
         with transaction.atomic():
             try:
                 new_instance = form.save() #commit=False
                 # Fetch eligible employees for new instanace after saving
-
-                new_employees = set(new_instance.get_eligible_employees())
+                new_employees = new_instance.get_eligible_employees()
+                new_employee_count = new_employees.count()
 
                 #Ensure filter(s) returns at least one employee for this salary item
-                if len(new_employees) == 0:
+                if new_employee_count == 0:
                     form.add_error(None, "Selected filter(s) did not affect any employee. Please rectify and proceed")
                     return self.form_invalid(form)
 
-                # Deduce employees states to add or delete
-                employees_to_add = new_employees - old_employees
-                employees_to_remove = old_employees - new_employees
-        
+                staff_salary_items = StaffSalaryItem.objects.filter(salary_item=new_instance)
+
+                # Remove staff salary items for employees no longer eligible, inactive employees the item still selects keep theirs
+                removed, _ = staff_salary_items.exclude(employee_id__in=matching_employees(new_instance).values('id')).delete()
+
                 # Update amount for existig employees
-                if (old_instance.rate_type != new_instance.rate_type or
-                    old_instance.rate_amount != new_instance.rate_amount or
-                    old_instance.rate_dependency != new_instance.rate_dependency):
-
-                    for staff_salary in StaffSalaryItem.objects.filter(salary_item=old_instance, employee__in=old_employees):
-                        if new_instance.rate_type == 'fix':
-                            # set amount directly
-                            staff_salary.amount = new_instance.rate_amount
-                            # reset variable if there is a transition
-                            if old_instance.rate_type == 'variable':
-                                staff_salary.variable = 0
-
-                        elif new_instance.rate_type == 'factor':
-                            # compute amount based on dependency and rate
-                            staff_salary.amount = compute_factor(staff_salary.employee, new_instance.rate_amount, new_instance.rate_dependency)
-                        elif new_instance.rate_type == 'variable':
-                            # if transition is from 'non variable' to variable, set the amount if previous variable exist or 0 for later updates..
-                            staff_salary.amount = staff_salary.variable * new_instance.rate_amount  if staff_salary.variable else 0
-                        staff_salary.save()
-
-                # Remove staff salary items for employees no longer eligible
-                StaffSalaryItem.objects.filter(salary_item=old_instance, employee__in=employees_to_remove).delete()
-
-                # Add staff salary items for newly eligible employees
-                for employee in employees_to_add:
-                    if new_instance.rate_type == 'fix':
-                        amount = new_instance.rate_amount
-                    elif new_instance.rate_type == 'factor':
-                        amount = compute_factor(employee, new_instance.rate_amount, new_instance.rate_dependency)
-                    else:
-                        # Variable rate type; initialize amount as 0, allowing future updates per employee
-                        amount = 0
-                    
-                    StaffSalaryItem.objects.create(
-                        salary_item=new_instance,
-                        employee=employee,
-                        amount=amount
-                    )
-                # form.save_m2m()
-                messages.success(self.request, f"Salary item [{form.instance.item_name}] successfully updated and applied to { len(new_employees) } employee(s)")
+                rate_changed = bool({'rate_type', 'rate_amount', 'rate_dependency'} & set(form.changed_data))
+                if rate_changed:
+                    recalculate_salary_item(new_instance, previous_rate_type)
+
+                # Add staff salary items for newly eligible employees, variable items start at 0 allowing future updates per employee
+                assigned = assign_salary_item(new_instance, new_employees.exclude(Exists(staff_salary_items.filter(employee_id=OuterRef('pk')))))
+
+                # factor items computed from this item follow its new amounts and employees, once every row is in place
+                if rate_changed or removed or assigned:
+                    recompute_factor_items(item_ids=[new_instance.id])
+
+                messages.success(self.request, f"Salary item [{form.instance.item_name}] successfully updated and applied to { new_employee_count } employee(s)")
 
-                self.object.update_eligible_employee_count()
+                self.object.update_eligible_employee_count(new_employee_count)
                 return redirect(self.get_success_url())    
                 # return super().form_valid(form)
 
@@ -364,7 +333,8 @@ class SalaryItemVariableDetailView(LoginRequiredMixin, DetailView):
         context = super().get_context_data(**kwargs)
         salary_item = self.get_object()
         context['title'] = f"{salary_item.item_name} Employees Variable Set"
-        context['employees'] = StaffSalaryItem.objects.filter(salary_item=salary_item)
+        context['employees'] = StaffSalaryItem.objects.filter(salary_item=salary_item).select_related('employee')
+        context['import_form'] = VariableImportForm()
         return context
 
     def get_success_url(self):
@@ -377,23 +347,59 @@ class SalaryItemVariableDetailView(LoginRequiredMixin, DetailView):
 
         if self.request.method == "POST":
             with transaction.atomic():
+                updated = []
+                now = timezone.now()
                 for item in StaffSalaryItem.objects.filter(salary_item=salary_item):
                     variable_key = f"variable_{item.id}"
                     variable = self.request.POST.get(variable_key)
 
-                    try:
-                      if variable:
-                        amount = int(salary_item.rate_amount) * int(variable)
-                        item.amount = amount
+                    if variable:
+                        item.amount = int(salary_item.rate_amount) * int(variable)
                         item.variable = variable
-                        item.save()                  
-                    except DatabaseError as e:
-                        messages.error(self.request, "An error occured while updating employees variable, try again later")
+                        item.updated_at = now
+                        updated.append(item)
 
+                try:
+                    StaffSalaryItem.objects.bulk_update(updated, ['amount', 'variable', 'updated_at'], batch_size=1000)
+                    # factor items computed from this item follow the new amounts
+                    recompute_factor_items(item_ids=[salary_item.id])
+                except DatabaseError as e:
+                    messages.error(self.request, "An error occured while updating employees variable, try again later")
                 
                 messages.success(self.request, f"{salary_item.item_name} employee(s) variable updated successfully")
                 return redirect(self.get_success_url()) #self.form_valid(form)
 
+@login_required
+def import_salary_item_variables(request, pk):
+    salary_item = get_object_or_404(SalaryItem, id=pk)
+    form = VariableImportForm(request.POST or None, request.FILES or None)
+
+    if request.method == "POST" and form.is_valid():
+        upload = form.cleaned_data['file']
+        try:
+            with transaction.atomic():
+                summary = import_variables(salary_item, upload, upload.name)
+        except SpreadsheetError as e:
+            messages.error(request, str(e))
+            return redirect('salaryitem-variable', pk=salary_item.id)
+        except DatabaseError as e:
+            logger.error(e)
+            messages.error(request, "A database error occured while importing variables, try again later")
+            return redirect('salaryitem-variable', pk=salary_item.id)
+
+        if summary['errors']:
+            # only the first few rows are listed, the rest are summarised
+            for error in summary['errors'][:10]:
+                messages.warning(request, f"Row {error['row']} ({error['employee_id'] or 'no staff ID'}): {error['message']}")
+            messages.warning(request, f"Imported {summary['updated']} variable(s), {len(summary['errors'])} row(s) skipped")
+        else:
+            messages.success(request, f"Imported {summary['updated']} variable(s) for {salary_item.item_name}")
+        return redirect('salaryitem-employee', pk=salary_item.id)
+
+    for error in form.errors.get('file', []):
+        messages.error(request, error)
+    return redirect('salaryitem-variable', pk=salary_item.id)
+
 # Loan
 
 class LoanListView(LoginRequiredMixin, ListView):
@@ -667,6 +673,7 @@ class CreditUnionSetEmployeeDetailView(LoginRequiredMixin, DetailView):
         credit_union = self.get_object()
         context['title'] = f"{credit_union} - Set Employees Details"
         context['staff_credit_unions'] = StaffCreditUnion.objects.filter(credit_union=credit_union)
+        context['import_form'] = CreditUnionImportForm()
       
         return context
 
@@ -682,13 +689,20 @@ class CreditUnionSetEmployeeDetailView(LoginRequiredMixin, DetailView):
                 errors = []
                 entries_to_update = []
 
+                # every targeted row is fetched with a single query, malformed ids are reported per line below
+                staff_credit_unions = StaffCreditUnion.objects.filter(credit_union=self.get_object()).select_related('employee').in_bulk([id for id in id_list if id.isdigit()])
+
                 for i in range(len(amount_list)):
                     # retrieve individual records
                     amount = amount_list[i]
                     start_date = start_date_list[i]
                     end_date = end_date_list[i]
                     id = id_list[i]
-                    staff_credit_union = StaffCreditUnion.objects.get(id=id)
+                    staff_credit_union = staff_credit_unions.get(int(id)) if id.isdigit() else None
+                    if staff_credit_union is None:
+                        errors.append(f"Record on line {line} is not a member of this credit union")
+                        line += 1
+                        continue
                     # if start date and end date are supplied, ensure sanity. end date can not be earlier than start date
                     if end_date and start_date:
                         if end_date < start_date:
@@ -725,6 +739,37 @@ class CreditUnionSetEmployeeDetailView(LoginRequiredMixin, DetailView):
              except DatabaseError:
                  return JsonResponse({'status':'error', 'message':'An error occured while processing record. Try again later'})
 
+@login_required
+def import_credit_union_members_view(request, pk):
+    credit_union = get_object_or_404(CreditUnion, id=pk)
+    form = CreditUnionImportForm(request.POST or None, request.FILES or None)
+
+    if request.method == "POST" and form.is_valid():
+        upload = form.cleaned_data['file']
+        try:
+            with transaction.atomic():
+                summary = import_credit_union_members(credit_union, upload, upload.name)
+        except SpreadsheetError as e:
+            messages.error(request, str(e))
+            return redirect('creditunion-set-details', pk=credit_union.id)
+        except DatabaseError as e:
+            logger.error(e)
+            messages.error(request, "A database error occured while importing employee details, try again later")
+            return redirect('creditunion-set-details', pk=credit_union.id)
+
+        if summary['errors']:
+            # only the first few rows are listed, the rest are summarised
+            for error in summary['errors'][:10]:
+                messages.warning(request, f"Row {error['row']} ({error['employee_id'] or 'no staff ID'}): {error['message']}")
+            messages.warning(request, f"Updated {summary['updated']} employee(s), {len(summary['errors'])} row(s) skipped")
+        else:
+            messages.success(request, f"Updated {summary['updated']} employee(s) of {credit_union}")
+        return redirect('creditunion-set-details', pk=credit_union.id)
+
+    for error in form.errors.get('file', []):
+        messages.error(request, error)
+    return redirect('creditunion-set-details', pk=credit_union.id)
+
 class PayrollCreateView(LoginRequiredMixin, CreateView):
     model = Payroll
     template_name = 'hr/payroll/process_payroll.html'
@@ -737,245 +782,48 @@ class PayrollCreateView(LoginRequiredMixin, CreateView):
         return context
 
     def form_valid(self, form):
-        # ensure atomicity
         cleaned_data = form.cleaned_data
-        
-        synthetic_employees = get_filtered_staff_payroll(cleaned_data)
-        error_mode = cleaned_data['error_mode']
 
-        with transaction.atomic():
-            try:
-                # commit the form to get the instance
-                payroll_instance = form.save(commit=False)
-                if form.errors:
-                    errors = form.add_error
-                    return JsonResponse({'errors':errors}, status=400)
-
-                # retrieve filtered eligible employees and proceed with detailed processing of salary items, banks, loan etc
-                if len(synthetic_employees) == 0:
-                    return JsonResponse({'status':'fail', 'message':'Your selected filters did not match any employees. Please adjust and try again.'})
-
-                # Begin payroll processing as we loop through synthetic employee
-                bulk_entries = []; error_entries = []; errors = []; success_message = ''; invalid_employees = set()
-
-                # Retrieve payment rate and use it on every amount
-                payment_rate = cleaned_data['payment_rate']
-                today = date.today()
-
-                for employee in synthetic_employees:
-                    staff_total_earnings = 0; staff_total_deductions = 0; total_credit = 0; total_debit = 0
-
-                    # 1. Tax
-                    if not employee.salary_grade:
-                        errors.append(f"{employee}: Update salary grade details (grade/step/amount)")
-                        # raise an error (set basic salary for grade salary_grade)
-                        error_entries.append(PayrollError(employee=employee, payroll=payroll_instance, error_category='salary_grade'))
-                        continue
+        # processing is done in the background by the process_payroll_runs command, the page polls the run's status
+        if not get_filtered_staff_payroll(cleaned_data).exists():
+            return JsonResponse({'status':'fail', 'message':'Your selected filters did not match any employees. Please adjust and try again.'})
 
-                    salary_grade = employee.salary_grade
-                    basic_salary = float(salary_grade.amount)
-                    step = salary_grade.grade_step
+        try:
+            run = enqueue_payroll_run(cleaned_data, self.request.user)
+        except DatabaseError as e:
+            logger.error(e)
+            return JsonResponse({'status':'fail', 'message':'A database error occured while queueing payroll. Please try again later'})
+
+        logger.info(f"{run} queued by {self.request.user}")
+        return JsonResponse({
+            'status': 'queued',
+            'message': 'Payroll has been queued for processing',
+            'status_url': reverse('payroll-run-status', args=[run.id]),
+        })
 
-                    # compute tax relief
-                    tax_relief = employee.tax_relief or 0
-                    if tax_relief > 0:
-                        tax_relief = (payment_rate * tax_relief) / 100
+    def form_invalid(self, form):
+        errors = form.errors
+        return JsonResponse({'errors': errors}, status=400)
 
-                    # Check if employee has bank details
-                    if not employee.bank: # or employee.bank.account == None: all in one check..
-                        errors.append(f"{employee}: Update bank details (bank/account number/branch etc)")
-                        # raise an error bank such as either employee has not bank information or bank is not link to chart of account code..
-                        error_entries.append(PayrollError(employee=employee, payroll=payroll_instance, error_category='bank'))
-                        continue
+class PayrollPreviewView(LoginRequiredMixin, FormView):
+    """Dry run of the process payroll form: compute and aggregate the payroll without writing anything"""
+    form_class = PayrollForm
+    http_method_names = ['post']
 
-                    # compute for employee & employer ssnits
-                    employer_ssnit = (basic_salary * 13) / 100
-                    employee_ssnit = (basic_salary * 5.5) / 100
-
-                    # get this employee salary items
-                    staff_salary_items = StaffSalaryItem.objects.filter(Q(employee=employee) & Q(amount__gt=0) & (Q(salary_item__expires_on__isnull=True) | Q(salary_item__expires_on__gte=today)) )
-
-                    # if there exists some records, then proceed
-                    if staff_salary_items.exists():
-                        for staff_item in staff_salary_items:
-                            item_amount = float(staff_item.amount) #* payment_rate) / 100
-                            
-                            if staff_item.salary_item.effect == 'addition':
-                                item_entry = 'debit' 
-                                staff_total_earnings += item_amount
-                                # total_debit += item_amount
-                            else:
-                                item_entry = 'credit'
-                                staff_total_deductions += item_amount
-                                # total_credit += item_amount
-
-                            # save this item
-                            bulk_entries.append(PayrollItem(payroll=payroll_instance, employee=employee, item_type='salary_item', dependency=staff_item.salary_item.id, amount=item_amount, entry=item_entry, salary_item=staff_item.salary_item))
-
-                    # get this employee credit unions deductions
-                    staff_credit_unions = StaffCreditUnion.objects.filter(employee=employee, amount__isnull=False).filter(
-                        Q(deduction_start_date__isnull=False,
-                          deduction_end_date__isnull=True,
-                          deduction_start_date__lte=today
-                        ) |
-                        Q(deduction_start_date__isnull=False,
-                          deduction_end_date__isnull=False,
-                          deduction_start_date__lte=today,
-                          deduction_end_date__gte=today
-                        )
-                    )
-                    # check for the existence of active credit unions
-                    if staff_credit_unions.exists():
-                        for staff_credit_union in staff_credit_unions:
-                            monthly_deduction = staff_credit_union.amount
-
-                            StaffCreditUnionDeduction.objects.create(staff_credit_union=staff_credit_union, amount_paid=monthly_deduction, date_paid=today)
-                            # Add monthly deduction to total deduction
-                            staff_total_deductions += monthly_deduction
-                            # Save credit union
-                            bulk_entries.append(PayrollItem(payroll=payroll_instance, employee=employee, item_type='credit_union', description=staff_credit_union.credit_union.union_name,  amount=monthly_deduction, dependency=staff_credit_union.credit_union.id,  entry='credit', credit_union=staff_credit_union.credit_union))
-
-                    # get employee loan(s)
-                    staff_loans = Loan.objects.filter(employee=employee, status='active', outstanding_balance__gt=0, deduction_end_date__gt=today)
-                    # if there are indeed active loans
-                    if staff_loans.exists():
-                        for loan in staff_loans:
-                            outstanding_balance = loan.outstanding_balance
-                            monthly_installment = loan.monthly_installment
-                            """pay monthly installment if outstanding balance is greater else pay what it is left. This is because there is a posibility for employee to pay some using other means (like bank transfer/pay-in-slip) apart from payroll"""
-                            
-                            repayment_amount = min(monthly_installment, outstanding_balance)
-
-                            # LoanRepayment.objects.create(loan=loan, amount_paid=repayment_amount)
-                            # Call LoanRepayment in the finance app when PV is posted..
-
-                            # add repayment amount total deduction
-                            staff_total_deductions += repayment_amount
-                            # save individual loan
-                            bulk_entries.append(PayrollItem(payroll=payroll_instance, employee=employee, item_type='loan', description=loan.get_loan_type_display(),  amount=repayment_amount, dependency=loan.id,  entry='credit', loan=loan))
-                           
-                            # total_credit += repayment_amount
-                    # save earnings and deductions
-                    bulk_entries.append(PayrollItem(payroll=payroll_instance, employee=employee, item_type='earning',  amount=staff_total_earnings,  entry='debit'))
-                    
-                    bulk_entries.append(PayrollItem(payroll=payroll_instance, employee=employee, item_type='deduction',  amount=staff_total_deductions,  entry='credit'))
-                   
-                    """add total staff earnings to basic salary which will be gross/taxable.."""
-                    gross = (basic_salary + staff_total_earnings)
-                    taxable = gross
-                    # take out employee ssnit from taxable/basic
-                    taxable -= employee_ssnit
-                    # take out tax relief
-                    taxable -= tax_relief
-
-                    # Now compute for tax
-                    income_tax = Tax.calculate_tax(payroll_instance.process_year, taxable)
-
-                    # Add tax and employee ssnit to staff total deductions
-                    staff_total_deductions = float(staff_total_deductions)
-                    staff_total_deductions += (income_tax  + employee_ssnit)
-
-                    # compute for net salary
-                    net = gross - staff_total_deductions
-
-                    total_debit = gross 
-                    total_credit = net + staff_total_deductions
-                    
-                    #save net salary
-                    bulk_entries.append(PayrollItem(payroll=payroll_instance, employee=employee, item_type='net_salary', amount=net, entry='credit'))
-                    # save gross salary
-                    bulk_entries.append(PayrollItem(payroll=payroll_instance, employee=employee, item_type='gross_salary', amount=gross, entry='credit'))
-                    # save taxability
-                    bulk_entries.append(PayrollItem(payroll=payroll_instance, employee=employee, item_type='taxability', amount=taxable, entry='credit'))
-                   
+    def form_valid(self, form):
+        cleaned_data = form.cleaned_data
 
-                    # save bank 
-                    bulk_entries.append(PayrollItem(payroll=payroll_instance, employee=employee, item_type='bank', amount=net, dependency=employee.bank.id, entry='credit', bank=employee.bank))
-                    # Save payroll items which are not dynamically gotten from loop
-                    # save basic salary
-                    bulk_entries.append(PayrollItem(payroll=payroll_instance, employee=employee, item_type='basic_salary', amount=basic_salary,  entry='debit'))
-                    # save salary grade
-                    bulk_entries.append(PayrollItem(payroll=payroll_instance, employee=employee, item_type='salary_grade', dependency=salary_grade.id))
-                    # save step
-                    bulk_entries.append(PayrollItem(payroll=payroll_instance, employee=employee, item_type='step', dependency=salary_grade.grade_step.id))
-                    # save tax
-                    bulk_entries.append(PayrollItem(payroll=payroll_instance, employee=employee, item_type='tax', amount=income_tax, entry='credit'))
-                    # save employer & employee ssnit
-                    bulk_entries.append(PayrollItem(payroll=payroll_instance, employee=employee, item_type='employer_ssnit', amount=employer_ssnit, entry='credit'))
-                    bulk_entries.append(PayrollItem(payroll=payroll_instance, employee=employee, item_type='employee_ssnit', amount=employee_ssnit, entry='credit'))
-                    # save tax relief
-                    bulk_entries.append(PayrollItem(payroll=payroll_instance, employee=employee, item_type='tax_relief', amount=tax_relief, entry='debit'))
-
-                    # print(f"basic: {basic_salary} - tax: {income_tax} 'step: {step} - tax relief: {tax_relief} - ssnit employer: {employer_ssnit} - ssnit employee: {employee_ssnit} - net: {net}")
-
-                    logger.info(f"Employee: {employee} Total Credit: {total_credit} - Total Debit: {total_debit}")
-
-                    """Test double entry"""
-                    logger.info("Double entry check, total credit against total debit")
-                    
-                    # temporarily add additonal debit to joyce item for demonstration purposes..
-                    if employee.id == 7:
-                        total_debit += 1
-
-                    if total_credit != total_debit:
-                        msg = f"{employee}: Total credit {total_credit} differs from debit {total_debit}"
-                        logger.warning(msg)
-                        errors.append(msg)
-                        error_entries.append(PayrollError(employee=employee, payroll=payroll_instance, error_category='double_entry'))
-                        invalid_employees.add(employee.id)
-                        # clear employee records from PayrollItem
-                        continue                   
-
-                    """Unlike my first version which was made in PHP (CodeIgniter) that strictly required that all data about employee must be intact before processing, this version should inform the admin of missing/vital details of certain employees and give them the option to proceed with processing without those employee(s). However, the system will document or keep these employees along with what they lacked whether (bank, salary grade, basic salary etc). Also, the system will be able to process the payroll without the mapping of real chart of account to payroll items such loans, credit unions, salary items etc, but in processing the processed payrolls for payment, those details will be mandatory since eventually, these funds must hit final accounts"""
-
-                # for                
-                # Filter out employee that has double entry issue..exclude them from payrollItem
-                bulk_entries = [entry for entry in bulk_entries if entry.employee.id not in invalid_employees]
-
-                # if error mode is strict, keep reporting when there are errors
-                if error_mode == 'strict':
-                    if errors:
-                        # Strict mode: abort and return the list of errors for the template
-                        logger.warning(f"Strict mode aborted due to {len(errors)} error(s).")
-                        return JsonResponse({'status':'fail', 'message':list(errors), 'option':True}, safe=False)
-                    else:
-                        # Strict mode: processed without warnings
-                        logger.info("Strict mode processing: No errors found.")
-                        payroll_instance.save()
-                        PayrollItem.objects.bulk_create(bulk_entries)
-                        success_message = f"Payroll processed {len(synthetic_employees)} employee(s) successfully"         
-                else:
-                    # Mute mode: Process regardless of errors but saved for later reference
-                    logger.info("Mute mode: Processing with errors logged for review.")
-                    # if there are errors, save the error related object and save payroll and commit..
-                    payroll_instance.save()
-                    PayrollItem.objects.bulk_create(bulk_entries)
-                    
-                    if errors and error_entries:
-                        # Error saved for future reference
-                        logger.warning(f"Processed {len(synthetic_employees)} employee(s) with {len(error_entries)} warning(s). Errors logged.")
-                        PayrollError.objects.bulk_create(error_entries)
-                        success_message = f"Payroll processed {len(synthetic_employees)} employee(s) successfully with {len(error_entries)} warning(s)"
-                    else:
-                        # No warnings, mute mode was effectively a clean run
-                        logger.info("Mute mode processed successfully without warnings.")
-                        success_message = f"Payroll processed {len(synthetic_employees)} employee(s) successfully"
-                # Final log and success response if everything is clean
-                logger.info(success_message)
-                return JsonResponse({'status': 'success', 'message': success_message})
-
-            # try
-
-        # with transaction
-    
-            except DatabaseError as e:
-                logger.error(e)
-                self.form_invalid(form)
-                return JsonResponse({'status':'fail', 'message':'A database error occured while processing payroll. Please try again later'})
-            except IntegrityError as e:
-                logger.error(e)
-                self.form_invalid(form)
-                return JsonResponse({'status':'fail', 'message':"An error occured during processing. Please try again later"})
+        eligible_employees = get_filtered_staff_payroll(cleaned_data)
+        if not eligible_employees.exists():
+            return JsonResponse({'status':'fail', 'message':'Your selected filters did not match any employees. Please adjust and try again.'})
+
+        try:
+            preview = preview_payroll(form.save(commit=False), eligible_employees)
+        except DatabaseError as e:
+            logger.error(e)
+            return JsonResponse({'status':'fail', 'message':'A database error occured while previewing payroll. Please try again later'})
+
+        return JsonResponse({'status': 'success', 'preview': preview})
 
     def form_invalid(self, form):
         errors = form.errors
@@ -983,6 +831,7 @@ class PayrollCreateView(LoginRequiredMixin, CreateView):
 
 class PayrollListView(LoginRequiredMixin, ListView):
     model = Payroll
+    queryset = Payroll.objects.completed()
     template_name = 'hr/payroll/payroll_list.html'
     context_object_name = 'payroll_list'
 
@@ -993,6 +842,7 @@ class PayrollListView(LoginRequiredMixin, ListView):
 
 class PayrollDetailView(LoginRequiredMixin, DetailView):
     model = Payroll
+    queryset = Payroll.objects.completed()
     template_name = 'hr/payroll/payroll_detail.html'
     context_object_name = 'payroll'
 
@@ -1000,54 +850,26 @@ class PayrollDetailView(LoginRequiredMixin, DetailView):
         context =  super().get_context_data(**kwargs)
         payroll = self.get_object()
         context['title'] = f"{payroll}"
-        # Get distinct employees and for each employee, get net
-        payroll_employees = []
-        employees = Employee.objects.filter(payroll_items__payroll=self.get_object()).distinct().prefetch_related(
-            Prefetch(
-                'payroll_items',
-                queryset=PayrollItem.objects.filter(payroll=payroll, item_type='bank'),
-                to_attr='bank_items'
-            ),
-            Prefetch(
-                'payroll_items',
-                queryset=PayrollItem.objects.filter(payroll=payroll, item_type='salary_grade'),
-                to_attr='salary_grade_items'
-            )
-        )
-
-        for employee in employees:
-            # Ensure bank item returned  valid data to avoid ValueError/AttributeError Exception
-            bank_item = employee.bank_items[0] if employee.bank_items else None
-            # Repeat same for salary_grade_item
-            salary_grade_item = employee.salary_grade_items[0] if employee.salary_grade_items else None
-
-            # Retrieve actual bsnk and salary grade data
-            net_salary = bank_item.amount or 0
-            salary_grade = salary_grade_item.description or 'N/A'
-            bank_name = employee.bank.bank_name or 'N/A'
-            branch = employee.branch or 'N/A'
-            
-            payroll_employees.append({
-                'employee': f"{employee.first_name} {employee.last_name}",
-                'net_salary': net_salary,
-                'bank_name': f"{bank_name} ({branch})", 
-                'account_number':employee.account_number or 'N/A'
-            })
-            context['payroll_employees'] = payroll_employees
-        # for
+        # Each employee's net salary and bank is kept on their payroll summary row
+        summaries = PayrollEmployeeSummary.objects.filter(payroll=payroll).select_related('employee', 'bank').order_by('employee__first_name', 'employee__last_name')
+
+        context['payroll_employees'] = [
+            {
+                'employee': f"{summary.employee.first_name} {summary.employee.last_name}",
+                'net_salary': summary.net_salary,
+                'bank_name': f"{summary.bank.bank_name if summary.bank else 'N/A'} ({summary.employee.branch or 'N/A'})",
+                'account_number': summary.employee.account_number or 'N/A'
+            }
+            for summary in summaries
+        ]
 
         # Get distinct bank involved in this payroll and compute the total of employee's net salary under each bank
-
-        payroll_banks = Bank.objects.filter(employees__payroll_items__payroll=payroll).distinct().annotate(
-            total_amount=Sum('employees__payroll_items__amount', filter=Q(employees__payroll_items__payroll=payroll, employees__payroll_items__item_type='bank')), 
-            employee_count=Count('employees', distinct=True, filter=Q(employees__payroll_items__payroll=payroll))
-            )
-        for bank in payroll_banks:
-            pprint(vars(bank))
-
+        payroll_banks = PayrollEmployeeSummary.objects.filter(payroll=payroll).values('bank__bank_name').annotate(
+            total_amount=Sum('net_salary'), employee_count=Count('id')
+        ).order_by('bank__bank_name')
 
         context['payroll_banks'] = [
-            {'bank_name':bank.bank_name, 'amount': bank.total_amount, 'employee_count':bank.employee_count}
+            {'bank_name':bank['bank__bank_name'] or 'N/A', 'amount': bank['total_amount'], 'employee_count':bank['employee_count']}
 
             for bank in payroll_banks
         ]
@@ -1059,7 +881,7 @@ class PayrollDetailView(LoginRequiredMixin, DetailView):
 
 @login_required  
 def delete_payroll(request, pk):
-    payroll = Payroll.objects.get(id=pk)
+    payroll = get_object_or_404(Payroll.objects.completed(), id=pk)
 
     if request.method == "POST":
         payroll.delete()
@@ -1068,10 +890,80 @@ def delete_payroll(request, pk):
 
     return render(request, 'core/delete.html', {'obj':payroll, 'title': f'Delete {payroll}?'})
 
+@login_required
+def recompute_payroll_view(request, pk):
+    payroll = get_object_or_404(Payroll.objects.completed(), id=pk)
+
+    if request.method == "POST":
+        if payroll.posted:
+            messages.error(request, f"{payroll} has been posted and can no longer be recomputed")
+            return redirect('payroll-detail', pk=payroll.id)
+
+        try:
+            summary = recompute_payroll(payroll)
+        except DatabaseError as e:
+            logger.error(e)
+            messages.error(request, 'A database error occured while recomputing payroll. Please try again later')
+            return redirect('payroll-detail', pk=payroll.id)
+
+        if summary['errors']:
+            messages.warning(request, f"Recomputed {summary['recomputed']} employee(s) with {summary['errors']} warning(s), {summary['unchanged']} unchanged")
+        else:
+            messages.success(request, f"Recomputed {summary['recomputed']} employee(s), {summary['unchanged']} unchanged")
+
+    return redirect('payroll-detail', pk=payroll.id)
+
+@login_required
+def post_payroll_view(request, pk):
+    payroll = get_object_or_404(Payroll.objects.completed(), id=pk)
+
+    if request.method == "POST":
+        if payroll.posted:
+            messages.error(request, f"{payroll} has already been posted")
+            return redirect('payroll-detail', pk=payroll.id)
+
+        try:
+            with transaction.atomic():
+                repayments = post_loan_repayments(payroll)
+                payroll.posted = True
+                payroll.save(update_fields=['posted', 'updated_at'])
+        except DatabaseError as e:
+            logger.error(e)
+            messages.error(request, 'A database error occured while posting payroll. Please try again later')
+            return redirect('payroll-detail', pk=payroll.id)
+
+        # posted payrolls no longer change, compute the cached credit union remittances up front
+        get_remittances(payroll)
+        messages.success(request, f"{payroll} posted with {repayments} loan repayment(s)")
+
+    return redirect('payroll-detail', pk=payroll.id)
+
+@login_required
+def payroll_run_status(request, pk):
+    run = get_object_or_404(PayrollRun, id=pk)
+
+    data = {
+        'status': run.status,
+        'total': run.total,
+        'processed': run.processed,
+        'error_count': run.error_count,
+        'message': run.message,
+        'timings': run.timings,
+    }
+
+    if run.status == PayrollRun.Status.FAILED and run.errors:
+        # Strict mode abort: list the errors and give the option of switching to mute mode
+        data.update({'message': run.errors, 'option': True})
+    elif run.status == PayrollRun.Status.COMPLETED:
+        data['redirect_url'] = reverse('payroll-list')
+
+    return JsonResponse(data)
+
 
 
 class PayrollPayslipListView(LoginRequiredMixin, ListView):
     model = Payroll
+    queryset = Payroll.objects.completed()
     template_name = 'hr/payroll/payslip_list.html'
     context_object_name = 'payrolls'
 
@@ -1084,53 +976,25 @@ class PayrollPayslipListView(LoginRequiredMixin, ListView):
         # Ensure the request header is an ajax request
         if request.headers.get('x-requested-with') == "XMLHttpRequest":
             payroll_id = request.GET.get('payroll_id')
-            payroll = get_object_or_404(Payroll, id=payroll_id)
-
-            # Get employees for this payroll and related items from payroll items
-            payroll_employees = Employee.objects.filter(payroll_items__payroll=payroll).distinct().prefetch_related(
-                Prefetch(
-                    'payroll_items',
-                    queryset=PayrollItem.objects.filter(payroll=payroll),
-                    to_attr='all_payroll_items'
-                )
-            )
-            employee_data = []
-            for employee in payroll_employees:
-                basic_salary = None; gross_salary = None; net_salary = None; 
-                earning = None; deduction = None; tax = None; employee_ssnit = None
-
-                for item in employee.all_payroll_items:
-                    if not basic_salary and item.item_type == 'basic_salary':
-                        basic_salary = item.amount
-                    if not gross_salary and item.item_type == 'gross_salary':
-                        gross_salary = item.amount
-                    if not net_salary and item.item_type == 'net_salary':
-                        net_salary = item.amount
-                    if not earning and item.item_type == 'earning':
-                        earning = item.amount
-                    if not deduction and item.item_type == 'deduction':
-                        deduction = item.amount
-                    if not tax and item.item_type == 'tax':
-                        tax = item.amount
-                    if not employee_ssnit and item.item_type == 'employee_ssnit':
-                        employee_ssnit = item.amount
-
-                    # Exit if all match are found
-                    if basic_salary and gross_salary and net_salary and tax and employee_ssnit and earning and deduction:
-                        break
-                
-                employee_data.append({
-                    'id':employee.id,
-                    'employee_id':employee.employee_id,
-                    'employee':f"{employee.first_name} {employee.last_name}",
-                    'basic_salary': basic_salary,
-                    'gross_salary':gross_salary,
-                    'net_salary':net_salary,
-                    'tax':tax,
-                    'employee_ssnit':employee_ssnit,
-                    'earning':earning,
-                    'deduction':deduction
-                })
+            payroll = get_object_or_404(Payroll.objects.completed(), id=payroll_id)
+
+            # Get employees for this payroll along with their figures from the payroll summary
+            summaries = PayrollEmployeeSummary.objects.filter(payroll=payroll).select_related('employee')
+            employee_data = [
+                {
+                    'id':summary.employee.id,
+                    'employee_id':summary.employee.employee_id,
+                    'employee':f"{summary.employee.first_name} {summary.employee.last_name}",
+                    'basic_salary': summary.basic_salary,
+                    'gross_salary':summary.gross_salary,
+                    'net_salary':summary.net_salary,
+                    'tax':summary.tax,
+                    'employee_ssnit':summary.employee_ssnit,
+                    'earning':summary.earning,
+                    'deduction':summary.deduction
+                }
+                for summary in summaries
+            ]
 
             return JsonResponse({'employees':employee_data}, safe=False)
                    
@@ -1148,7 +1012,7 @@ def generate_payslip(request, uri_params):
 
     try:
         employee = Employee.objects.get(employee_id=employee_id)
-        payroll = Payroll.objects.get(id=payroll_id) 
+        payroll = Payroll.objects.completed().get(id=payroll_id)
     except Employee.DoesNotExist:
         raise Http404("Employee Not Found")
     except Payroll.DoesNotExist:
@@ -1156,72 +1020,18 @@ def generate_payslip(request, uri_params):
     
 
     # get payroll items and fetch earnings & deductions
-    payroll_items = PayrollItem.objects.filter(payroll=payroll, employee=employee)
-    earnings = []
-    deductions = []
-    basic_salary = None;  tax_relief = None
-
-    tax = {}; ssnit = {}; loans = []; unions = []; other_deductions = []
-
-    for item in payroll_items:
-        pprint(vars(item))
-        item_type = item.item_type
-        entry = item.entry
-        amount = item.amount
-        # retrieve all items with type 'salary item' 
-        if item_type == 'salary_item' and entry == 'debit':
-            earnings.append({'item':item.salary_item.alias_name, 'amount':amount })
-        
-        # for items of type tax, ssnit, loan etc with a credit entry, these are deductions
-        elif item_type == 'tax':
-            tax = {'item':'Income Tax', 'amount':amount }
-        elif item_type == 'employee_ssnit':
-             ssnit = {'item':'SSNIT (Employee)', 'amount':amount}
-        elif item_type == 'loan':
-             loans.append({'item': f"Loan ({ item.loan.get_loan_type_display() })", 'amount':amount})
-        elif item_type == 'credit_union':
-             unions.append({'item':f"{item.credit_union.union_name}", 'amount':amount})
-        elif item_type == 'salary_item' and entry == 'credit':
-             other_deductions.append({'item':item.salary_item.alias_name, 'amount':amount })
-        elif item_type == 'basic_salary':
-             basic_salary = amount
-        elif item_type == 'tax_relief':
-            tax_relief = amount
-    # for
-    
-    # Ensure deduction_list are arranged in this order; tax, ssnit, loan, credit union an
-    deductions.extend(filter(None, [tax, ssnit]))
-    deductions.extend(loans)
-    deductions.extend(unions)
-    deductions.extend(other_deductions)
+    payroll_items = PayrollItem.objects.filter(payroll=payroll, employee=employee).order_by('id').values(*PAYSLIP_ITEM_FIELDS)
+    context = build_payslip_context(payroll, employee, payroll_items)
 
+    return render(request, PAYSLIP_TEMPLATE, context)
 
-    # make the basic salary first item in the earning list
-    if basic_salary is not None:
-        earnings.insert(0, {'item':'Basic Salary', 'amount':basic_salary})
-        
-    # compute for annual salary 
-    annual_salary = (basic_salary * 12) if basic_salary is not None else None
-
-    gross_salary = sum(item['amount'] for item in earnings)
-    total_deductions = sum(item['amount'] for item in deductions)
-    net_salary = gross_salary - total_deductions
-
-
-    context = {
-        'title':f"Staff Payslip",
-        'payroll':payroll,
-        'employee':employee,
-        'earnings':earnings,
-        'deductions':deductions,
-        'gross_salary':gross_salary,
-        'net_salary':net_salary,
-        'annual_salary':annual_salary,
-        'tax_relief':tax_relief,
-        'total_deductions':total_deductions
-    }
+@login_required
+def export_payslips(request, pk):
+    payroll = get_object_or_404(Payroll.objects.completed(), id=pk)
 
-    return render(request, 'core/document/payslip_printout.html', context)
+    response = StreamingHttpResponse(stream_payslip_zip(payroll), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="payslips_{payroll.process_year}_{payroll.process_month}_{payroll.id}.zip"'
+    return response
 
 # Bank 
 
@@ -1292,126 +1102,23 @@ def delete_bank(request, pk):
 
 class PayrollVoucherDetailView(LoginRequiredMixin, DetailView):
     model = Payroll
+    queryset = Payroll.objects.completed()
     template_name = 'hr/payroll/payroll_voucher.html'
     context_object_name = 'payroll'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["title"] = f"{self.get_object()} - Initiate Payment Voucher"
-        payroll= self.get_object()
-        # print(payroll)
-        # get distinct bank and use it 
-        payroll_banks = Bank.objects.filter(employees__payroll_items__payroll=payroll).distinct()
-        
-        bank_totals = []  # Store results for each bank
-        total_vouchers = 0
-        reconcile_status = 0
-        for bank in payroll_banks:
-            # pprint(vars(bank))
-
-            # Filter payroll items related to the current bank
-            payroll_items = PayrollItem.objects.filter(
-                payroll=payroll,
-                employee__bank=bank  # Filter employees in this bank
-            )
-            print(bank.bank_name)
-
-            # Filter out bank total 
-
-            bank_balance = payroll_items.filter(item_type='bank', bank=bank).values('bank').aggregate(total=Sum('amount'))['total'] or 0
-
-            # Get earning salary items total (grouping by salary_item foreign key)
-            earning_salary_items = (
-                payroll_items.filter(item_type='salary_item', entry='debit')
-                .values('salary_item__id', 'salary_item__alias_name')  # Group by salary_item ForeignKey
-                .annotate(total=Sum('amount'))
-            )
-            total_earning_salary_items = sum(si['total'] for si in earning_salary_items)
-
-            deduction_salary_items = (
-                payroll_items.filter(item_type='salary_item', entry='credit')
-                .values('salary_item__id', 'salary_item__alias_name')  # Group by salary_item ForeignKey
-                .annotate(total=Sum('amount'))
-            )
-            total_deduction_salary_items = sum(si['total'] for si in deduction_salary_items)
-
-            # Get credit unions total (grouping by credit_union foreign key)
-            credit_unions = (
-                payroll_items.filter(item_type='credit_union')
-                .values('credit_union__id', 'credit_union__union_name')  # Group by credit_union ForeignKey
-                .annotate(total=Sum('amount'))
-            )
-            total_credit_unions = sum(cu['total'] for cu in credit_unions)
-
-            # Get loans total (grouping by loan type)
-            loans_grouped_by_type = (
-                payroll_items.filter(item_type='loan')
-                .values('loan__id', 'loan__loan_type')  # Group by loan type
-                .annotate(total=Sum('amount'))
-            )          
-            total_loans = sum(l['total'] for l in loans_grouped_by_type)
-            loans = [
-                {
-                    'loan_type': Loan.objects.get(id=item['loan__id'], loan_type=item['loan__loan_type']).get_loan_type_display(),
-                    'total': item['total']
-                }
-                for item in loans_grouped_by_type
-            ]
+        payroll = self.object
+        context["title"] = f"{payroll} - Initiate Payment Voucher"
+        # totals of each bank's voucher, computed in one grouped query (cached once the payroll is posted)
+        bank_totals = get_voucher_totals(payroll)
 
+        total_vouchers = len(bank_totals)
+        reconcile_status = sum(1 for voucher in bank_totals if Decimal(voucher['total_debit']) == Decimal(voucher['total_credit']))
 
-            # print(loans)
-       
-            # Totals for deductions like SSNIT, Tax
-            total_employee_ssnit = payroll_items.filter(item_type='employee_ssnit').aggregate(total=Sum('amount'))['total'] or 0
-            total_employer_ssnit = payroll_items.filter(item_type='employer_ssnit').aggregate(total=Sum('amount'))['total'] or 0
-            total_tax = payroll_items.filter(item_type='tax').aggregate(total=Sum('amount'))['total'] or 0
-            
-            total_tax_relief = payroll_items.filter(item_type='tax_relief').aggregate(total=Sum('amount'))['total'] or 0
-
-            # Totals for basic salary
-            total_basic_salaries = payroll_items.filter(item_type='basic_salary').aggregate(total=Sum('amount'))['total'] or 0
-            
-            total_debit = total_earning_salary_items + total_basic_salaries + total_tax_relief + total_employer_ssnit
-            total_credit = bank_balance + total_deduction_salary_items + total_credit_unions + total_loans + total_employee_ssnit + total_tax + total_employer_ssnit
-
-            # print(total_salary_items)
-
-            # for si in salary_items:
-            #     pprint(si)
-
-            pprint(f"{total_debit} - {total_credit}")
-            if Decimal(total_debit) == Decimal(total_credit):
-                reconcile_status += 1
-
-            # pprint(payroll_items)
-
-            bank_totals.append({
-                'bank_name':bank.bank_name,
-                'bank_balance':bank_balance,
-                'earning_salary_items': list(earning_salary_items),
-                'deduction_salary_items': list(deduction_salary_items),
-                'credit_unions': list(credit_unions),
-                'loans': list(loans),
-                'total_employee_ssnit': total_employee_ssnit,
-                'total_employer_ssnit': total_employer_ssnit,
-                'total_earning_salary_items': total_earning_salary_items,
-                'total_deduction_salary_items': total_deduction_salary_items,
-                'total_loans': total_loans,
-                'total_credit_unions': total_credit_unions,
-                'total_basic_salaries': total_basic_salaries,
-                'total_tax':total_tax,
-                'total_tax_relief':total_tax_relief,
-                'total_debit':total_debit,
-                'total_credit':total_credit
-
-            })
-            total_vouchers += 1
-
-        # pprint(bank_totals)
         context['transactions'] = bank_totals
         context['total_vouchers'] = total_vouchers
         context['reconcile_status'] = reconcile_status
-        print(f"{total_vouchers} {reconcile_status}")
         return context
 
 
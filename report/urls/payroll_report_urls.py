@@ -4,5 +4,7 @@ from ..views.payroll_report_views import *
 
 # Payroll Reports
 urlpatterns = [
-     path('employee-ssnit/', EmployeeSSNITDetailView.as_view(), name='employee-ssnit-report')
+     path('employee-ssnit/', EmployeeSSNITDetailView.as_view(), name='employee-ssnit-report'),
+     path('<int:pk>/credit-union-remittance/', CreditUnionRemittanceView.as_view(), name='credit-union-remittance-report'),
+     path('<int:pk>/credit-union-remittance/export/', export_credit_union_remittance, name='credit-union-remittance-export'),
 ]
@@ -1,9 +1,41 @@
-from django.shortcuts import render
+from django.shortcuts import render, get_object_or_404
+from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.views.generic import DetailView
+from django.http import HttpResponse, StreamingHttpResponse
 from hr.models.payroll import Payroll, PayrollItem
 from hr.models.employee import Employee
+from hr.services.remittances import get_remittances, remittance_xlsx, stream_remittance_csv
 
 # Create your views here.
 class EmployeeSSNITDetailView(LoginRequiredMixin, DetailView):
-    pass 
\ No newline at end of file
+    pass
+
+class CreditUnionRemittanceView(LoginRequiredMixin, DetailView):
+    model = Payroll
+    queryset = Payroll.objects.completed()
+    template_name = 'report/payroll/credit_union_remittance.html'
+    context_object_name = 'payroll'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['title'] = f"{self.object} - Credit Union Remittance"
+        # one grouped query, cached once the payroll is posted
+        context['remittances'] = get_remittances(self.object)
+        return context
+
+@login_required
+def export_credit_union_remittance(request, pk):
+    payroll = get_object_or_404(Payroll.objects.completed(), id=pk)
+    credit_union = request.GET.get('credit_union')
+    remittances = get_remittances(payroll, int(credit_union) if credit_union and credit_union.isdigit() else None)
+    filename = f"remittance_{payroll.process_year}_{payroll.process_month}_{payroll.id}"
+
+    if request.GET.get('format') == 'xlsx':
+        response = HttpResponse(remittance_xlsx(remittances), content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        response['Content-Disposition'] = f'attachment; filename="{filename}.xlsx"'
+        return response
+
+    response = StreamingHttpResponse(stream_remittance_csv(remittances), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
@@ -75,6 +75,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.middleware.QueryInstrumentationMiddleware',
 ]
 
 ROOT_URLCONF = 'revloerp.urls'
@@ -172,6 +173,19 @@ AUTH_USER_MODEL = 'core.CustomUser'
 
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
 
+# Number of worker processes used for CPU bound payroll work (computing large payrolls, rendering payslips)
+PAYROLL_WORKERS = env.int('PAYROLL_WORKERS', default=1)
+# Seconds after which a payroll run still marked running is treated as abandoned (its worker died) and failed
+PAYROLL_RUN_TIMEOUT = env.int('PAYROLL_RUN_TIMEOUT', default=3 * 60 * 60)
+
+# Per-view SQL count/latency instrumentation (core.middleware.QueryInstrumentationMiddleware), off unless enabled
+QUERY_INSTRUMENTATION = env.bool('QUERY_INSTRUMENTATION', default=False)
+# Requests running more queries than this are logged and flagged by the query_report command
+QUERY_BUDGET = env.int('QUERY_BUDGET', default=50)
+# Each process dumps its stats here (at most every QUERY_INSTRUMENTATION_DUMP_INTERVAL seconds) for query_report
+QUERY_INSTRUMENTATION_DIR = env('QUERY_INSTRUMENTATION_DIR', default=os.path.join(BASE_DIR, 'query_stats'))
+QUERY_INSTRUMENTATION_DUMP_INTERVAL = env.int('QUERY_INSTRUMENTATION_DUMP_INTERVAL', default=60)
+
 LOGGING = {
     'version': 1,  # Standard logging config version
     'disable_existing_loggers': False,  # Retain existing loggers